@@ -0,0 +1,89 @@
+"""縣市 → 行政區 → 路名 trie over store addresses.
+
+Every node keeps the number of stores below it, and each road node keeps the
+positions of its stores (whatever the catalog uses to page a row back in:
+``(shard, row)`` for ``ShardedCatalog``, the row id for ``SqliteCatalog``).
+"Stores in this district / on this road" and the per-level counts for the
+drill-down filter are answered from the trie without scanning any shard.
+
+Stores whose address has no district or road sit under an ``""`` child.
+Lookups go through ``normalize_key``, so 臺/台 and stray spaces don't matter.
+"""
+from query_data.normalize import DISTRICT, ROAD, normalize_key
+
+
+def in_district(store, district, road=None):
+    """Whether ``store`` lies in ``district`` (and on ``road``, when given)."""
+    return (normalize_key(store.get(DISTRICT, "")) == normalize_key(district)
+            and (road is None or normalize_key(store.get(ROAD, "")) == normalize_key(road)))
+
+
+class AddressNode:
+    __slots__ = ("name", "count", "children", "positions")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.children = {}          # normalized name -> AddressNode, in catalog order
+        self.positions = []         # road nodes only
+
+    def child(self, name):
+        return self.children.get(normalize_key(name))
+
+    def iter_positions(self):
+        yield from self.positions
+        for node in self.children.values():
+            yield from node.iter_positions()
+
+
+class AddressIndex:
+    def __init__(self):
+        self.root = AddressNode("")
+
+    def add(self, county, district, road, position):
+        node = self.root
+        node.count += 1
+        for name in (county, district, road):
+            key = normalize_key(name)
+            child = node.children.get(key)
+            if child is None:
+                child = node.children[key] = AddressNode(name)
+            child.count += 1
+            node = child
+        node.positions.append(position)
+
+    def add_rows(self, county, rows, position=lambda row_no, row: row_no):
+        """Index one county's rows; ``position(row_no, row)`` is stored for each."""
+        for row_no, row in enumerate(rows):
+            self.add(county, row.get(DISTRICT, ""), row.get(ROAD, ""), position(row_no, row))
+
+    def node(self, *path):
+        """The node at ``(county[, district[, road]])``, or None."""
+        node = self.root
+        for name in path:
+            node = node.child(name)
+            if node is None:
+                return None
+        return node
+
+    def count(self, *path):
+        node = self.node(*path)
+        return node.count if node else 0
+
+    def children(self, *path):
+        """``[(name, count), ...]`` one level below ``path``, in catalog order."""
+        node = self.node(*path)
+        return [(c.name, c.count) for c in node.children.values()] if node else []
+
+    def complete(self, prefix, *path):
+        """Children of ``path`` whose name starts with ``prefix``, for type-ahead."""
+        key = normalize_key(prefix)
+        node = self.node(*path)
+        if node is None:
+            return []
+        return [(c.name, c.count) for k, c in node.children.items() if k.startswith(key)]
+
+    def positions(self, *path):
+        """Positions of every store under ``path``, sorted (catalog order)."""
+        node = self.node(*path)
+        return sorted(node.iter_positions()) if node else []
@@ -0,0 +1,230 @@
+"""Batch mode: resolve many store queries to their WiFi passwords.
+
+Reads JSONL queries from a file or stdin and streams one JSONL result per
+input line, in input order::
+
+    python batch_resolve.py queries.jsonl -o results.jsonl
+    cat queries.jsonl | python batch_resolve.py > results.jsonl
+
+Each input line is a JSON string (a store name, address keyword, or
+``"lat,lng"``) or an object ``{"query": ..., "county": ..., "id": ...}``;
+``{"lat": ..., "lng": ...}`` works too.  Queries are matched the way the V2
+search does (exact name, else keyword search, coordinates → nearest store) and
+the password is derived as in ``confirm_selection()``::
+
+    {"line": 1, "query": "信一", "match": "unique", "matches": 1,
+     "store_id": ..., "store": ..., "county": ..., "address": ..., "phone": ...,
+     "password": "...", "valid": true, "hours": ..., "opens": ..., "closes": ...}
+
+``match`` is ``exact``, ``unique``, ``ambiguous`` (first hit reported, plus
+``alternatives``), ``nearest`` (with ``km``), ``none`` or ``error``.
+
+Input is read in chunks of ``CHUNK_LINES``, so memory stays flat however long
+it is.  Once more than ``--pool-threshold`` lines have been seen, chunks go to
+a process pool (each worker opens its own catalog) with a bounded number in
+flight, and results are still written in input order.
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from catalog import ShardedCatalog, open_catalog
+from catalog_refresh import current_catalog_dir
+from geo import parse_coordinates
+from query_data.store_ids import STORE_ID
+from wifi_apply import derive_password
+
+CHUNK_LINES = 2000
+POOL_THRESHOLD = 20000
+CACHE_SIZE = 4096
+MAX_ALTERNATIVES = 5
+
+_catalog = None
+
+
+def catalog_source(base_dir="."):
+    """``(kind, path)`` of the catalog the app would use: the last download, else query_data."""
+    cached_dir = current_catalog_dir(os.path.join(base_dir, "catalog_cache"))
+    if cached_dir:
+        return "shards", cached_dir
+    return "base", os.path.join(base_dir, "query_data")
+
+
+def init_worker(source):
+    """Open the catalog for this process (also the process-pool initializer)."""
+    global _catalog
+    kind, path = source
+    _catalog = ShardedCatalog(path) if kind == "shards" else open_catalog(path)
+    if isinstance(_catalog, ShardedCatalog):
+        # Bulk lookups touch every county: load all shards once and keep
+        # them resident instead of paging them through an LRU per query.
+        _catalog.max_resident = max(_catalog.max_resident, len(_catalog.counties()))
+        for county in _catalog.counties():
+            _catalog.shard(county)
+    lookup.cache_clear()
+
+
+def valid_passphrase(password):
+    """WPA2 passphrases are 8-63 printable ASCII characters."""
+    return bool(password) and 8 <= len(password) <= 63 and all(" " <= c <= "~" for c in password)
+
+
+def _store_fields(store):
+    password = derive_password(store["電話"])
+    return {
+        "store_id": store[STORE_ID],
+        "store": store["門市名稱"],
+        "county": store["縣市"],
+        "address": store["地址"],
+        "phone": store["電話"],
+        "password": password,
+        "valid": valid_passphrase(password),
+        "hours": store.get("營業時間", "").strip(),
+        "opens": store.get("開始時間", ""),
+        "closes": store.get("結束時間", ""),
+    }
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def lookup(query, county):
+    """Resolve one query against the process's catalog (results are shared; don't mutate)."""
+    point = parse_coordinates(query)
+    if point:
+        hits = _catalog.nearest(*point, k=1, county=county)
+        if not hits:
+            return {"match": "none", "matches": 0}
+        store, km = hits[0]
+        return dict(match="nearest", matches=1, km=round(km, 3), **_store_fields(store))
+
+    store = _catalog.find(query, county)
+    if store and (not county or store["縣市"] == county):
+        return dict(match="exact", matches=1, **_store_fields(store))
+
+    found = _catalog.search(query, county)
+    if not found:
+        return {"match": "none", "matches": 0}
+    result = dict(match="unique" if len(found) == 1 else "ambiguous", matches=len(found),
+                  **_store_fields(found[0]))
+    if len(found) > 1:
+        result["alternatives"] = [s["門市名稱"] for s in found[1:1 + MAX_ALTERNATIVES]]
+    return result
+
+
+def parse_query(text):
+    """``(query, county, id)`` from one input line; raises ValueError."""
+    value = json.loads(text)
+    if isinstance(value, str):
+        return value.strip(), None, None
+    if not isinstance(value, dict):
+        raise ValueError("expected a JSON string or object")
+    query = value.get("query") or value.get("name") or value.get("address")
+    if query is None and "lat" in value and "lng" in value:
+        query = f"{value['lat']},{value['lng']}"
+    if not isinstance(query, str):
+        raise ValueError("object has no query, name, address, or lat/lng")
+    return query.strip(), value.get("county") or None, value.get("id")
+
+
+def resolve_line(line_no, text):
+    record = {"line": line_no}
+    try:
+        query, county, query_id = parse_query(text)
+    except ValueError as e:           # json.JSONDecodeError is a ValueError
+        record.update(match="error", error=str(e))
+        return record
+    if query_id is not None:
+        record["id"] = query_id
+    record["query"] = query
+    if not query:
+        record.update(match="error", error="empty query")
+    else:
+        record.update(lookup(query, county))
+    return record
+
+
+def resolve_chunk(chunk):
+    """Worker entry point: ``[(line no, text), ...]`` → serialized JSONL output."""
+    return "".join(json.dumps(resolve_line(n, text), ensure_ascii=False) + "\n"
+                   for n, text in chunk)
+
+
+def read_chunks(lines, size=CHUNK_LINES):
+    """``[(line no, text), ...]`` lists of at most ``size`` non-blank lines."""
+    numbered = ((n, text) for n, text in enumerate(lines, 1) if text.strip())
+    while True:
+        chunk = list(itertools.islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run(lines, out, source, workers=None, pool_threshold=POOL_THRESHOLD):
+    """Resolve every line of ``lines`` into ``out``; returns the number of results."""
+    workers = workers or os.cpu_count() or 1
+    chunks = read_chunks(lines)
+    # Buffer up to the threshold: short inputs never pay for starting a pool.
+    head = list(itertools.islice(chunks, max(1, pool_threshold // CHUNK_LINES)))
+    total = 0
+    if workers <= 1 or len(head) * CHUNK_LINES < pool_threshold:
+        init_worker(source)
+        for chunk in itertools.chain(head, chunks):
+            out.write(resolve_chunk(chunk))
+            total += len(chunk)
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(source,)) as pool:
+        pending = deque()
+        for chunk in itertools.chain(head, chunks):
+            pending.append((len(chunk), pool.submit(resolve_chunk, chunk)))
+            if len(pending) >= 2 * workers:
+                n, future = pending.popleft()
+                out.write(future.result())
+                total += n
+        while pending:
+            n, future = pending.popleft()
+            out.write(future.result())
+            total += n
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve JSONL store queries to WiFi passwords.")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output (default: stdout)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for large inputs (default: CPU count)")
+    parser.add_argument("--pool-threshold", type=int, default=POOL_THRESHOLD,
+                        help="lines to see before switching to the process pool")
+    parser.add_argument("--data-dir", help="catalog directory (default: last download, else query_data)")
+    args = parser.parse_args(argv)
+
+    source = ("base", args.data_dir) if args.data_dir else catalog_source()
+    src = (io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig") if args.input == "-"
+           else open(args.input, "r", encoding="utf-8-sig"))
+    dst = (io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8", newline="\n") if args.output == "-"
+           else open(args.output, "w", encoding="utf-8", newline="\n"))
+    t0 = time.perf_counter()
+    try:
+        total = run(src, dst, source, args.workers, args.pool_threshold)
+    finally:
+        dst.flush()
+        if args.input != "-":
+            src.close()
+        if args.output != "-":
+            dst.close()
+    elapsed = time.perf_counter() - t0
+    print(f"Resolved {total} queries in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f}/s)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""End-to-end benchmark of the confirm path against the netsh simulator.
+
+Drives ``StoreSearchApp.confirm_selection()`` headlessly (Qt offscreen
+platform) for ``--count`` stores, cycling through the catalog, with
+``netsh_sim.NetshSimulator`` in place of ``netsh``::
+
+    python bench_apply.py --count 2000 --latency 0.002 --fail add=0.01,connect=0.01 --wrong-rate 0.05
+
+Each store is selected, confirmed, and timed until its final status (connected,
+auth_failed, timeout, or error) is on screen. The run then reports
+throughput, the latency distribution, outcome counts, and whether every
+injected failure and wrong key surfaced as an error in the status card.
+``--mode core`` times the same apply → connect → verify sequence without Qt.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from catalog import open_catalog
+from netsh_sim import NetshSimulator
+from tracing import percentile
+from wifi_apply import derive_password
+from wlan import SSID, ConnectionVerifier, NetshBackend
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WRONG_KEY = "00000000"
+# Failures of these commands must end in an error on the status card; failed
+# deletes and status polls are tolerated by the apply path.
+CRITICAL_COMMANDS = ("add", "connect")
+
+
+def parse_failures(text):
+    """``"add=0.01,connect=0.02"`` → ``{"add": 0.01, "connect": 0.02}``."""
+    failures = {}
+    for part in filter(None, (text or "").split(",")):
+        command, _, rate = part.partition("=")
+        failures[command.strip()] = float(rate)
+    return failures
+
+
+class Scenario:
+    """Decides, per store, which key the simulated access point accepts."""
+
+    def __init__(self, wrong_rate, rng):
+        self.wrong_rate = wrong_rate
+        self.rng = rng
+        self.expected = None
+
+    def next_store(self, store):
+        """Return True when confirming ``store`` must end in an error."""
+        self.expected = derive_password(store["電話"])
+        wrong = self.rng.random() < self.wrong_rate
+        if wrong:
+            self.expected = WRONG_KEY
+        # Phones that yield no key (extensions, stray spaces) cannot connect either.
+        return wrong or derive_password(store["電話"]) is None
+
+    def password_for(self, ssid):
+        return self.expected
+
+
+def summarize(latencies, outcomes, mismatches, sim, wall):
+    ordered = sorted(latencies)
+    per_command = {}
+    for inv in sim.invocations:
+        entry = per_command.setdefault(inv.args[2], {"calls": 0, "failed": 0, "seconds": 0.0})
+        entry["calls"] += 1
+        entry["failed"] += bool(inv.returncode)
+        entry["seconds"] += inv.seconds
+    return {
+        "stores": len(latencies),
+        "wall_seconds": wall,
+        "stores_per_second": len(latencies) / wall if wall else 0.0,
+        "latency_ms": {
+            "p50": percentile(ordered, 50) * 1e3,
+            "p90": percentile(ordered, 90) * 1e3,
+            "p99": percentile(ordered, 99) * 1e3,
+            "max": (ordered[-1] if ordered else 0.0) * 1e3,
+            "mean": (sum(ordered) / len(ordered) if ordered else 0.0) * 1e3,
+        },
+        "outcomes": outcomes,
+        "injected_failures": sim.injected,
+        "status_mismatches": mismatches,
+        "netsh": per_command,
+    }
+
+
+def print_report(report):
+    lat = report["latency_ms"]
+    print(f"{report['stores']} stores in {report['wall_seconds']:.2f}s "
+          f"({report['stores_per_second']:.1f}/s)")
+    print(f"latency ms: p50 {lat['p50']:.1f}  p90 {lat['p90']:.1f}  p99 {lat['p99']:.1f}  "
+          f"max {lat['max']:.1f}  mean {lat['mean']:.1f}")
+    print("outcomes: " + ", ".join(f"{k} {v}" for k, v in sorted(report["outcomes"].items())))
+    print("injected: " + (", ".join(f"{k} {v}" for k, v in report["injected_failures"].items()) or "none"))
+    for command, entry in sorted(report["netsh"].items()):
+        print(f"  netsh {command:<8} {entry['calls']:>6} calls  {entry['failed']:>5} failed  "
+              f"{entry['seconds'] / entry['calls'] * 1e3:6.2f} ms avg")
+    print(f"status mismatches: {len(report['status_mismatches'])}")
+    for m in report["status_mismatches"][:10]:
+        print(f"  {m}")
+
+
+def critical_failures(sim):
+    return sum(sim.injected.get(c, 0) for c in CRITICAL_COMMANDS)
+
+
+def expected_outcome(wrong, injected_before, sim):
+    """What the status card should end in: 'success' or 'error'."""
+    if wrong or critical_failures(sim) > injected_before:
+        return "error"
+    return "success"
+
+
+# ---------------------------------------------------------------------------
+# Drivers
+# ---------------------------------------------------------------------------
+
+def run_core(stores, sim, scenario, poll):
+    backend = NetshBackend(run=sim)
+    verifier = ConnectionVerifier(backend, initial_delay=poll, max_delay=poll * 4)
+    latencies, outcomes, mismatches = [], {}, []
+    for store in stores:
+        wrong = scenario.next_store(store)
+        injected = critical_failures(sim)
+        t0 = time.perf_counter()
+        try:
+            backend.apply_profile(SSID, derive_password(store["電話"]))
+            backend.connect(SSID)
+            status = verifier.verify(SSID, 8.0).status
+        except Exception:
+            status = "error"
+        latencies.append(time.perf_counter() - t0)
+        outcomes[status] = outcomes.get(status, 0) + 1
+        got = "success" if status == "connected" else "error"
+        want = expected_outcome(wrong, injected, sim)
+        if got != want:
+            mismatches.append(f"{store['門市名稱']}: expected {want}, got {status}")
+    return latencies, outcomes, mismatches
+
+
+def run_gui(stores, sim, scenario, poll, workdir):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QEventLoop
+    from PyQt5.QtWidgets import QApplication
+
+    # The app reads query_data/ and writes its json files relative to the cwd.
+    os.makedirs(os.path.join(workdir, "query_data"), exist_ok=True)
+    shutil.copytree(os.path.join(HERE, "query_data", "shards"),
+                    os.path.join(workdir, "query_data", "shards"), dirs_exist_ok=True)
+    with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump({"preference": []}, f)
+    os.chdir(workdir)
+    import get_louisa_v2
+
+    app = QApplication.instance() or QApplication([])
+    window = get_louisa_v2.StoreSearchApp()
+    window.wlan = NetshBackend(run=sim)
+    window.verifier = ConnectionVerifier(window.wlan, initial_delay=poll, max_delay=poll * 4)
+    window.show()
+
+    finished = []
+    window.apply_bridge.verified.connect(lambda store, password, result: finished.append(result.status))
+
+    latencies, outcomes, mismatches = [], {}, []
+    for store in stores:
+        wrong = scenario.next_store(store)
+        injected = critical_failures(sim)
+        window._fill_dropdown([store])
+        window.dropdown.setCurrentIndex(0)
+        finished.clear()
+        t0 = time.perf_counter()
+        window.confirm_selection()
+        if not window.confirm_btn.isEnabled():
+            # Verification runs on a worker thread; wait for its result.
+            while not finished:
+                app.processEvents(QEventLoop.AllEvents, 5)
+        app.processEvents()                 # flush the batched status render
+        latencies.append(time.perf_counter() - t0)
+        status = finished[0] if finished else "error"
+        outcomes[status] = outcomes.get(status, 0) + 1
+        got = window.status_label.property("state") or ""
+        want = expected_outcome(wrong, injected, sim)
+        if got != want:
+            mismatches.append(f"{store['門市名稱']}: expected {want}, status card "
+                              f"{got!r} ({window.status_label.text()})")
+    window.close()
+    return latencies, outcomes, mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the confirm path against a simulated netsh.")
+    parser.add_argument("--count", type=int, default=1000, help="stores to confirm (cycles the catalog)")
+    parser.add_argument("--mode", choices=("gui", "core"), default="gui")
+    parser.add_argument("--latency", type=float, default=0.002, help="seconds per netsh call")
+    parser.add_argument("--jitter", type=float, default=0.001, help="extra random seconds per call")
+    parser.add_argument("--fail", default="", metavar="CMD=RATE,...",
+                        help="failure probability per netsh command, e.g. add=0.01,connect=0.01")
+    parser.add_argument("--wrong-rate", type=float, default=0.0,
+                        help="share of stores whose access point rejects the derived key")
+    parser.add_argument("--connect-seconds", type=float, default=0.03,
+                        help="simulated time from connect to associated")
+    parser.add_argument("--poll", type=float, default=0.005, help="verifier's initial poll interval")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    catalog = open_catalog(os.path.join(HERE, "query_data"))
+    pool = list(catalog.iter_stores())
+    stores = [pool[i % len(pool)] for i in range(args.count)]
+
+    rng = random.Random(args.seed)
+    scenario = Scenario(args.wrong_rate, rng)
+    sim = NetshSimulator(
+        password_for=scenario.password_for, latency=args.latency, jitter=args.jitter,
+        failures=parse_failures(args.fail), connect_seconds=args.connect_seconds,
+        auth_seconds=min(0.01, args.connect_seconds / 2), seed=args.seed,
+    )
+
+    t0 = time.perf_counter()
+    if args.mode == "core":
+        latencies, outcomes, mismatches = run_core(stores, sim, scenario, args.poll)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            cwd = os.getcwd()
+            try:
+                latencies, outcomes, mismatches = run_gui(stores, sim, scenario, args.poll, workdir)
+            finally:
+                os.chdir(cwd)
+    report = summarize(latencies, outcomes, mismatches, sim, time.perf_counter() - t0)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
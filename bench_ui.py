@@ -0,0 +1,342 @@
+"""Headless latency harness for the V2 window.
+
+Runs ``StoreSearchApp`` under Qt's offscreen platform (with the app's style
+sheet) and replays a script of interactions into its widgets as real key and
+mouse events.  Each interaction is timed from the injected event to the last
+repaint it caused, so dropdown repopulation, ``polish`` calls and status card
+layout are all in the number::
+
+    python bench_ui.py --rounds 50 --json ui_report.json
+    python bench_ui.py --script typing.jsonl --repeat 5 --budget-ms 30
+    python bench_ui.py --record typing.jsonl        # record a script by hand
+
+A script is JSONL, one interaction per line::
+
+    {"action": "type", "text": "信"}           typed into the search field (ASCII as key
+                                               presses, anything else as an IME commit)
+    {"action": "key", "key": "Backspace"}      one key (Qt key name without Key_)
+    {"action": "clear"}                        Ctrl+A, Backspace in the search field
+    {"action": "carousel", "direction": 1}     click ▶ (1) or ◀ (-1)
+    {"action": "star"}                         click ☆ on the selected store
+    {"action": "county", "county": "台北市"}    pick a county ("" for all)
+
+Without ``--script`` a script is generated from the catalog: pick a county,
+type part of a store name, star it, move through the favorites, type part of
+a WiFi key, clear.  The report gives p50 / p95 / p99 of the event-to-repaint
+latency per action and overall, plus the time spent in the input handler,
+the batched ``UiState`` renders and painting.  With ``--budget-ms`` the exit
+status is 1 when the overall p95 exceeds it.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from catalog import open_catalog
+from tracing import percentile
+from wifi_apply import derive_password
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAVORITES = 5
+SETTLE_TURNS = 2            # idle event-loop turns before an interaction counts as done
+MAX_SETTLE_SECONDS = 5.0
+
+
+# ---------------------------------------------------------------------------
+# Scripts
+# ---------------------------------------------------------------------------
+
+def read_script(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_script(path, steps):
+    with open(path, "w", encoding="utf-8") as f:
+        for step in steps:
+            f.write(json.dumps(step, ensure_ascii=False) + "\n")
+
+
+def generate_script(stores, rounds, rng):
+    steps = []
+    for n in range(rounds):
+        store = rng.choice(stores)
+        steps.append({"action": "county", "county": store["縣市"] if n % 4 else ""})
+        name = store["門市名稱"]
+        steps += [{"action": "type", "text": c} for c in name[:rng.randint(2, min(4, len(name)))]]
+        steps.append({"action": "star"})
+        steps += [{"action": "carousel", "direction": d} for d in (1, 1, -1)]
+        steps.append({"action": "clear"})
+        password = derive_password(rng.choice(stores)["電話"]) or ""
+        steps += [{"action": "type", "text": c} for c in password[:4]]
+        steps += [{"action": "key", "key": "Backspace"}] * 2
+        steps.append({"action": "clear"})
+    return steps
+
+
+def prepare_workdir(workdir, favorites):
+    """The app reads query_data/ and writes its json files relative to the cwd."""
+    os.makedirs(os.path.join(workdir, "query_data"), exist_ok=True)
+    shutil.copytree(os.path.join(HERE, "query_data", "shards"),
+                    os.path.join(workdir, "query_data", "shards"), dirs_exist_ok=True)
+    with open(os.path.join(workdir, "settings.json"), "w", encoding="utf-8") as f:
+        json.dump({"preference": [
+            {"id": s["門市編號"], "name": s["門市名稱"], "county": s["縣市"]} for s in favorites
+        ]}, f, ensure_ascii=False)
+
+
+# ---------------------------------------------------------------------------
+# Replay
+# ---------------------------------------------------------------------------
+
+def make_probe_app():
+    """A QApplication that records when each paint event finished."""
+    from PyQt5.QtCore import QEvent
+    from PyQt5.QtWidgets import QApplication
+
+    class ProbeApplication(QApplication):
+        def __init__(self, argv):
+            super().__init__(argv)
+            self.paints = 0
+            self.last_paint = 0.0
+
+        def notify(self, receiver, event):
+            painting = event.type() == QEvent.Paint     # read before dispatch may delete it
+            try:
+                return super().notify(receiver, event)
+            finally:
+                if painting:
+                    self.paints += 1
+                    self.last_paint = time.perf_counter()
+
+    return ProbeApplication([])
+
+
+class Replayer:
+    def __init__(self, app, window):
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtTest import QTest
+
+        self.app = app
+        self.window = window
+        self.Qt = Qt
+        self.QTest = QTest
+        self.last_flush = 0.0
+        flush = window.state.flush
+
+        def timed_flush():
+            flush()
+            self.last_flush = time.perf_counter()
+        window.state.flush = timed_flush
+
+    def inject(self, step):
+        Qt, QTest, w = self.Qt, self.QTest, self.window
+        action = step["action"]
+        if action == "type":
+            self.type_text(step["text"])
+        elif action == "key":
+            QTest.keyClick(w.search_field, getattr(Qt, "Key_" + step["key"]))
+        elif action == "clear":
+            QTest.keyClick(w.search_field, Qt.Key_A, Qt.ControlModifier)
+            QTest.keyClick(w.search_field, Qt.Key_Backspace)
+        elif action == "carousel":
+            QTest.mouseClick(w.right_button if step.get("direction", 1) > 0 else w.left_button,
+                             Qt.LeftButton)
+        elif action == "star":
+            QTest.mouseClick(w.favorite_button, Qt.LeftButton)
+        elif action == "county":
+            w.county_filter.setCurrentIndex(max(w.county_filter.findData(step["county"] or None), 0))
+        else:
+            raise ValueError(f"unknown action: {action}")
+
+    def type_text(self, text):
+        from PyQt5.QtGui import QInputMethodEvent
+
+        # QTest only synthesizes Latin-1 keys; CJK text arrives from an input
+        # method as a commit string anyway.
+        for ascii_run, chars in itertools.groupby(text, str.isascii):
+            chars = "".join(chars)
+            if ascii_run:
+                self.QTest.keyClicks(self.window.search_field, chars)
+            else:
+                event = QInputMethodEvent()
+                event.setCommitString(chars)
+                self.app.sendEvent(self.window.search_field, event)
+
+    def settle(self):
+        """Run the event loop until the state is flushed and nothing repaints any more."""
+        deadline = time.perf_counter() + MAX_SETTLE_SECONDS
+        idle = 0
+        while idle < SETTLE_TURNS and time.perf_counter() < deadline:
+            paints = self.app.paints
+            self.app.processEvents()
+            if self.window.state.pending() or self.app.paints != paints:
+                idle = 0
+            else:
+                idle += 1
+
+    def run(self, steps):
+        samples = []
+        self.settle()
+        for step in steps:
+            renders = dict(self.window.state.renders)
+            paints = self.app.paints
+            self.last_flush = self.app.last_paint = 0.0
+            t0 = time.perf_counter()
+            self.inject(step)
+            t_input = time.perf_counter()
+            self.settle()
+            end = max(self.app.last_paint, self.last_flush, t_input)
+            samples.append({
+                "action": step["action"],
+                "latency": end - t0,
+                "input": t_input - t0,
+                "render": max(self.last_flush - t_input, 0.0),
+                "paint": max(self.app.last_paint - max(self.last_flush, t_input), 0.0),
+                "paints": self.app.paints - paints,
+                "renders": sum(self.window.state.renders.values()) - sum(renders.values()),
+            })
+        return samples
+
+
+# ---------------------------------------------------------------------------
+# Report
+# ---------------------------------------------------------------------------
+
+def _stats(samples):
+    ordered = sorted(s["latency"] for s in samples)
+    n = len(samples) or 1
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(ordered, 50) * 1e3,
+        "p95_ms": percentile(ordered, 95) * 1e3,
+        "p99_ms": percentile(ordered, 99) * 1e3,
+        "max_ms": (ordered[-1] if ordered else 0.0) * 1e3,
+        "input_ms": sum(s["input"] for s in samples) / n * 1e3,
+        "render_ms": sum(s["render"] for s in samples) / n * 1e3,
+        "paint_ms": sum(s["paint"] for s in samples) / n * 1e3,
+        "paints": sum(s["paints"] for s in samples) / n,
+        "renders": sum(s["renders"] for s in samples) / n,
+    }
+
+
+def summarize(samples, wall):
+    actions = {}
+    for s in samples:
+        actions.setdefault(s["action"], []).append(s)
+    return {
+        "interactions": len(samples),
+        "wall_seconds": wall,
+        "overall": _stats(samples),
+        "actions": {name: _stats(group) for name, group in sorted(actions.items())},
+    }
+
+
+def print_report(report):
+    print(f"{report['interactions']} interactions in {report['wall_seconds']:.2f}s")
+    print(f"{'action':<10}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+          f"{'input':>8}{'render':>8}{'paint':>8}{'paints':>8}")
+    rows = list(report["actions"].items()) + [("overall", report["overall"])]
+    for name, st in rows:
+        print(f"{name:<10}{st['count']:>7}{st['p50_ms']:>9.2f}{st['p95_ms']:>9.2f}{st['p99_ms']:>9.2f}"
+              f"{st['max_ms']:>9.2f}{st['input_ms']:>8.2f}{st['render_ms']:>8.2f}{st['paint_ms']:>8.2f}"
+              f"{st['paints']:>8.1f}")
+
+
+# ---------------------------------------------------------------------------
+# Recording
+# ---------------------------------------------------------------------------
+
+def record(window):
+    """Start logging the user's interactions with ``window``; returns the (growing) script."""
+    steps = []
+    last = [window.search_field.text()]
+
+    def edited(text):
+        old, last[0] = last[0], text
+        if text.startswith(old):
+            steps.append({"action": "type", "text": text[len(old):]})
+        elif old.startswith(text) and len(old) - len(text) == 1:
+            steps.append({"action": "key", "key": "Backspace"})
+        else:
+            steps.append({"action": "clear"})
+            if text:
+                steps.append({"action": "type", "text": text})
+
+    def follow(_=None):
+        last[0] = window.search_field.text()     # the carousel also sets the text
+
+    window.search_field.textEdited.connect(edited)
+    window.search_field.textChanged.connect(follow)
+    window.left_button.clicked.connect(lambda: steps.append({"action": "carousel", "direction": -1}))
+    window.right_button.clicked.connect(lambda: steps.append({"action": "carousel", "direction": 1}))
+    window.favorite_button.clicked.connect(lambda: steps.append({"action": "star"}))
+    window.county_filter.activated.connect(
+        lambda i: steps.append({"action": "county", "county": window.county_filter.itemData(i) or ""}))
+    return steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay interactions into the V2 window and time repaints.")
+    parser.add_argument("--script", help="JSONL interactions to replay (default: generated)")
+    parser.add_argument("--rounds", type=int, default=20, help="rounds in the generated script")
+    parser.add_argument("--repeat", type=int, default=1, help="replay the script this many times")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save-script", metavar="PATH", help="also write the replayed script")
+    parser.add_argument("--record", metavar="PATH",
+                        help="open a real window and record a script instead of replaying")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("--budget-ms", type=float, help="exit 1 when the overall p95 exceeds this")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        args.record = os.path.abspath(args.record)    # the window runs in a temp dir
+    else:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    rng = random.Random(args.seed)
+    stores = list(open_catalog(os.path.join(HERE, "query_data")).iter_stores())
+    steps = read_script(args.script) if args.script else generate_script(stores, args.rounds, rng)
+    if args.save_script:
+        write_script(args.save_script, steps)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir, rng.sample(stores, min(FAVORITES, len(stores))))
+        os.chdir(workdir)
+        try:
+            app = make_probe_app()
+            import get_louisa_v2
+            app.setStyleSheet(get_louisa_v2.APP_QSS)
+            window = get_louisa_v2.StoreSearchApp()
+            if args.record:
+                steps = record(window)
+                window.show()
+                app.exec_()
+                write_script(args.record, steps)
+                print(f"Recorded {len(steps)} interactions to {args.record}")
+                return 0
+            window.show()
+            t0 = time.perf_counter()
+            samples = Replayer(app, window).run(steps * max(1, args.repeat))
+            report = summarize(samples, time.perf_counter() - t0)
+            window.close()
+        finally:
+            os.chdir(cwd)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.budget_ms is not None and report["overall"]["p95_ms"] > args.budget_ms:
+        print(f"p95 {report['overall']['p95_ms']:.2f} ms is over the {args.budget_ms} ms budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Learned BSSID → store index for automatic store detection.
+
+Every store broadcasts the same SSID, but each access point has its own
+BSSID.  When a password is applied successfully, the BSSIDs visible at that
+moment are recorded against the store; on a later launch the visible BSSIDs
+are scored against this index and the best store is preselected.
+
+The index lives in ``bssid_index.json`` next to ``settings.json``::
+
+    {"bssids": {"aa:bb:...": {"<門市編號>": <times seen>}},
+     "stores": {"<門市編號>": {"id": ..., "name": ..., "county": ...}}}
+
+Files written before stores had IDs (keyed by ``delta.store_key``) are
+re-keyed by ``migrate``.
+"""
+import json
+import os
+import threading
+
+from query_data.store_ids import STORE_ID
+
+MIN_SCORE = 0.5
+
+
+class BssidIndex:
+    def __init__(self, path):
+        self.path = path
+        self.bssids = {}
+        self.stores = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.bssids = data.get("bssids", {})
+        self.stores = data.get("stores", {})
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"bssids": self.bssids, "stores": self.stores}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def learn(self, store, networks):
+        """Record that ``networks`` were visible when ``store``'s password worked."""
+        if not networks:
+            return
+        key = str(store[STORE_ID])
+        with self._lock:
+            self.stores[key] = {"id": store[STORE_ID], "name": store["門市名稱"], "county": store["縣市"]}
+            for n in networks:
+                seen = self.bssids.setdefault(n["bssid"], {})
+                seen[key] = seen.get(key, 0) + 1
+            self.save()
+
+    def migrate(self, catalog):
+        """Re-key entries learned before stores had IDs; unknown stores are dropped."""
+        with self._lock:
+            legacy = [key for key, info in self.stores.items() if "id" not in info]
+            if not legacy:
+                return
+            for old in legacy:
+                info = self.stores.pop(old)
+                store = catalog.find(info["name"], info.get("county"))
+                new = str(store[STORE_ID]) if store else None
+                if store:
+                    self.stores[new] = {"id": store[STORE_ID], "name": store["門市名稱"],
+                                        "county": store["縣市"]}
+                for seen in self.bssids.values():
+                    times = seen.pop(old, 0)
+                    if times and new:
+                        seen[new] = seen.get(new, 0) + times
+            self.save()
+
+    def match(self, networks):
+        """Best ``(store info, score)`` for the visible ``networks``, or None.
+
+        Each visible BSSID votes for the stores it was seen at, split by how
+        often it was seen at each and weighted by signal strength; the score
+        is the winner's share of all votes cast by known BSSIDs.
+        """
+        votes = {}
+        total = 0.0
+        with self._lock:
+            for n in networks:
+                seen = self.bssids.get(n["bssid"])
+                if not seen:
+                    continue
+                weight = max(n.get("signal", 0), 1) / 100.0
+                count = sum(seen.values())
+                for key, times in seen.items():
+                    votes[key] = votes.get(key, 0.0) + weight * times / count
+                total += weight
+            if not votes:
+                return None
+            key, best = max(votes.items(), key=lambda kv: kv[1])
+            score = best / total
+            if score < MIN_SCORE or key not in self.stores:
+                return None
+            return dict(self.stores[key], key=key), score
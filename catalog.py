@@ -0,0 +1,305 @@
+"""Store catalog with lazily loaded per-county shards.
+
+Only ``manifest.json`` is read at startup; a county's shard is loaded the
+first time a county filter or a search needs it, and the least recently used
+shards are evicted once more than ``max_resident`` are held in memory.
+Unscoped scans (a search without a county, ``iter_stores()``, building the
+coordinate index) stream the shards that aren't resident instead of paging
+them in, so one such scan doesn't evict the counties the user is working in.
+
+Nearest-store queries go through a ``geo.CoordinateIndex`` built once per
+catalog; it only stores packed coordinates and (shard, row) positions, so the
+matching rows are paged back in on demand like any other lookup.  District
+and road drill-down uses an ``address_index.AddressIndex`` that is filled in
+one county at a time, the first time that county is drilled into.  Phone and
+WiFi-key searches go through a ``digit_index.DigitIndex`` per county, built
+the same way.
+
+The LRU and the lazily built indexes are guarded by one lock, so the GUI and
+the resident command thread can share a catalog.
+"""
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from address_index import AddressIndex, in_district
+from catalog_sqlite import SqliteCatalog
+from digit_index import DigitIndex, rank_matches
+from geo import CoordinateIndex, parse_coordinates
+from query_data import shards, sqlite_store
+from query_data.normalize import (ADDRESS_KEY, DISTRICT, NAME_KEY, add_search_keys, digit_query,
+                                  normalize_key)
+from query_data.store_ids import STORE_ID, StoreIdAssigner
+
+DEFAULT_MAX_RESIDENT = 8
+NEAREST_RESULTS = 20
+
+
+class ShardedCatalog:
+    def __init__(self, shard_dir, max_resident=DEFAULT_MAX_RESIDENT):
+        self.shard_dir = shard_dir
+        self.manifest = shards.read_manifest(shard_dir)
+        self._entries = OrderedDict((e["county"], e) for e in self.manifest["shards"])
+        self.max_resident = max(1, max_resident)
+        self._resident = OrderedDict()      # county -> list[dict], in LRU order
+        self._pinned = {}                   # county -> list[dict], never evicted
+        self._geo = None
+        self._address = AddressIndex()
+        self._indexed = set()               # counties already in _address
+        self._ids = {}                      # county -> {門市編號: row number}
+        self._digits = {}                   # county -> DigitIndex
+        self._lock = threading.RLock()      # LRU and lazy indexes
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a fully resident catalog from flat rows (legacy ``data.csv``)."""
+        self = cls.__new__(cls)
+        self.shard_dir = None
+        self.max_resident = 0
+        self._pinned = {}
+        for row in _with_search_keys(rows):
+            self._pinned.setdefault(row["縣市"], []).append(row)
+        self._entries = OrderedDict(
+            (county, {"county": county, "count": len(r)}) for county, r in self._pinned.items()
+        )
+        self.manifest = {"total": len(rows), "shards": list(self._entries.values())}
+        self._resident = OrderedDict()
+        self._geo = None
+        self._address = AddressIndex()
+        self._indexed = set()               # counties already in _address
+        self._ids = {}                      # county -> {門市編號: row number}
+        self._digits = {}                   # county -> DigitIndex
+        self._lock = threading.RLock()      # LRU and lazy indexes
+        return self
+
+    # -----------------------------------------------------------------------
+    # Shard paging
+    # -----------------------------------------------------------------------
+
+    def counties(self):
+        return list(self._entries)
+
+    def count(self, county=None):
+        if county is None:
+            return self.manifest["total"]
+        entry = self._entries.get(county)
+        return entry["count"] if entry else 0
+
+    def resident_counties(self):
+        with self._lock:
+            return list(self._pinned) + list(self._resident)
+
+    def resident_shards(self):
+        """Snapshot of the loaded shards (county -> rows); rows are never mutated."""
+        with self._lock:
+            return {**self._pinned, **self._resident}
+
+    def adopt(self, county, rows):
+        """Seed an already loaded shard, e.g. one carried over from an older catalog."""
+        with self._lock:
+            if county in self._entries and county not in self._pinned:
+                self._resident[county] = rows
+                while len(self._resident) > self.max_resident:
+                    self._resident.popitem(last=False)
+
+    def shard(self, county):
+        """Return the rows of ``county``, loading the shard if necessary."""
+        if county in self._pinned:
+            return self._pinned[county]
+        with self._lock:
+            rows = self._resident.get(county)
+            if rows is not None:
+                self._resident.move_to_end(county)
+                return rows
+            entry = self._entries.get(county)
+            if entry is None:
+                return []
+            rows = _with_search_keys(shards.read_shard(self.shard_dir, entry))
+            self._resident[county] = rows
+            while len(self._resident) > self.max_resident:
+                self._resident.popitem(last=False)
+            return rows
+
+    def _stream(self, county):
+        """Rows of ``county`` for a one-off scan; a shard that isn't resident stays that way."""
+        if county in self._pinned:
+            return self._pinned[county]
+        with self._lock:
+            rows = self._resident.get(county)
+        if rows is not None:
+            return rows
+        entry = self._entries.get(county)
+        if entry is None:
+            return []
+        return _with_search_keys(shards.read_shard(self.shard_dir, entry))
+
+    def iter_stores(self, county=None):
+        if county:
+            yield from self.shard(county)
+            return
+        for c in self._search_order():
+            yield from self._stream(c)
+
+    def _search_order(self):
+        # Scan resident shards first so a hit is found without paging anything in.
+        resident = set(self.resident_counties())
+        return ([c for c in self._entries if c in resident]
+                + [c for c in self._entries if c not in resident])
+
+    # -----------------------------------------------------------------------
+    # Queries
+    # -----------------------------------------------------------------------
+
+    def search(self, text, county=None, district=None, road=None):
+        """Stores whose name or address key contains the normalized ``text``.
+
+        A digit run (``"2511 2613"``) also matches stores whose phone number
+        or WiFi key contains it; all hits are ranked by ``rank_matches``.
+        ``district`` / ``road`` (with ``county``) narrow the candidates through
+        the address index.  A ``"lat,lng"`` query returns the nearest stores
+        instead, closest first.
+        """
+        point = parse_coordinates(text)
+        if point:
+            k = None if district is not None else NEAREST_RESULTS
+            hits = [s for s, _ in self.nearest(*point, k=k, county=county)]
+            if district is not None:
+                hits = [s for s in hits if in_district(s, district, road)][:NEAREST_RESULTS]
+            return hits
+        key = normalize_key(text)
+        digits = digit_query(text)
+
+        def scan(c, rows, candidates):
+            # The digit index is built from the shard this pass already holds.
+            phone_hits = self.digit_index(c, rows).lookup(digits) if digits else ()
+            return [s for s in candidates
+                    if not key or key in s[NAME_KEY] or key in s[ADDRESS_KEY]
+                    or s[STORE_ID] in phone_hits]
+
+        if county and district is not None:
+            rows = self.shard(county)
+            found = scan(county, rows, self.stores_at(county, district, road))
+        else:
+            # Resident shards are scanned first (see _search_order), but the
+            # hits are returned in catalog order.
+            by_county = {}
+            for c in ([county] if county else self._search_order()):
+                rows = self.shard(c) if county else self._stream(c)
+                by_county[c] = scan(c, rows, rows)
+            found = [s for c in self._entries if c in by_county for s in by_county[c]]
+        return rank_matches(found, key, digits)
+
+    def find(self, name, county=None):
+        """Look up a store by its exact name, preferring ``county`` when known."""
+        if county:
+            match = next((s for s in self.shard(county) if s["門市名稱"] == name), None)
+            if match:
+                return match
+        return next((s for s in self.iter_stores() if s["門市名稱"] == name), None)
+
+    def get(self, store_id, county=None):
+        """The store with ``門市編號`` ``store_id``, trying ``county``'s shard first."""
+        counties = self._search_order()
+        if county in self._entries:
+            counties = [county] + [c for c in counties if c != county]
+        for c in counties:
+            row_no = self._id_map(c).get(store_id)
+            if row_no is not None:
+                return self.shard(c)[row_no]
+        return None
+
+    def _id_map(self, county):
+        with self._lock:
+            ids = self._ids.get(county)
+            if ids is None:
+                ids = self._ids[county] = {row[STORE_ID]: i
+                                           for i, row in enumerate(self._stream(county))}
+            return ids
+
+    def digit_index(self, county, rows=None):
+        """Phone-digit suffix index of ``county``, built once (from ``rows`` when given)."""
+        with self._lock:
+            index = self._digits.get(county)
+            if index is None:
+                index = self._digits[county] = DigitIndex(self._stream(county) if rows is None else rows)
+            return index
+
+    def address_index(self, county):
+        """The address trie, with ``county`` indexed (its shard is read once, here)."""
+        with self._lock:
+            if county not in self._indexed and county in self._entries:
+                shard_no = list(self._entries).index(county)
+                self._address.add_rows(county, self.shard(county),
+                                       lambda row_no, row: (shard_no, row_no))
+                self._indexed.add(county)
+            return self._address
+
+    def stores_at(self, county, district=None, road=None):
+        """Stores in ``county`` / its ``district`` / on ``road``, in catalog order."""
+        path = [county] + [p for p in (district, road) if p is not None]
+        with self._lock:
+            positions = self.address_index(county).positions(*path)
+        return [self.resolve(p) for p in positions]
+
+    def geo_index(self):
+        with self._lock:
+            if self._geo is None:
+                self._geo = CoordinateIndex.from_shards(
+                    (i, self._stream(c)) for i, c in enumerate(self._entries)
+                )
+            return self._geo
+
+    def resolve(self, position):
+        """Row at a ``(shard number, row number)`` position of ``geo_index()``."""
+        shard_no, row_no = position
+        return self.shard(list(self._entries)[shard_no])[row_no]
+
+    def nearest(self, lat, lng, k=10, radius_km=None, county=None):
+        """``[(store, km), ...]`` nearest first, optionally within ``radius_km``/``county``."""
+        hits = self.geo_index().nearest(lat, lng, k=None if county else k, radius_km=radius_km)
+        results = []
+        for position, km in hits:
+            store = self.resolve(position)
+            if county and store["縣市"] != county:
+                continue
+            results.append((store, km))
+            if k and len(results) >= k:
+                break
+        return results
+
+    def distances_from(self, points):
+        """Batch audit: distance matrix (one row per point) plus the store at each column."""
+        index = self.geo_index()
+        return index.distances_many(points), [
+            (index.shard[i], index.row[i]) for i in range(len(index))
+        ]
+
+
+def _with_search_keys(rows):
+    # Catalogs published before the key / address-part / ID columns existed
+    # get them computed here.
+    if rows and (NAME_KEY not in rows[0] or DISTRICT not in rows[0]):
+        for row in rows:
+            add_search_keys(row)
+    if rows and not rows[0].get(STORE_ID):
+        ids = StoreIdAssigner()
+        for row in rows:
+            ids.assign(row)
+    for row in rows:
+        row[STORE_ID] = int(row[STORE_ID])
+    return rows
+
+
+def open_catalog(base_dir, max_resident=DEFAULT_MAX_RESIDENT):
+    """Open ``base_dir/catalog.sqlite`` or ``base_dir/shards``, else ``data.csv``."""
+    db_path = os.path.join(base_dir, sqlite_store.DB_NAME)
+    if os.path.exists(db_path):
+        try:
+            return SqliteCatalog(db_path)
+        except sqlite3.Error as e:
+            print(f"Ignoring {db_path}: {e}")
+    shard_dir = os.path.join(base_dir, "shards")
+    if os.path.exists(os.path.join(shard_dir, shards.MANIFEST_NAME)):
+        return ShardedCatalog(shard_dir, max_resident)
+    return ShardedCatalog.from_rows(shards.read_csv(os.path.join(base_dir, "data.csv")))
@@ -0,0 +1,240 @@
+"""Diff two store catalogs before shipping a new scrape.
+
+    python catalog_diff.py query_data/data.csv /tmp/out/data.csv
+    python catalog_diff.py old/shards new/shards --json diff.json --fail-on removed,phone
+
+Either side is a ``data.csv`` or a published shard directory.  Every row is
+reduced to a normalized record (whitespace collapsed, names and addresses
+through ``normalize_key``, phone digits, coordinates rounded as in
+``store_ids``) with a digest, so row order, stray spaces and 臺/台 never
+show up as changes.  The old catalog is read once into a compact index, then
+the new one is streamed past it; each new store is matched by 門市編號 when
+both sides have IDs, else by (name, address), phone + location, or a unique
+name, the same order ``StoreIdAssigner`` uses.  A matched pair whose digests
+differ is reported as any of:
+
+``renamed``   the name changed
+``moved``     the county, address or coordinates changed
+``phone``     the phone changed (with the old and new WiFi password)
+``hours``     營業時間 / 開始時間 / 結束時間 changed
+
+plus ``added`` and ``removed``.  The exit status is 0 when nothing in
+``--fail-on`` (default: every category) changed, 1 when something did and 2
+when an input can't be read, so the command can gate a release.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+
+from query_data import shards
+from query_data.normalize import normalize_key, parse_coordinates
+from query_data.store_ids import COORD_DIGITS, STORE_ID, durable_key
+from wifi_apply import derive_password
+
+CATEGORIES = ("added", "removed", "renamed", "moved", "phone", "hours")
+HOURS_FIELDS = ("營業時間", "開始時間", "結束時間")
+MAX_LISTED = 20
+
+
+def iter_rows(path):
+    """Rows of a ``data.csv``, or of every shard of a shard directory, one at a time."""
+    if os.path.isdir(path):
+        files = [os.path.join(path, e["file"]) for e in shards.read_manifest(path)["shards"]]
+    else:
+        files = [path]
+    for name in files:
+        with open(name, "r", encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def _squash(text):
+    return " ".join((text or "").split())
+
+
+class Record:
+    """The normalized fields of one store that the diff compares."""
+    __slots__ = ("store_id", "county", "name", "address", "phone", "point", "hours",
+                 "name_key", "address_key", "durable", "digest")
+
+    def __init__(self, row):
+        self.store_id = _squash(row.get(STORE_ID)) or None
+        self.county = _squash(row.get("縣市"))
+        self.name = _squash(row.get("門市名稱"))
+        self.address = _squash(row.get("地址"))
+        self.phone = _squash(row.get("電話"))
+        point = parse_coordinates(row.get("經緯度座標", ""))
+        self.point = (round(point[0], COORD_DIGITS), round(point[1], COORD_DIGITS)) if point else None
+        self.hours = tuple(_squash(row.get(f)) for f in HOURS_FIELDS)
+        self.name_key = normalize_key(self.name)
+        self.address_key = normalize_key(self.address)
+        self.durable = durable_key(row)
+        fields = (normalize_key(self.county), self.name_key, self.address_key,
+                  self.phone_digits, repr(self.point)) + self.hours
+        self.digest = hashlib.sha1("\x1f".join(fields).encode("utf-8")).digest()
+
+    @property
+    def phone_digits(self):
+        return re.sub(r"\D", "", self.phone)
+
+    @property
+    def password(self):
+        return derive_password(self.phone.replace(" ", ""))
+
+    def summary(self):
+        return {"store_id": self.store_id, "county": self.county, "name": self.name,
+                "address": self.address, "phone": self.phone}
+
+
+def changes(old, new):
+    """``{category: {"from": ..., "to": ...}}`` for a matched pair of records."""
+    found = {}
+    if old.name_key != new.name_key:
+        found["renamed"] = {"from": old.name, "to": new.name}
+    if (normalize_key(old.county) != normalize_key(new.county)
+            or old.address_key != new.address_key or old.point != new.point):
+        found["moved"] = {
+            "from": {"county": old.county, "address": old.address, "point": old.point},
+            "to": {"county": new.county, "address": new.address, "point": new.point},
+        }
+    if old.phone_digits != new.phone_digits:
+        found["phone"] = {"from": old.phone, "to": new.phone,
+                          "password_from": old.password, "password_to": new.password}
+    if old.hours != new.hours:
+        found["hours"] = {"from": dict(zip(HOURS_FIELDS, old.hours)),
+                          "to": dict(zip(HOURS_FIELDS, new.hours))}
+    return found
+
+
+class OldIndex:
+    """The old catalog, indexed every way a new store can be matched to it."""
+
+    def __init__(self, rows):
+        self.records = []
+        self.by_id = {}
+        self.by_key = {}
+        self.by_durable = {}
+        self.by_name = {}
+        for row in rows:
+            record = Record(row)
+            self.records.append(record)
+            if record.store_id:
+                self.by_id[record.store_id] = record
+            self.by_key.setdefault((record.name_key, record.address_key), record)
+            # Keys shared by several stores can't identify any of them.
+            self.by_durable[record.durable] = None if record.durable in self.by_durable else record
+            self.by_name[record.name_key] = None if record.name_key in self.by_name else record
+        self.matched = set()
+
+    def match(self, record):
+        """The unmatched old record ``record`` continues, or None (an added store)."""
+        if record.store_id and self.by_id:
+            candidates = (self.by_id.get(record.store_id),)
+        else:
+            candidates = (self.by_key.get((record.name_key, record.address_key)),
+                          self.by_durable.get(record.durable),
+                          self.by_name.get(record.name_key))
+        for old in candidates:
+            if old is not None and id(old) not in self.matched:
+                self.matched.add(id(old))
+                return old
+        return None
+
+    def unmatched(self):
+        return [r for r in self.records if id(r) not in self.matched]
+
+
+def diff_catalogs(old_rows, new_rows):
+    index = OldIndex(old_rows)
+    report = {"old_stores": len(index.records), "new_stores": 0, "unchanged": 0,
+              "counts": dict.fromkeys(CATEGORIES, 0), "added": [], "removed": [], "changed": []}
+    for row in new_rows:
+        report["new_stores"] += 1
+        record = Record(row)
+        old = index.match(record)
+        if old is None:
+            report["added"].append(record.summary())
+        elif old.digest == record.digest:
+            report["unchanged"] += 1
+        else:
+            found = changes(old, record)
+            for category in found:
+                report["counts"][category] += 1
+            report["changed"].append(dict(record.summary(), changes=found))
+    report["removed"] = [r.summary() for r in index.unmatched()]
+    report["counts"]["added"] = len(report["added"])
+    report["counts"]["removed"] = len(report["removed"])
+    return report
+
+
+def _label(store):
+    return f"#{store['store_id']} {store['name']}" if store["store_id"] else store["name"]
+
+
+def print_report(report, out=sys.stdout):
+    counts = report["counts"]
+    print(f"{report['old_stores']} -> {report['new_stores']} stores, {report['unchanged']} unchanged: "
+          + ", ".join(f"{c} {counts[c]}" for c in CATEGORIES), file=out)
+    for title, stores in (("Added", report["added"]), ("Removed", report["removed"])):
+        for store in stores[:MAX_LISTED]:
+            print(f"  {title} {_label(store)} ({store['county']} {store['address']})", file=out)
+        if len(stores) > MAX_LISTED:
+            print(f"  ... {len(stores) - MAX_LISTED} more {title.lower()}", file=out)
+    for entry in report["changed"][:MAX_LISTED]:
+        found = entry["changes"]
+        parts = []
+        if "renamed" in found:
+            parts.append(f"renamed from {found['renamed']['from']}")
+        if "moved" in found:
+            parts.append(f"moved from {found['moved']['from']['address']}")
+        if "phone" in found:
+            p = found["phone"]
+            parts.append(f"phone {p['from']} -> {p['to']} (password {p['password_from']} -> {p['password_to']})")
+        if "hours" in found:
+            parts.append(f"hours {found['hours']['from']['營業時間']} -> {found['hours']['to']['營業時間']}")
+        print(f"  Changed {_label(entry)}: " + "; ".join(parts), file=out)
+    if len(report["changed"]) > MAX_LISTED:
+        print(f"  ... {len(report['changed']) - MAX_LISTED} more changed", file=out)
+
+
+def parse_categories(text):
+    categories = [c.strip() for c in text.split(",") if c.strip()]
+    unknown = [c for c in categories if c not in CATEGORIES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown categories: {', '.join(unknown)}")
+    return categories
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff two store catalogs (data.csv or shard directories).")
+    parser.add_argument("old", help="catalog currently shipped")
+    parser.add_argument("new", help="catalog about to be shipped")
+    parser.add_argument("--json", metavar="PATH", help="write the full diff as JSON ('-' for stdout)")
+    parser.add_argument("--fail-on", type=parse_categories, default=list(CATEGORIES),
+                        metavar="CATEGORY,...",
+                        help=f"exit 1 when any of these changed (default: all of {','.join(CATEGORIES)})")
+    args = parser.parse_args(argv)
+
+    try:
+        report = diff_catalogs(iter_rows(args.old), iter_rows(args.new))
+    except (OSError, ValueError, KeyError) as e:
+        print(f"catalog_diff: cannot read catalog: {e}", file=sys.stderr)
+        return 2
+    report = dict(old=args.old, new=args.new, **report)
+
+    print_report(report, sys.stderr if args.json == "-" else sys.stdout)
+    if args.json:
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.json == "-":
+            print(text)
+        else:
+            with open(args.json, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+    return 1 if any(report["counts"][c] for c in args.fail_on) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
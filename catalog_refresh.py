@@ -0,0 +1,291 @@
+"""Background refresh of the store catalog from a remote manifest.
+
+``catalog_url`` in settings.json points at a published ``manifest.json``
+(for a local stand-in: ``python -m http.server -d query_data/shards``).
+The manifest is fetched with If-None-Match / If-Modified-Since; when it
+changed, the local catalog is first brought up to date by applying the
+published delta chain (``query_data/delta.py``).  If a delta is missing or
+the checksums disagree, every shard is downloaded instead (or reused if its
+checksum is already cached) and verified against the manifest.  Either way
+the result is written to a fresh directory under ``catalog_cache/``, built
+and warmed on the worker thread and handed to ``on_ready``; the caller swaps
+it in.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from catalog import ShardedCatalog
+from query_data import shards
+from query_data.delta import DeltaError, apply_delta, catalog_checksum, delta_fields
+
+CURRENT_NAME = "CURRENT"
+STATE_NAME = "refresh_state.json"
+TIMEOUT = 15
+
+
+class CatalogVerifyError(Exception):
+    pass
+
+
+def current_catalog_dir(cache_dir):
+    """Directory of the last verified download, or None."""
+    try:
+        with open(os.path.join(cache_dir, CURRENT_NAME), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(cache_dir, name)
+    if name and os.path.exists(os.path.join(path, shards.MANIFEST_NAME)):
+        return path
+    return None
+
+
+def _load_state(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, STATE_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(cache_dir, state):
+    path = os.path.join(cache_dir, STATE_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def _get(url, headers=None):
+    req = urllib.request.Request(url, headers=headers or {})
+    with urllib.request.urlopen(req, timeout=TIMEOUT) as resp:
+        return resp.read(), resp.headers
+
+
+def verify_manifest(manifest):
+    if manifest.get("format") != shards.FORMAT_VERSION:
+        raise CatalogVerifyError(f"unsupported manifest format {manifest.get('format')!r}")
+    entries = manifest.get("shards") or []
+    if sum(e["count"] for e in entries) != manifest.get("total"):
+        raise CatalogVerifyError("manifest total does not match shard counts")
+    for e in entries:
+        name = e["file"]
+        if os.path.basename(name) != name or not name.endswith(".csv"):
+            raise CatalogVerifyError(f"bad shard file name {name!r}")
+
+
+def _verify_shard(entry, data):
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise CatalogVerifyError(f"checksum mismatch for {entry['file']}")
+
+
+def _cached_shard(search_dirs, entry):
+    """Bytes of an already downloaded/bundled shard with the same checksum."""
+    for d in search_dirs:
+        if not d:
+            continue
+        try:
+            with open(os.path.join(d, entry["file"]), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        if hashlib.sha256(data).hexdigest() == entry["sha256"]:
+            return data
+    return None
+
+
+def _apply_delta_chain(url, local_dir, manifest):
+    """Rows of ``local_dir`` advanced to the remote version, or None if no chain applies."""
+    local = shards.read_manifest(local_dir)
+    version, target = local.get("version"), manifest.get("version")
+    if version is None or target is None or version >= target:
+        return None
+    chain = {d["from"]: d for d in manifest.get("deltas", [])}
+    # Each step is checked against the columns of its own delta (see
+    # delta.delta_fields); only the final result uses the remote's.
+    fields = local.get("fields", shards.FIELDNAMES)
+
+    rows = [r for e in local["shards"] for r in shards.read_shard(local_dir, e)]
+    touched = set()
+    while version < target:
+        entry = chain.get(version)
+        if entry is None:
+            return None
+        name = entry["file"]
+        if name.startswith(("/", "\\")) or ".." in name.split("/"):
+            raise CatalogVerifyError(f"bad delta file name {name!r}")
+        data, _ = _get(urllib.parse.urljoin(url, name))
+        if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+            raise CatalogVerifyError(f"checksum mismatch for {name}")
+        delta = json.loads(data.decode("utf-8"))
+        rows, changed = apply_delta(rows, delta, fields)
+        fields = delta_fields(delta, fields)
+        touched |= changed
+        version = delta["to"]
+
+    if catalog_checksum(rows, manifest["fields"]) != manifest.get("checksum"):
+        raise DeltaError("catalog checksum mismatch after applying deltas")
+    return rows, touched
+
+
+def download_catalog(url, cache_dir, bundled_dir=None, force=False):
+    """Fetch ``url`` into ``cache_dir``.
+
+    Returns ``(new_dir, touched_counties)`` or None if the catalog is unchanged.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    _prune(cache_dir, keep=current_catalog_dir(cache_dir))
+    state = _load_state(cache_dir)
+    headers = {}
+    if not force and state.get("url") == url and current_catalog_dir(cache_dir):
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    try:
+        body, resp_headers = _get(url, headers)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+    manifest = json.loads(body.decode("utf-8"))
+    verify_manifest(manifest)
+
+    version = hashlib.sha256(body).hexdigest()[:16]
+    target = os.path.join(cache_dir, f"catalog-{version}")
+    current = current_catalog_dir(cache_dir)
+    if current == target:
+        return None
+
+    staging = target + ".partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    local_dir = current or bundled_dir
+    patched = None
+    if local_dir and not force:
+        try:
+            patched = _apply_delta_chain(url, local_dir, manifest)
+        except (CatalogVerifyError, DeltaError, OSError, ValueError, KeyError) as e:
+            # Drifted or incomplete chain: fall back to the full snapshot.
+            print(f"Catalog delta failed, fetching full snapshot: {e}")
+
+    if patched:
+        rows, touched = patched
+        shards.write_shards(rows, staging, manifest["fields"], extra={
+            k: manifest[k] for k in ("version", "checksum", "deltas") if k in manifest
+        })
+    else:
+        previous = {}
+        if local_dir:
+            try:
+                previous = {e["county"]: e["sha256"]
+                            for e in shards.read_manifest(local_dir)["shards"]}
+            except (OSError, ValueError, KeyError):
+                pass
+        touched = set()
+        for entry in manifest["shards"]:
+            if previous.get(entry["county"]) != entry["sha256"]:
+                touched.add(entry["county"])
+            data = _cached_shard([current, bundled_dir], entry)
+            if data is None:
+                data, _ = _get(urllib.parse.urljoin(url, entry["file"]))
+                _verify_shard(entry, data)
+            with open(os.path.join(staging, entry["file"]), "wb") as f:
+                f.write(data)
+        with open(os.path.join(staging, shards.MANIFEST_NAME), "wb") as f:
+            f.write(body)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    pointer = os.path.join(cache_dir, CURRENT_NAME)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(target))
+    os.replace(pointer + ".tmp", pointer)
+
+    _save_state(cache_dir, {
+        "url": url,
+        "etag": resp_headers.get("ETag"),
+        "last_modified": resp_headers.get("Last-Modified"),
+    })
+    return target, touched
+
+
+def _prune(cache_dir, keep):
+    # The previous catalog may still be paging shards in until the UI swaps,
+    # so old directories are only removed on the next check.
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith("catalog-") and path != keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_catalog(catalog_dir, resident=None, touched=(), max_resident=None):
+    """Open ``catalog_dir`` warmed with the shards the old catalog held.
+
+    Shards of untouched counties are adopted from ``resident`` as-is; only
+    the touched ones are read back from disk.
+    """
+    kwargs = {"max_resident": max_resident} if max_resident else {}
+    catalog = ShardedCatalog(catalog_dir, **kwargs)
+    for county, rows in (resident or {}).items():
+        if county in touched:
+            catalog.shard(county)
+        else:
+            catalog.adopt(county, rows)
+    return catalog
+
+
+class CatalogRefresher:
+    """Runs one refresh check at a time on a daemon thread.
+
+    ``on_ready(catalog)`` is called from the worker thread with a fully built
+    catalog; ``on_error(exc)`` on failure.  Neither is called when the remote
+    manifest is unchanged.
+    """
+
+    def __init__(self, url, cache_dir, bundled_dir=None, on_ready=None, on_error=None):
+        self.url = url
+        self.cache_dir = cache_dir
+        self.bundled_dir = bundled_dir
+        self.on_ready = on_ready
+        self.on_error = on_error
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def check(self, resident=None, max_resident=None):
+        """Start a check; ``resident`` is the current catalog's resident shards."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._thread = threading.Thread(
+                target=self._run, args=(dict(resident or {}), max_resident),
+                name="catalog-refresh", daemon=True,
+            )
+            self._thread.start()
+            return True
+
+    def join(self, timeout=None):
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self, resident, max_resident):
+        try:
+            result = download_catalog(self.url, self.cache_dir, self.bundled_dir)
+            if result is None:
+                return
+            new_dir, touched = result
+            catalog = build_catalog(new_dir, resident, touched, max_resident)
+        except Exception as e:
+            if self.on_error:
+                self.on_error(e)
+            return
+        if self.on_ready:
+            self.on_ready(catalog)
@@ -0,0 +1,223 @@
+"""Store catalog backed by the read-only ``catalog.sqlite`` database.
+
+Same interface as ``catalog.ShardedCatalog``, but nothing is held in memory:
+``search`` is an FTS5 trigram query over the normalized keys (keys shorter
+than a trigram fall back to ``instr``) merged with a range scan of the
+``store_digits`` suffix table for phone / WiFi-key digits, ``find`` uses the
+name index and
+``nearest`` grows an R*Tree bounding box until it holds ``k`` stores, then
+ranks them by the same haversine distance as ``geo.CoordinateIndex``.  The
+address trie holds row ids and is filled from the (county, district, road)
+index.
+
+The database is opened with ``mode=ro&immutable=1`` and one connection per
+thread, so a catalog can be shared with worker threads.
+"""
+import math
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+from address_index import AddressIndex, in_district
+from digit_index import rank_matches
+from geo import EARTH_RADIUS_KM, parse_coordinates
+from query_data.normalize import digit_query, normalize_key
+from query_data.sqlite_store import COLUMNS
+
+NEAREST_RESULTS = 20
+TRIGRAM = 3
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+START_RADIUS_KM = 2.0
+MAX_RADIUS_KM = math.pi * EARTH_RADIUS_KM      # half the circumference
+
+_SELECT = "SELECT id, " + ", ".join(COLUMNS.values()) + " FROM stores"
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+
+def _fts_phrase(key):
+    return '"' + key.replace('"', '""') + '"'
+
+
+class SqliteCatalog:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.shard_dir = None
+        self.max_resident = 0
+        self._uri = f"file:{pathname2url(db_path)}?mode=ro&immutable=1"
+        self._local = threading.local()
+
+        # Fails early (sqlite3.Error) on Python builds without FTS5 / R*Tree,
+        # or on a database written before the current columns existed.
+        self._conn().execute("SELECT 1 FROM store_fts, store_geo, store_digits LIMIT 0")
+        self._conn().execute(f"{_SELECT} LIMIT 0")
+        meta = dict(self._conn().execute("SELECT key, value FROM meta"))
+        counts = self._conn().execute(
+            "SELECT county, count(*) FROM stores GROUP BY county ORDER BY min(id)"
+        ).fetchall()
+        self.manifest = {
+            "format": int(meta["format"]),
+            "version": int(meta["version"]) if meta.get("version") else None,
+            "checksum": meta.get("checksum"),
+            "total": int(meta["total"]),
+            "shards": [{"county": county, "count": n} for county, n in counts],
+        }
+        self._counts = dict(counts)
+        self._address = AddressIndex()
+        self._indexed = set()
+        self._lock = threading.Lock()       # address_index is filled lazily
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True)
+            self._local.conn = conn
+        return conn
+
+    def _rows(self, where="", params=()):
+        cursor = self._conn().execute(f"{_SELECT} {where}", params)
+        fields = list(COLUMNS)
+        return [dict(zip(fields, row[1:])) for row in cursor]
+
+    # -----------------------------------------------------------------------
+    # ShardedCatalog interface
+    # -----------------------------------------------------------------------
+
+    def counties(self):
+        return list(self._counts)
+
+    def count(self, county=None):
+        if county is None:
+            return self.manifest["total"]
+        return self._counts.get(county, 0)
+
+    def resident_counties(self):
+        return []
+
+    def resident_shards(self):
+        return {}
+
+    def adopt(self, county, rows):
+        pass
+
+    def shard(self, county):
+        return self._rows("WHERE county = ? ORDER BY id", (county,))
+
+    def iter_stores(self, county=None):
+        if county:
+            return iter(self.shard(county))
+        return iter(self._rows("ORDER BY id"))
+
+    def search(self, text, county=None, district=None, road=None):
+        """Stores whose name or address key contains the normalized ``text``.
+
+        A digit run also matches stores whose phone number or WiFi key
+        contains it; all hits are ranked by ``rank_matches``.  ``district`` /
+        ``road`` (with ``county``) narrow the candidates.  A ``"lat,lng"``
+        query returns the nearest stores instead, closest first.
+        """
+        point = parse_coordinates(text)
+        if point:
+            k = None if district is not None else NEAREST_RESULTS
+            hits = [s for s, _ in self.nearest(*point, k=k, county=county)]
+            if district is not None:
+                hits = [s for s in hits if in_district(s, district, road)][:NEAREST_RESULTS]
+            return hits
+        key = normalize_key(text)
+        where, params = [], []
+        if county:
+            where.append("county = ?")
+            params.append(county)
+            if district is not None:
+                ids = self.address_index(county).positions(
+                    *[p for p in (county, district, road) if p is not None])
+                where.append(f"id IN ({', '.join(str(i) for i in ids) or 'NULL'})")
+        if len(key) >= TRIGRAM:
+            match = ["id IN (SELECT rowid FROM store_fts WHERE store_fts MATCH ?)"]
+            params.append(_fts_phrase(key))
+        elif key:
+            match = ["(instr(name_key, ?) > 0 OR instr(address_key, ?) > 0)"]
+            params += [key, key]
+        else:
+            match = []
+        digits = digit_query(text)
+        if digits:
+            # Every suffix starting with the run sorts between it and run + ":".
+            match.append("id IN (SELECT id FROM store_digits WHERE suffix >= ? AND suffix < ?)")
+            params += [digits, digits + ":"]
+        if match:
+            where.append("(" + " OR ".join(match) + ")")
+        clause = ("WHERE " + " AND ".join(where)) if where else ""
+        return rank_matches(self._rows(f"{clause} ORDER BY id", params), key, digits)
+
+    def find(self, name, county=None):
+        """Look up a store by its exact name, preferring ``county`` when known."""
+        rows = self._rows("WHERE name = ? ORDER BY county = ? DESC, id LIMIT 1",
+                          (name, county or ""))
+        return rows[0] if rows else None
+
+    def address_index(self, county):
+        """The address trie, with ``county`` indexed (row ids as positions)."""
+        with self._lock:
+            if county not in self._indexed and county in self._counts:
+                rows = self._conn().execute(
+                    "SELECT id, district, road FROM stores WHERE county = ? ORDER BY id", (county,))
+                for store_id, district, road in rows:
+                    self._address.add(county, district, road, store_id)
+                self._indexed.add(county)
+            return self._address
+
+    def stores_at(self, county, district=None, road=None):
+        """Stores in ``county`` / its ``district`` / on ``road``, in catalog order."""
+        path = [county] + [p for p in (district, road) if p is not None]
+        index = self.address_index(county)
+        with self._lock:
+            ids = index.positions(*path)
+        rows = self._by_id(ids)
+        return [rows[i] for i in ids]
+
+    def get(self, store_id, county=None):
+        """The store with ``門市編號`` ``store_id``."""
+        rows = self._rows("WHERE store_id = ?", (store_id,))
+        return rows[0] if rows else None
+
+    def nearest(self, lat, lng, k=10, radius_km=None, county=None):
+        """``[(store, km), ...]`` nearest first, optionally within ``radius_km``/``county``."""
+        radius = radius_km if radius_km is not None else START_RADIUS_KM
+        while True:
+            hits = self._within_box(lat, lng, radius, county)
+            inside = sorted(((km, store_id) for store_id, km in hits if km <= radius))
+            if radius_km is not None or (k and len(inside) >= k) or radius >= MAX_RADIUS_KM:
+                break
+            radius = min(radius * 2, MAX_RADIUS_KM)
+        if k:
+            inside = inside[:k]
+        rows = self._by_id([store_id for _, store_id in inside])
+        return [(rows[store_id], km) for km, store_id in inside]
+
+    def _within_box(self, lat, lng, radius, county):
+        """``[(id, km), ...]`` for stores in the bounding box of the circle."""
+        dlat = radius / KM_PER_DEGREE
+        # Widest longitude span of the circle (it is not at the centre's latitude).
+        ratio = math.sin(radius / EARTH_RADIUS_KM) / max(math.cos(math.radians(lat)), 1e-12)
+        dlng = 180.0 if ratio >= 1 or radius >= MAX_RADIUS_KM / 2 else math.degrees(math.asin(ratio))
+        # The R*Tree holds 32-bit floats; distances use the exact stored text.
+        sql = ("SELECT g.id, s.coords FROM store_geo g JOIN stores s ON s.id = g.id"
+               " WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lng >= ? AND g.min_lng <= ?"
+               + (" AND s.county = ?" if county else ""))
+        params = [lat - dlat, lat + dlat, lng - dlng, lng + dlng] + ([county] if county else [])
+        return [(store_id, haversine_km(lat, lng, *parse_coordinates(text)))
+                for store_id, text in self._conn().execute(sql, params)]
+
+    def _by_id(self, ids):
+        if not ids:
+            return {}
+        marks = ", ".join("?" * len(ids))
+        cursor = self._conn().execute(f"{_SELECT} WHERE id IN ({marks})", ids)
+        fields = list(COLUMNS)
+        return {row[0]: dict(zip(fields, row[1:])) for row in cursor}
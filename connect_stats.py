@@ -0,0 +1,109 @@
+"""Per-store connection outcomes and time-to-connected.
+
+Every verified apply (``wlan.ConnectionVerifier``) is recorded against the
+store it used, in ``connect_stats.json`` next to ``settings.json``::
+
+    {"<門市編號>": {"id": ..., "name": ..., "county": ...,
+                     "connected": n, "auth_failed": n, "timeout": n, "error": n,
+                     "seconds": [<time-to-connected>, ...]}}
+
+Entries are keyed on the store ID, so a renamed store keeps its history;
+``migrate`` re-keys files written when they were keyed on name + address;
+an old entry whose store is gone keeps its counts under ``"id": null``.
+Only the last ``MAX_SAMPLES`` connect times are kept per store.  Run
+``python connect_stats.py [path]`` to print the table.
+"""
+import json
+import os
+import sys
+import threading
+
+from query_data.store_ids import STORE_ID
+from tracing import percentile
+
+MAX_SAMPLES = 50
+STATUSES = ("connected", "auth_failed", "timeout", "error")
+
+
+class ConnectStats:
+    def __init__(self, path):
+        self.path = path
+        self.stores = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.stores = json.load(f)
+        except (OSError, ValueError):
+            self.stores = {}
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.stores, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def record(self, store, status, seconds):
+        """Count one ``status`` for ``store``; connected results keep their time."""
+        with self._lock:
+            entry = self.stores.setdefault(str(store[STORE_ID]), {"id": store[STORE_ID]})
+            entry.update(name=store["門市名稱"], county=store["縣市"])
+            entry[status] = entry.get(status, 0) + 1
+            if status == "connected":
+                samples = entry.setdefault("seconds", [])
+                samples.append(round(seconds, 3))
+                del samples[:-MAX_SAMPLES]
+            self.save()
+
+    def migrate(self, catalog):
+        """Re-key entries recorded before stores had IDs.
+
+        An entry whose store is no longer in the catalog keeps its old key
+        and is marked with ``"id": None``, so it is looked up only once
+        rather than on every launch.
+        """
+        with self._lock:
+            legacy = [key for key, entry in self.stores.items() if "id" not in entry]
+            if not legacy:
+                return
+            for old in legacy:
+                store = catalog.find(self.stores[old]["name"], self.stores[old].get("county"))
+                if not store:
+                    self.stores[old]["id"] = None
+                    continue
+                entry = self.stores.pop(old)
+                merged = self.stores.setdefault(str(store[STORE_ID]), {"id": store[STORE_ID]})
+                merged.update(name=store["門市名稱"], county=store["縣市"])
+                for status in STATUSES:
+                    if entry.get(status):
+                        merged[status] = merged.get(status, 0) + entry[status]
+                samples = merged.setdefault("seconds", [])
+                samples[:0] = entry.get("seconds", [])
+                del samples[:-MAX_SAMPLES]
+            self.save()
+
+    def summary(self):
+        """``[(name, county, counts, p50, p95), ...]``, most attempted first."""
+        rows = []
+        with self._lock:
+            for entry in self.stores.values():
+                counts = {s: entry.get(s, 0) for s in STATUSES}
+                samples = sorted(entry.get("seconds", []))
+                rows.append((entry["name"], entry["county"], counts,
+                             percentile(samples, 50), percentile(samples, 95)))
+        rows.sort(key=lambda r: -sum(r[2].values()))
+        return rows
+
+
+def print_summary(stats, out=sys.stdout):
+    header = f"{'門市':<12} {'縣市':<6} " + " ".join(f"{s:>11}" for s in STATUSES)
+    print(header + f" {'p50 s':>7} {'p95 s':>7}", file=out)
+    for name, county, counts, p50, p95 in stats.summary():
+        cells = " ".join(f"{counts[s]:>11}" for s in STATUSES)
+        print(f"{name:<12} {county:<6} {cells} {p50:>7.2f} {p95:>7.2f}", file=out)
+
+
+if __name__ == "__main__":
+    print_summary(ConnectStats(sys.argv[1] if len(sys.argv) > 1 else "connect_stats.json"))
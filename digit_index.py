@@ -0,0 +1,58 @@
+"""Phone / WiFi-key search: a suffix array over store phone digits.
+
+Staff often know a store's number or the key read off a receipt rather than
+its name.  ``DigitIndex`` keeps every suffix of each store's ``電話`` digits
+(see ``normalize.digit_suffixes``) in one sorted list; every digit run the
+user can type is a prefix of one of those suffixes, so a lookup is two
+bisections plus the slice between them, however many stores there are.
+``SqliteCatalog`` keeps the same suffixes in its ``store_digits`` table.
+
+``rank_matches`` orders the merged text and digit hits of a search: exact
+name / phone / password matches first, then prefix matches, then the rest,
+each tier in catalog order.
+"""
+from bisect import bisect_left
+
+from query_data.normalize import NAME_KEY, digit_suffixes, phone_digits
+from query_data.store_ids import STORE_ID
+from wifi_apply import derive_password
+
+# Sorts right after "9": the upper bound of every suffix starting with a run.
+_AFTER_DIGITS = ":"
+
+
+class DigitIndex:
+    def __init__(self, rows=()):
+        pairs = sorted((suffix, row[STORE_ID]) for row in rows
+                       for suffix in digit_suffixes(row.get("電話", "")))
+        self._suffixes = [suffix for suffix, _ in pairs]
+        self._ids = [store_id for _, store_id in pairs]
+
+    def __len__(self):
+        return len(self._suffixes)
+
+    def lookup(self, digits):
+        """門市編號 of every store whose phone digits contain ``digits``."""
+        lo = bisect_left(self._suffixes, digits)
+        hi = bisect_left(self._suffixes, digits + _AFTER_DIGITS, lo)
+        return set(self._ids[lo:hi])
+
+
+def match_tier(store, key, digits):
+    """0 for an exact match of the name or of the phone / password, 1 for a prefix, else 2."""
+    name = store.get(NAME_KEY, "")
+    numbers = ()
+    if digits:
+        numbers = (phone_digits(store.get("電話", "")), derive_password(store.get("電話", "")) or "")
+    if (key and name == key) or digits in numbers:
+        return 0
+    if (key and name.startswith(key)) or (digits and any(n.startswith(digits) for n in numbers)):
+        return 1
+    return 2
+
+
+def rank_matches(stores, key, digits=None):
+    """``stores`` (in catalog order) sorted by ``match_tier``; the sort is stable."""
+    if not key and not digits:
+        return stores
+    return sorted(stores, key=lambda s: match_tier(s, key, digits))
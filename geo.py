@@ -0,0 +1,105 @@
+"""Packed store coordinates and batched haversine distances.
+
+``CoordinateIndex`` keeps every store's position in flat ``array('d')``
+buffers (pre-converted to radians, with cos(lat) cached) plus the
+(shard, row) it came from, instead of re-parsing the ``經緯度座標`` string
+per row.  ``distances`` computes the distance from one point to every store
+in one pass and ``distances_many`` does the same for a batch of points; with
+NumPy installed both are fully vectorised (the batch as one broadcasted
+matrix), otherwise they fall back to ``map`` over the packed arrays.
+"""
+import math
+from array import array
+
+try:
+    import numpy as np
+except ImportError:          # optional: the packed-array path needs nothing else
+    np = None
+
+from query_data.normalize import parse_coordinates  # noqa: F401  (re-exported)
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+class CoordinateIndex:
+    def __init__(self):
+        self.lat = array("d")       # radians
+        self.lng = array("d")       # radians
+        self.cos_lat = array("d")
+        self.shard = array("H")     # position of the store: (shard number, row number)
+        self.row = array("I")
+        self._np = None
+
+    @classmethod
+    def from_shards(cls, shard_rows):
+        """Build from ``[(shard_no, rows), ...]``; stores without coordinates are skipped."""
+        index = cls()
+        for shard_no, rows in shard_rows:
+            for row_no, row in enumerate(rows):
+                point = parse_coordinates(row.get("經緯度座標", ""))
+                if point is None:
+                    continue
+                lat, lng = math.radians(point[0]), math.radians(point[1])
+                index.lat.append(lat)
+                index.lng.append(lng)
+                index.cos_lat.append(math.cos(lat))
+                index.shard.append(shard_no)
+                index.row.append(row_no)
+        return index
+
+    def __len__(self):
+        return len(self.lat)
+
+    def _arrays(self):
+        if self._np is None:
+            # Zero-copy views over the packed buffers.
+            self._np = (np.frombuffer(self.lat, dtype=np.float64),
+                        np.frombuffer(self.lng, dtype=np.float64),
+                        np.frombuffer(self.cos_lat, dtype=np.float64))
+        return self._np
+
+    def distances(self, lat, lng):
+        """Kilometres from (lat, lng) to every indexed store, in index order."""
+        qlat, qlng = math.radians(lat), math.radians(lng)
+        qcos = math.cos(qlat)
+        if np is not None:
+            lats, lngs, coss = self._arrays()
+            a = (np.sin((lats - qlat) / 2) ** 2
+                 + qcos * coss * np.sin((lngs - qlng) / 2) ** 2)
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        sin, asin, sqrt = math.sin, math.asin, math.sqrt
+        return array("d", map(
+            lambda la, ln, c: 2 * EARTH_RADIUS_KM * asin(sqrt(min(1.0,
+                sin((la - qlat) / 2) ** 2 + qcos * c * sin((ln - qlng) / 2) ** 2))),
+            self.lat, self.lng, self.cos_lat,
+        ))
+
+    def distances_many(self, points):
+        """Distances from each of ``points`` to every store: one row per point."""
+        if np is not None and len(points):
+            q = np.radians(np.asarray(points, dtype=np.float64))
+            qlat, qlng = q[:, :1], q[:, 1:]
+            lats, lngs, coss = self._arrays()
+            a = (np.sin((lats - qlat) / 2) ** 2
+                 + np.cos(qlat) * coss * np.sin((lngs - qlng) / 2) ** 2)
+            return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+        return [self.distances(lat, lng) for lat, lng in points]
+
+    def nearest(self, lat, lng, k=10, radius_km=None):
+        """``[(position, km), ...]`` of the ``k`` closest stores, optionally within a radius."""
+        dist = self.distances(lat, lng)
+        if np is not None:
+            order = np.argsort(dist, kind="stable")
+            if radius_km is not None:
+                order = order[dist[order] <= radius_km]
+            order = order[:k] if k else order
+            return [((self.shard[i], self.row[i]), float(dist[i])) for i in order]
+        order = sorted(range(len(dist)), key=dist.__getitem__)
+        if radius_km is not None:
+            order = [i for i in order if dist[i] <= radius_km]
+        order = order[:k] if k else order
+        return [((self.shard[i], self.row[i]), dist[i]) for i in order]
+
+    def within(self, lat, lng, radius_km):
+        """All stores within ``radius_km``, nearest first."""
+        return self.nearest(lat, lng, k=None, radius_km=radius_km)
@@ -1,17 +1,30 @@
 import sys
 import json
 import subprocess
-import csv
-import tempfile
+import threading
+import time
 import os
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QComboBox, QPushButton, QFrame,
-    QSizePolicy, QMessageBox
+    QSizePolicy, QMessageBox, QCheckBox, QSystemTrayIcon, QMenu, QStyle
 )
-from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve
+from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QEvent, QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont, QFontDatabase, QPalette, QColor
 
+from bssid_cache import BssidIndex
+from catalog import ShardedCatalog, open_catalog
+from query_data.store_ids import STORE_ID
+from connect_stats import ConnectStats
+from resident import CommandHandler, ResidentError, ResidentServer
+from ui_state import UiState
+from session import load_session, save_session, selected_index, take_snapshot
+from catalog_refresh import CatalogRefresher, current_catalog_dir
+import tracing
+from tracing import traced
+from wifi_apply import apply_with_fallback, derive_password, rank_candidates
+from wlan import SSID, ConnectionVerifier, NetshBackend, VerifyResult
+
 
 # ---------------------------------------------------------------------------
 # Resource path helper (PyInstaller compatibility)
@@ -178,7 +191,9 @@ QLineEdit#searchField::placeholder {{
 }}
 
 /* ── Dropdown ──────────────────────────────────────────────────────────── */
-QComboBox#storeDropdown {{
+QComboBox#storeDropdown,
+QComboBox#countyFilter,
+QComboBox#districtFilter {{
     background-color: {CARD};
     border: 1px solid {BORDER};
     border-radius: {RADIUS};
@@ -187,18 +202,26 @@ QComboBox#storeDropdown {{
     font-size: 13px;
     selection-background-color: {ACCENT};
 }}
-QComboBox#storeDropdown:hover {{
+QComboBox#storeDropdown:hover,
+QComboBox#countyFilter:hover,
+QComboBox#districtFilter:hover {{
     border-color: {ACCENT};
 }}
-QComboBox#storeDropdown:focus {{
+QComboBox#storeDropdown:focus,
+QComboBox#countyFilter:focus,
+QComboBox#districtFilter:focus {{
     border-color: {ACCENT};
     background-color: {CARD_ALT};
 }}
-QComboBox#storeDropdown::drop-down {{
+QComboBox#storeDropdown::drop-down,
+QComboBox#countyFilter::drop-down,
+QComboBox#districtFilter::drop-down {{
     border: none;
     width: 28px;
 }}
-QComboBox#storeDropdown::down-arrow {{
+QComboBox#storeDropdown::down-arrow,
+QComboBox#countyFilter::down-arrow,
+QComboBox#districtFilter::down-arrow {{
     image: none;
     width: 0px;
     height: 0px;
@@ -207,7 +230,9 @@ QComboBox#storeDropdown::down-arrow {{
     border-top:   6px solid {MUTED};
     margin-right: 8px;
 }}
-QComboBox#storeDropdown QAbstractItemView {{
+QComboBox#storeDropdown QAbstractItemView,
+QComboBox#countyFilter QAbstractItemView,
+QComboBox#districtFilter QAbstractItemView {{
     background-color: {CARD};
     border: 1px solid {BORDER};
     border-radius: 4px;
@@ -217,12 +242,16 @@ QComboBox#storeDropdown QAbstractItemView {{
     outline: none;
     padding: 2px;
 }}
-QComboBox#storeDropdown QAbstractItemView::item {{
+QComboBox#storeDropdown QAbstractItemView::item,
+QComboBox#countyFilter QAbstractItemView::item,
+QComboBox#districtFilter QAbstractItemView::item {{
     min-height: 28px;
     padding: 4px 8px;
     border-radius: 4px;
 }}
-QComboBox#storeDropdown QAbstractItemView::item:hover {{
+QComboBox#storeDropdown QAbstractItemView::item:hover,
+QComboBox#countyFilter QAbstractItemView::item:hover,
+QComboBox#districtFilter QAbstractItemView::item:hover {{
     background-color: {CARD_ALT};
     color: {ACCENT};
 }}
@@ -337,6 +366,36 @@ QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical {{
 """
 
 
+# ---------------------------------------------------------------------------
+# Background catalog refresh → UI thread
+# ---------------------------------------------------------------------------
+
+DEFAULT_REFRESH_HOURS = 6
+VERIFY_TIMEOUT = 8.0        # seconds to wait for association after applying
+
+
+class CatalogBridge(QObject):
+    """Carries refresher callbacks from the worker thread to the UI thread."""
+    ready = pyqtSignal(object)
+    failed = pyqtSignal(object)
+
+
+# Dropdown items carry the store row (Qt.UserRole) and its 門市編號 (ID_ROLE).
+ID_ROLE = Qt.UserRole + 1
+
+
+class DetectBridge(QObject):
+    """Carries a BSSID-detected store from the scan thread to the UI thread."""
+    detected = pyqtSignal(object)
+
+
+class ApplyBridge(QObject):
+    """Progress and results of connection attempts (worker → UI)."""
+    attempt = pyqtSignal(int, object)
+    done = pyqtSignal(object)
+    verified = pyqtSignal(object, str, object)
+
+
 # ---------------------------------------------------------------------------
 # Main application widget
 # ---------------------------------------------------------------------------
@@ -352,26 +411,88 @@ class StoreSearchApp(QWidget):
         # ── state ──────────────────────────────────────────────────────────
         self.current_setting_index = 0
         self.preferences = []
-        self.store_list = []
+        self.catalog_url = None
+        self.refresh_hours = DEFAULT_REFRESH_HOURS
         self.settings_path = get_writable_path("settings.json")
+        self.catalog_cache_dir = get_writable_path("catalog_cache")
+        self.wlan = NetshBackend()
+        self.verifier = ConnectionVerifier(self.wlan)
+        self.bssid_index = BssidIndex(get_writable_path("bssid_index.json"))
+        self.connect_stats = ConnectStats(get_writable_path("connect_stats.json"))
+        self.session_path = get_writable_path("session.json")
+        self.resident_handler = None
+        self.carousel_store = None
+        self._favorite_active = None
+        self.state = UiState(
+            lambda fn: QTimer.singleShot(0, fn),
+            query="", county=None, district=None, selection=None, favorites=None, catalog=None,
+            status=("", "", ""),
+        )
 
         # ── load data ──────────────────────────────────────────────────────
+        # Only the shard manifest is read here; county shards are paged in
+        # by the county filter or by a search.
         self.load_settings()
         try:
-            data_path = get_resource_path("query_data/data.csv")
-            with open(data_path, mode='r', encoding='utf-8-sig') as f:
-                reader = csv.DictReader(f)
-                self.store_list = [row for row in reader]
+            # Prefer the last verified download over the bundled shards.
+            cached_dir = current_catalog_dir(self.catalog_cache_dir)
+            if cached_dir:
+                self.catalog = ShardedCatalog(cached_dir)
+            else:
+                self.catalog = open_catalog(get_resource_path("query_data"))
         except Exception as e:
+            self.catalog = ShardedCatalog.from_rows([])
             QMessageBox.critical(self, "錯誤", f"無法讀取資料檔案: {e}")
+        self.migrate_favorites()
+        self.bssid_index.migrate(self.catalog)
+        self.connect_stats.migrate(self.catalog)
 
         # ── build UI ───────────────────────────────────────────────────────
         self._build_ui()
 
+        # Sections re-render once per event-loop turn, only for the slices
+        # they read; producers before consumers (the dropdown sets selection).
+        self.state.subscribe({"favorites", "catalog"}, self.update_setting_display)
+        self.state.subscribe({"county", "catalog"}, self.update_district_filter)
+        self.state.subscribe({"query", "county", "district", "catalog"}, self.update_dropdown)
+        self.state.subscribe({"selection", "favorites"}, self.update_favorite_button)
+        self.state.subscribe({"status"}, self.render_status)
+
         # ── initial display ────────────────────────────────────────────────
-        self.update_setting_display()
-        self.update_dropdown()
-        self.update_favorite_button()
+        snapshot = load_session(self.session_path, self.catalog.manifest.get("version"))
+        if snapshot:
+            # Put the last session back on screen straight away; the live
+            # lookups (which page in shards) run once the window is up.
+            self.restore_session(snapshot)
+        else:
+            self.select_favorite_county()
+            self.state.touch("favorites", "catalog")
+            self.state.flush()
+
+        # ── background catalog refresh ─────────────────────────────────────
+        self.refresher = None
+        if self.catalog_url:
+            self.catalog_bridge = CatalogBridge()
+            self.catalog_bridge.ready.connect(self.swap_catalog)
+            self.catalog_bridge.failed.connect(
+                lambda e: print(f"Catalog refresh failed: {e}")
+            )
+            self.refresher = CatalogRefresher(
+                self.catalog_url, self.catalog_cache_dir,
+                bundled_dir=get_resource_path("query_data/shards"),
+                on_ready=self.catalog_bridge.ready.emit,
+                on_error=self.catalog_bridge.failed.emit,
+            )
+            self.refresh_timer = QTimer(self)
+            self.refresh_timer.timeout.connect(self.check_catalog_update)
+            self.refresh_timer.start(int(self.refresh_hours * 3600 * 1000))
+            QTimer.singleShot(0, self.check_catalog_update)
+
+        # ── store detection from visible access points ─────────────────────
+        if NetshBackend.available() and self.bssid_index.bssids:
+            self.detect_bridge = DetectBridge()
+            self.detect_bridge.detected.connect(self.preselect_detected_store)
+            threading.Thread(target=self._detect_store, daemon=True).start()
 
     # -----------------------------------------------------------------------
     # UI construction
@@ -476,12 +597,37 @@ class StoreSearchApp(QWidget):
         search_label.setObjectName("sectionLabel")
         root.addWidget(search_label)
 
+        search_row = QHBoxLayout()
+        search_row.setSpacing(8)
+
         self.search_field = QLineEdit()
         self.search_field.setObjectName("searchField")
-        self.search_field.setPlaceholderText("  \u2315  輸入門市名稱或地址以搜尋")   # ⌵
+        self.search_field.setPlaceholderText("  \u2315  輸入門市名稱、地址或電話以搜尋")   # ⌵
         self.search_field.setMinimumHeight(40)
-        self.search_field.textChanged.connect(self.update_dropdown)
-        root.addWidget(self.search_field)
+        self.search_field.textChanged.connect(lambda text: self.state.set(query=text))
+        search_row.addWidget(self.search_field)
+
+        self.county_filter = QComboBox()
+        self.county_filter.setObjectName("countyFilter")
+        self.county_filter.setMinimumHeight(40)
+        self.county_filter.setFixedWidth(110)
+        self._populate_county_filter()
+        self.county_filter.currentIndexChanged.connect(
+            lambda _: self.state.set(county=self.county_filter.currentData())
+        )
+        search_row.addWidget(self.county_filter)
+
+        self.district_filter = QComboBox()
+        self.district_filter.setObjectName("districtFilter")
+        self.district_filter.setMinimumHeight(40)
+        self.district_filter.setFixedWidth(120)
+        self.district_filter.hide()
+        self.district_filter.currentIndexChanged.connect(
+            lambda _: self.state.set(district=self.district_filter.currentData())
+        )
+        search_row.addWidget(self.district_filter)
+
+        root.addLayout(search_row)
 
         # ── Dropdown + star ─────────────────────────────────────────────────
         dd_row = QHBoxLayout()
@@ -491,7 +637,10 @@ class StoreSearchApp(QWidget):
         self.dropdown.setObjectName("storeDropdown")
         self.dropdown.setMinimumHeight(40)
         self.dropdown.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
-        self.dropdown.currentIndexChanged.connect(self.update_favorite_button)
+        self.dropdown.setPlaceholderText("選擇縣市或輸入關鍵字")
+        self.dropdown.currentIndexChanged.connect(
+            lambda _: self.state.set(selection=self.current_store())
+        )
         dd_row.addWidget(self.dropdown)
 
         self.favorite_button = QPushButton("\u2606")      # ☆
@@ -516,6 +665,15 @@ class StoreSearchApp(QWidget):
         self.confirm_btn.clicked.connect(self.confirm_selection)
         root.addWidget(self.confirm_btn)
 
+        self.fallback_check = QCheckBox("連線失敗時自動嘗試附近門市的密碼")
+        self.fallback_check.setObjectName("fallbackCheck")
+        root.addWidget(self.fallback_check)
+
+        self.apply_bridge = ApplyBridge()
+        self.apply_bridge.attempt.connect(self._on_chain_attempt)
+        self.apply_bridge.done.connect(self._on_chain_done)
+        self.apply_bridge.verified.connect(self._on_verified)
+
         # ── Status card ─────────────────────────────────────────────────────
         self.status_card = QFrame()
         self.status_card.setObjectName("statusCard")
@@ -543,6 +701,12 @@ class StoreSearchApp(QWidget):
     # Helper: divider line
     # -----------------------------------------------------------------------
 
+    def _populate_county_filter(self):
+        self.county_filter.clear()
+        self.county_filter.addItem("全部縣市", None)
+        for county in self.catalog.counties():
+            self.county_filter.addItem(county, county)
+
     def _divider(self):
         line = QFrame()
         line.setObjectName("divider")
@@ -558,9 +722,24 @@ class StoreSearchApp(QWidget):
             with open(self.settings_path, "r", encoding="utf-8") as f:
                 settings = json.load(f)
                 self.preferences = settings.get("preference", [])
+                self.catalog_url = settings.get("catalog_url") or None
+                self.refresh_hours = settings.get("catalog_refresh_hours", DEFAULT_REFRESH_HOURS)
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"無法讀取設定文件: {e}")
 
+    def migrate_favorites(self):
+        """Give name-only favorites (older settings.json) their 門市編號."""
+        changed = False
+        for pref in self.preferences:
+            if "id" in pref:
+                continue
+            store = self.catalog.find(pref["name"], pref.get("county"))
+            if store:
+                pref.update(id=store[STORE_ID], county=store["縣市"])
+                changed = True
+        if changed:
+            self.save_settings()
+
     def save_settings(self):
         try:
             with open(self.settings_path, "r", encoding="utf-8") as f:
@@ -575,59 +754,65 @@ class StoreSearchApp(QWidget):
     # Favorites carousel logic  (identical to v1)
     # -----------------------------------------------------------------------
 
+    def current_store(self):
+        """The catalog row behind the current dropdown item, or None."""
+        return self.dropdown.currentData()
+
     def is_current_store_favorite(self):
-        if not self.dropdown.currentText():
-            return False
-        current_store = self.dropdown.currentText().split(" (")[0]
-        return any(pref["name"] == current_store for pref in self.preferences)
+        store = self.current_store()
+        return bool(store) and any(pref.get("id") == store[STORE_ID] for pref in self.preferences)
 
+    @traced()
     def update_favorite_button(self):
         is_fav = self.is_current_store_favorite()
-        self.favorite_button.setText("\u2605" if is_fav else "\u2606")   # ★ / ☆
-        self.favorite_button.setProperty("active", "true" if is_fav else "false")
-        # Re-polish so Qt picks up the dynamic property change
-        self.favorite_button.style().unpolish(self.favorite_button)
-        self.favorite_button.style().polish(self.favorite_button)
+        if is_fav != self._favorite_active:
+            self._favorite_active = is_fav
+            self.favorite_button.setText("\u2605" if is_fav else "\u2606")   # ★ / ☆
+            self.favorite_button.setProperty("active", "true" if is_fav else "false")
+            # Re-polish so Qt picks up the dynamic property change
+            self.favorite_button.style().unpolish(self.favorite_button)
+            self.favorite_button.style().polish(self.favorite_button)
 
         # Update hours display
-        current = self.dropdown.currentText()
-        if current:
-            store_name = current.split(" (")[0]
-            matched = next((s for s in self.store_list if s["門市名稱"] == store_name), None)
-            if matched:
-                hours = matched.get("營業時間", "").strip()
-                if hours:
-                    self.hours_label.setText(f"🕐  {hours}")
-                    self.hours_label.show()
-                    return
+        matched = self.current_store()
+        if matched:
+            hours = matched.get("營業時間", "").strip()
+            if hours:
+                self.hours_label.setText(f"🕐  {hours}")
+                self.hours_label.show()
+                return
         self.hours_label.hide()
 
     def toggle_favorite(self):
-        if not self.dropdown.currentText():
+        store = self.current_store()
+        if not store:
             return
-        current_store = self.dropdown.currentText().split(" (")[0]
+        current_store = store["門市名稱"]
         try:
             with open(self.settings_path, "r", encoding="utf-8") as f:
                 settings = json.load(f)
 
-            is_favorite = any(pref["name"] == current_store for pref in settings["preference"])
+            is_favorite = any(p.get("id") == store[STORE_ID] for p in settings["preference"])
 
             if is_favorite:
                 settings["preference"] = [
-                    p for p in settings["preference"] if p["name"] != current_store
+                    p for p in settings["preference"] if p.get("id") != store[STORE_ID]
                 ]
                 self.preferences = settings["preference"]
+                # The carousel may have been showing the last favorite.
+                self.current_setting_index = min(self.current_setting_index,
+                                                 max(len(self.preferences) - 1, 0))
                 self._set_status(f"已將 {current_store} 從收藏清單中移除", "")
             else:
-                settings["preference"].append({"name": current_store})
+                pref = {"id": store[STORE_ID], "name": current_store, "county": store["縣市"]}
+                settings["preference"].append(pref)
                 self.preferences = settings["preference"]
                 self._set_status(f"已將 {current_store} 加入收藏清單", "")
 
             with open(self.settings_path, "w", encoding="utf-8") as f:
                 json.dump(settings, f, ensure_ascii=False, indent=2)
 
-            self.update_setting_display()
-            self.update_favorite_button()
+            self.state.touch("favorites")
 
         except Exception as e:
             QMessageBox.critical(self, "錯誤", f"無法更新收藏設定: {e}")
@@ -636,16 +821,22 @@ class StoreSearchApp(QWidget):
         if not self.preferences:
             return
         self.current_setting_index = (self.current_setting_index + direction) % len(self.preferences)
-        self.update_setting_display()
+        self.state.touch("favorites")
         self.sync_search_with_preference()
 
-    def update_setting_display(self):
+    @traced()
+    def update_setting_display(self, matched=None):
         if self.preferences:
             pref = self.preferences[self.current_setting_index]
+            if matched is None:
+                matched = (self.catalog.get(pref["id"], pref.get("county")) if "id" in pref
+                           else self.catalog.find(pref["name"], pref.get("county")))
+            self.carousel_store = matched
+            if matched and (pref["name"], pref.get("county")) != (matched["門市名稱"], matched["縣市"]):
+                # Renamed (or moved) since it was saved; the ID still finds it.
+                pref.update(name=matched["門市名稱"], county=matched["縣市"])
+                self.save_settings()
             store_name = pref["name"]
-            matched = next(
-                (s for s in self.store_list if s["門市名稱"] == store_name), None
-            )
             addr = matched["地址"] if matched else "未找到地址"
             total = len(self.preferences)
 
@@ -667,6 +858,7 @@ class StoreSearchApp(QWidget):
             self.left_button.setEnabled(has_multiple)
             self.right_button.setEnabled(has_multiple)
         else:
+            self.carousel_store = None
             self.carousel_empty.show()
             self.carousel_store_name.hide()
             self.carousel_address.hide()
@@ -675,8 +867,17 @@ class StoreSearchApp(QWidget):
             self.left_button.setEnabled(False)
             self.right_button.setEnabled(False)
 
+    def select_favorite_county(self):
+        """Start the county filter on the current favorite's county."""
+        if not self.preferences:
+            return
+        county = self.preferences[self.current_setting_index].get("county")
+        idx = self.county_filter.findData(county) if county else -1
+        self.county_filter.setCurrentIndex(max(idx, 0))
+
     def sync_search_with_preference(self):
         if self.preferences:
+            self.select_favorite_county()
             pref = self.preferences[self.current_setting_index]
             self.search_field.setText(pref["name"])
 
@@ -684,33 +885,173 @@ class StoreSearchApp(QWidget):
     # Dropdown  (identical logic to v1)
     # -----------------------------------------------------------------------
 
+    @traced()
+    def update_district_filter(self):
+        """List the selected county's districts, with store counts from the address index."""
+        county = self.county_filter.currentData()
+        current = self.district_filter.currentData()
+        self.district_filter.blockSignals(True)
+        self.district_filter.clear()
+        self.district_filter.addItem("全部區域", None)
+        if county:
+            for name, count in self.catalog.address_index(county).children(county):
+                self.district_filter.addItem(f"{name or '其他'} ({count})", name)
+        idx = self.district_filter.findData(current) if current is not None else -1
+        self.district_filter.setCurrentIndex(max(idx, 0))
+        self.district_filter.blockSignals(False)
+        self.district_filter.setVisible(bool(county))
+        self.state.set(district=self.district_filter.currentData())
+
+    @traced()
     def update_dropdown(self):
         search_text = self.search_field.text().strip().lower()
-        if search_text:
-            filtered = [
-                s for s in self.store_list
-                if search_text in s["門市名稱"].lower() or search_text in s["地址"].lower()
-            ]
+        county = self.county_filter.currentData()
+        district = self.district_filter.currentData() if county else None
+        if search_text or county:
+            filtered = self.catalog.search(search_text, county, district)
         else:
-            filtered = self.store_list
+            # Listing everything would page in every shard; wait for a
+            # county or a query instead.
+            filtered = []
+
+        current_id = self.dropdown.currentData(ID_ROLE)
+        self._fill_dropdown(filtered)
+
+        # Keyed on 門市編號, so the selection survives a catalog refresh that
+        # renamed the store or edited its address.
+        idx = self.dropdown.findData(current_id, ID_ROLE) if current_id is not None else -1
+        if idx < 0 and self.dropdown.count():
+            idx = 0         # the placeholder would otherwise leave nothing selected
+        if idx >= 0:
+            self.dropdown.setCurrentIndex(idx)
+        self.state.set(selection=self.current_store())
 
-        current_text = self.dropdown.currentText()
+    def _fill_dropdown(self, stores):
         self.dropdown.blockSignals(True)
         self.dropdown.clear()
-        for store in filtered:
-            self.dropdown.addItem(f"{store['門市名稱']} ({store['地址']})")
+        for i, store in enumerate(stores):
+            self.dropdown.addItem(f"{store['門市名稱']} ({store['地址']})", store)
+            self.dropdown.setItemData(i, store.get(STORE_ID), ID_ROLE)
         self.dropdown.blockSignals(False)
 
-        idx = self.dropdown.findText(current_text)
+    # -----------------------------------------------------------------------
+    # Warm start
+    # -----------------------------------------------------------------------
+
+    def restore_session(self, snapshot):
+        """Show the last session's query, results and selection without touching the catalog."""
+        if self.preferences:
+            self.current_setting_index = min(
+                snapshot.get("setting_index", 0), len(self.preferences) - 1
+            )
+        # Setting the widgets marks query/county/selection dirty, so the live
+        # lookups follow on the next turn.
+        self.search_field.setText(snapshot.get("query", ""))
+        county = snapshot.get("county")
+        idx = self.county_filter.findData(county) if county else -1
+        self.county_filter.setCurrentIndex(max(idx, 0))
+
+        self._fill_dropdown(snapshot["results"])
+        idx = selected_index(snapshot)
         if idx >= 0:
             self.dropdown.setCurrentIndex(idx)
 
+        favorite = snapshot.get("favorite")
+        if (self.preferences and favorite
+                and favorite.get(STORE_ID) == self.preferences[self.current_setting_index].get("id")):
+            self.update_setting_display(favorite)
+        else:
+            self.update_setting_display()
         self.update_favorite_button()
+        self.state.touch("favorites")
+
+    def save_snapshot(self):
+        results = [self.dropdown.itemData(i) for i in range(self.dropdown.count())]
+        snapshot = take_snapshot(
+            self.catalog.manifest.get("version"),
+            self.search_field.text(),
+            self.county_filter.currentData(),
+            self.current_setting_index,
+            self.current_store(),
+            self.carousel_store,
+            results,
+        )
+        try:
+            save_session(self.session_path, snapshot)
+        except OSError as e:
+            print(f"Could not save session: {e}")
+
+    def closeEvent(self, event):
+        self.save_snapshot()
+        if self.resident_handler is not None:
+            # Resident mode: closing the window only hides it; quit from the tray.
+            event.ignore()
+            self.hide()
+            return
+        super().closeEvent(event)
+
+    # -----------------------------------------------------------------------
+    # Resident mode
+    # -----------------------------------------------------------------------
+
+    def start_resident(self, app):
+        """Serve client commands and sit in the tray instead of exiting on close."""
+        self.resident_handler = CommandHandler(
+            self.catalog, self.settings_path, self.wlan, self.verifier,
+            self.bssid_index, self.connect_stats,
+        )
+        self.resident_server = ResidentServer(self.resident_handler)
+        self.resident_server.start()
+
+        app.setQuitOnLastWindowClosed(False)
+        app.aboutToQuit.connect(self.resident_server.close)
+        self.tray = QSystemTrayIcon(self.style().standardIcon(QStyle.SP_DriveNetIcon), self)
+        self.tray.setToolTip("LouisaPro")
+        menu = QMenu()
+        menu.addAction("開啟視窗", self.show_from_tray)
+        menu.addSeparator()
+        menu.addAction("結束", app.quit)
+        self.tray.setContextMenu(menu)
+        self.tray.activated.connect(
+            lambda reason: reason == QSystemTrayIcon.Trigger and self.show_from_tray()
+        )
+        self.tray.show()
+
+    def show_from_tray(self):
+        self.show()
+        self.raise_()
+        self.activateWindow()
+
+    # -----------------------------------------------------------------------
+    # Catalog refresh
+    # -----------------------------------------------------------------------
+
+    def check_catalog_update(self):
+        if self.refresher:
+            self.refresher.check(
+                resident=self.catalog.resident_shards(),
+                max_resident=self.catalog.max_resident,
+            )
+
+    @traced()
+    def swap_catalog(self, new_catalog):
+        """Swap in a refreshed catalog, keeping the county, query and selection."""
+        county = self.county_filter.currentData()
+        self.catalog = new_catalog
+        if self.resident_handler is not None:
+            self.resident_handler.set_catalog(new_catalog)
+
+        self._populate_county_filter()
+        idx = self.county_filter.findData(county) if county else -1
+        self.county_filter.setCurrentIndex(max(idx, 0))
+        self.state.touch("catalog")
+        self._set_status(f"門市資料已更新（{self.catalog.count()} 間）", "")
 
     # -----------------------------------------------------------------------
     # Confirm / WiFi update  (identical logic to v1)
     # -----------------------------------------------------------------------
 
+    @traced()
     def confirm_selection(self):
         selected = self.dropdown.currentText()
         if not selected:
@@ -718,70 +1059,28 @@ class StoreSearchApp(QWidget):
             return
 
         store_name = selected.split(" (")[0]
-        matched = next((s for s in self.store_list if s["門市名稱"] == store_name), None)
+        matched = self.current_store()
         if matched:
-            phone = matched["電話"].replace("-", "")
-            if len(phone) == 10:
-                new_password = phone[-8:]
-            elif len(phone) == 9:
-                new_password = phone[-9:]
-            else:
-                new_password = None
-            self.update_wifi_password("LouisaCoffee", new_password)
+            if self.fallback_check.isChecked():
+                self.apply_candidates(matched)
+                return
+            new_password = derive_password(matched["電話"])
+            if self.update_wifi_password(SSID, new_password):
+                self._set_status("密碼已套用，正在確認連線…", new_password)
+                self.confirm_btn.setEnabled(False)
+                threading.Thread(
+                    target=self._verify_connection, args=(matched, new_password), daemon=True
+                ).start()
         else:
             self._set_status(f"未找到 {store_name} 的電話號碼", "", state="error")
 
+    @traced()
     def update_wifi_password(self, network_name, new_password):
         try:
-            subprocess.run(
-                ['netsh', 'wlan', 'delete', 'profile', network_name],
-                check=True
-            )
-
-            profile_template = f"""<?xml version="1.0"?>
-<WLANProfile xmlns="http://www.microsoft.com/networking/WLAN/profile/v1">
-    <name>{network_name}</name>
-    <SSIDConfig>
-        <SSID>
-            <name>{network_name}</name>
-        </SSID>
-    </SSIDConfig>
-    <connectionType>ESS</connectionType>
-    <connectionMode>auto</connectionMode>
-    <MSM>
-        <security>
-            <authEncryption>
-                <authentication>WPA2PSK</authentication>
-                <encryption>AES</encryption>
-                <useOneX>false</useOneX>
-            </authEncryption>
-            <sharedKey>
-                <keyType>passPhrase</keyType>
-                <protected>false</protected>
-                <keyMaterial>{new_password}</keyMaterial>
-            </sharedKey>
-        </security>
-    </MSM>
-</WLANProfile>"""
-
-            with tempfile.NamedTemporaryFile(
-                mode='w', suffix='.xml', delete=False
-            ) as tmp:
-                tmp_name = tmp.name
-                tmp.write(profile_template)
-
-            try:
-                subprocess.run(
-                    ['netsh', 'wlan', 'add', 'profile', f'filename="{tmp_name}"'],
-                    check=True
-                )
-                self._set_status("WiFi 密碼已成功套用", new_password, state="success")
-                print(f"Successfully updated password for network: {network_name}")
-            finally:
-                try:
-                    os.unlink(tmp_name)
-                except Exception as e:
-                    print(f"Warning: Could not delete temporary file: {e}")
+            self.wlan.apply_profile(network_name, new_password)
+            self._set_status("WiFi 密碼已成功套用", new_password, state="success")
+            print(f"Successfully updated password for network: {network_name}")
+            return True
 
         except subprocess.CalledProcessError as e:
             self._set_status("netsh 指令執行失敗", "", state="error")
@@ -789,6 +1088,109 @@ class StoreSearchApp(QWidget):
         except Exception as e:
             self._set_status(f"發生錯誤: {e}", "", state="error")
             print(f"An error occurred: {e}")
+        return False
+
+    # -----------------------------------------------------------------------
+    # Connection verification
+    # -----------------------------------------------------------------------
+
+    def _verify_connection(self, store, password):
+        """Worker thread: connect and poll the interface until it settles."""
+        try:
+            self.wlan.connect(SSID)
+            result = self.verifier.verify(SSID, VERIFY_TIMEOUT)
+        except Exception as e:
+            print(f"Connection check failed: {e}")
+            result = VerifyResult("error", 0.0, "")
+        self.apply_bridge.verified.emit(store, password, result)
+
+    def _on_verified(self, store, password, result):
+        self.confirm_btn.setEnabled(True)
+        self.connect_stats.record(store, result.status, result.seconds)
+        if result.status == "connected":
+            self._set_status(f"已連線（{result.seconds:.1f} 秒）", password, state="success")
+            threading.Thread(target=self._learn_bssids, args=(store,), daemon=True).start()
+        elif result.status == "auth_failed":
+            self._set_status("密碼錯誤，無法連線", password, state="error")
+        elif result.status == "timeout":
+            self._set_status(f"連線逾時（{VERIFY_TIMEOUT:.0f} 秒）", password, state="error")
+        else:
+            self._set_status("無法確認連線狀態", password, state="error")
+
+    # -----------------------------------------------------------------------
+    # Candidate fallback chain
+    # -----------------------------------------------------------------------
+
+    def apply_candidates(self, store):
+        candidates = rank_candidates(self.catalog, store)
+        if not candidates:
+            self._set_status(f"無法由 {store['門市名稱']} 的電話推算密碼", "", state="error")
+            return
+        self.confirm_btn.setEnabled(False)
+        self._chain_total = len(candidates)
+        threading.Thread(target=self._run_chain, args=(candidates,), daemon=True).start()
+
+    def _run_chain(self, candidates):
+        """Worker thread: apply → connect → verify each candidate in turn."""
+        result = apply_with_fallback(
+            self.wlan, self.verifier, candidates, timeout=VERIFY_TIMEOUT,
+            on_attempt=self.apply_bridge.attempt.emit,
+        )
+        self.apply_bridge.done.emit(result)
+
+    def _on_chain_attempt(self, index, store):
+        self._set_status(
+            f"嘗試 {store['門市名稱']} 的密碼（{index + 1} / {self._chain_total}）", ""
+        )
+
+    def _on_chain_done(self, result):
+        self.confirm_btn.setEnabled(True)
+        for attempt in result.attempts:
+            self.connect_stats.record(attempt.store, attempt.status, attempt.seconds)
+        if result.status == "connected":
+            self._set_status(
+                f"已連線：{result.store['門市名稱']}（{result.seconds:.1f} 秒，"
+                f"第 {len(result.attempts)} 個候選）",
+                result.password, state="success",
+            )
+            threading.Thread(target=self._learn_bssids, args=(result.store,), daemon=True).start()
+        else:
+            tried = "、".join(a.store["門市名稱"] for a in result.attempts)
+            self._set_status(f"所有候選密碼都無法連線（{tried}）", "", state="error")
+
+    # -----------------------------------------------------------------------
+    # Store detection (BSSID index)
+    # -----------------------------------------------------------------------
+
+    def _learn_bssids(self, store):
+        """Worker thread: remember which access points were visible at ``store``."""
+        try:
+            self.bssid_index.learn(store, self.wlan.scan())
+        except Exception as e:
+            print(f"Could not record visible access points: {e}")
+
+    def _detect_store(self):
+        """Worker thread: match the visible access points against the index."""
+        try:
+            match = self.bssid_index.match(self.wlan.scan())
+        except Exception as e:
+            print(f"Access point scan failed: {e}")
+            return
+        if match:
+            self.detect_bridge.detected.emit(match)
+
+    def preselect_detected_store(self, match):
+        info, score = match
+        if self.search_field.text():
+            return          # the user already started searching
+        store = (self.catalog.get(info["id"], info.get("county")) if "id" in info
+                 else self.catalog.find(info["name"], info.get("county")))
+        if not store:
+            return
+        idx = self.county_filter.findData(store["縣市"])
+        self.county_filter.setCurrentIndex(max(idx, 0))
+        self.search_field.setText(store["門市名稱"])
+        self._set_status(f"偵測到附近門市：{store['門市名稱']}（{score:.0%}）", "")
 
     # -----------------------------------------------------------------------
     # Status area helper
@@ -796,10 +1198,15 @@ class StoreSearchApp(QWidget):
 
     def _set_status(self, message: str, password: str = "", state: str = ""):
         """Update the status card.  state = '' | 'success' | 'error'"""
+        self.state.set(status=(message, password, state))
+
+    def render_status(self):
+        message, password, state = self.state["status"]
         self.status_label.setText(message)
-        self.status_label.setProperty("state", state)
-        self.status_label.style().unpolish(self.status_label)
-        self.status_label.style().polish(self.status_label)
+        if self.status_label.property("state") != state:
+            self.status_label.setProperty("state", state)
+            self.status_label.style().unpolish(self.status_label)
+            self.status_label.style().polish(self.status_label)
 
         if password:
             self.status_passwd.setText(password)
@@ -813,8 +1220,28 @@ class StoreSearchApp(QWidget):
 # Entry point
 # ---------------------------------------------------------------------------
 
+class TracingApplication(QApplication):
+    """QApplication that records a span per dispatched event (LOUISA_TRACE)."""
+
+    _event_names = {
+        int(v): f"QEvent.{k}" for k, v in vars(QEvent).items() if isinstance(v, QEvent.Type)
+    }
+
+    def notify(self, receiver, event):
+        etype = int(event.type())       # read before dispatch may delete the event
+        start = time.perf_counter()
+        try:
+            return super().notify(receiver, event)
+        finally:
+            name = self._event_names.get(etype, f"QEvent.{etype}")
+            # Every event feeds the latency summary; only slow ones become
+            # individual trace events so the file stays small.
+            tracing.TRACER.record(name, start, time.perf_counter(),
+                                  cat="qt", keep_event=False)
+
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    app = (TracingApplication if tracing.enabled() else QApplication)(sys.argv)
     app.setStyleSheet(APP_QSS)
 
     # Optional: attempt to load Inter if it's installed on the system
@@ -823,5 +1250,12 @@ if __name__ == "__main__":
     app.setFont(font)
 
     window = StoreSearchApp()
-    window.show()
+    if "--resident" in sys.argv[1:]:
+        try:
+            window.start_resident(app)
+        except ResidentError as e:
+            QMessageBox.information(window, "LouisaPro", f"常駐程式已在執行中\n{e}")
+            sys.exit(0)
+    else:
+        window.show()
     sys.exit(app.exec_())
@@ -0,0 +1,221 @@
+"""In-process stand-in for ``netsh wlan``, for tests and benchmarks off Windows.
+
+``NetshSimulator`` replaces ``subprocess.run`` in ``wlan.NetshBackend``::
+
+    sim = NetshSimulator(password_for=lambda ssid: "24260083", latency=0.002)
+    backend = NetshBackend(run=sim)
+
+It keeps the saved profiles and one interface, records every invocation,
+validates the WLANProfile XML handed to ``add profile`` the way Windows would
+reject it, and after ``connect`` walks the interface through associating →
+authenticating → connected (or back to disconnected when the key is wrong).
+``latency``/``jitter`` delay every call and ``failures`` makes a command fail
+with the given probability, e.g. ``{"add": 0.01, "connect": 0.02}``.
+"""
+import random
+import subprocess
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+NAMESPACE = "{http://www.microsoft.com/networking/WLAN/profile/v1}"
+AUTHENTICATIONS = ("WPA2PSK", "WPA3SAE", "WPAPSK")
+ENCRYPTIONS = ("AES", "TKIP")
+
+Invocation = namedtuple("Invocation", "args returncode started seconds")
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def _text(root, path):
+    node = root.find("/".join(NAMESPACE + part for part in path.split("/")))
+    return node.text.strip() if node is not None and node.text else None
+
+
+def validate_profile(xml_text):
+    """Check a WLANProfile document; return ``(profile name, key)`` or raise ProfileError."""
+    try:
+        root = ET.fromstring(xml_text.encode("utf-8"))
+    except ET.ParseError as e:
+        raise ProfileError(f"profile is not well-formed XML: {e}") from e
+    if root.tag != NAMESPACE + "WLANProfile":
+        raise ProfileError(f"unexpected root element {root.tag}")
+    name = _text(root, "name")
+    if not name:
+        raise ProfileError("profile has no <name>")
+    ssid = _text(root, "SSIDConfig/SSID/name")
+    if ssid != name:
+        raise ProfileError(f"SSID {ssid!r} does not match profile name {name!r}")
+    security = "MSM/security/"
+    auth = _text(root, security + "authEncryption/authentication")
+    if auth not in AUTHENTICATIONS:
+        raise ProfileError(f"unsupported authentication {auth!r}")
+    encryption = _text(root, security + "authEncryption/encryption")
+    if encryption not in ENCRYPTIONS:
+        raise ProfileError(f"unsupported encryption {encryption!r}")
+    if _text(root, security + "sharedKey/keyType") != "passPhrase":
+        raise ProfileError("keyType must be passPhrase")
+    key = _text(root, security + "sharedKey/keyMaterial")
+    if key is None or not 8 <= len(key) <= 63 or not all(" " <= c <= "~" for c in key):
+        raise ProfileError(f"passphrase must be 8-63 printable ASCII characters, got {key!r}")
+    return name, key
+
+
+class NetshSimulator:
+    def __init__(self, password_for=None, latency=0.0, jitter=0.0, failures=None,
+                 auth_seconds=0.01, connect_seconds=0.03, networks=None,
+                 seed=None, clock=time.monotonic, sleep=time.sleep):
+        """``password_for(ssid)`` is the key the access point accepts (None: any key)."""
+        self.password_for = password_for
+        self.latency = latency
+        self.jitter = jitter
+        self.failures = dict(failures or {})
+        self.auth_seconds = auth_seconds
+        self.connect_seconds = connect_seconds
+        self.networks = networks if networks is not None else [
+            {"ssid": "LouisaCoffee", "bssid": "a4:2b:8c:10:20:31", "signal": 88},
+            {"ssid": "LouisaCoffee", "bssid": "a4:2b:8c:10:20:32", "signal": 61},
+        ]
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = random.Random(seed)
+        self.profiles = {}              # name -> (xml, key)
+        self.invocations = []
+        self.injected = {}              # command -> injected failure count
+        self._attempt = None            # (ssid, key, connect time)
+        self._lock = threading.Lock()
+
+    # -----------------------------------------------------------------------
+    # subprocess.run interface
+    # -----------------------------------------------------------------------
+
+    def __call__(self, args, check=False, capture_output=False, text=False, **kwargs):
+        args = list(args)
+        if args[:2] != ["netsh", "wlan"]:
+            raise FileNotFoundError(f"simulator only handles 'netsh wlan', got {args[:2]}")
+        started = self.clock()
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            self.sleep(delay)
+        command = args[2] if len(args) > 2 else ""
+        with self._lock:
+            if self.rng.random() < self.failures.get(command, 0.0):
+                self.injected[command] = self.injected.get(command, 0) + 1
+                returncode, output = 1, f"The requested operation failed (injected {command} failure).\n"
+            else:
+                handler = getattr(self, "_" + command, None)
+                returncode, output = (handler(args[3:]) if handler
+                                      else (1, f"The following command was not found: {' '.join(args[2:])}.\n"))
+            self.invocations.append(Invocation(tuple(args), returncode, started, self.clock() - started))
+        if check and returncode:
+            raise subprocess.CalledProcessError(returncode, args, output=output, stderr="")
+        return subprocess.CompletedProcess(args, returncode, stdout=output, stderr="")
+
+    # -----------------------------------------------------------------------
+    # Commands
+    # -----------------------------------------------------------------------
+
+    @staticmethod
+    def _arg(rest, tag):
+        """``name=X`` / ``filename="X"`` or the bare positional form."""
+        for token in rest:
+            if token.startswith(tag + "="):
+                return token.split("=", 1)[1].strip('"')
+        bare = [t for t in rest if "=" not in t]
+        return bare[-1].strip('"') if bare else None
+
+    def _delete(self, rest):
+        name = self._arg(rest[1:], "name")
+        if rest[:1] != ["profile"] or not name:
+            return 1, "Usage: delete profile name=<string>\n"
+        if self.profiles.pop(name, None) is None:
+            return 1, f'Profile "{name}" is not found on any interface.\n'
+        return 0, f'Profile "{name}" is deleted from interface "Wi-Fi".\n'
+
+    def _add(self, rest):
+        path = self._arg(rest[1:], "filename")
+        if rest[:1] != ["profile"] or not path:
+            return 1, "Usage: add profile filename=<string>\n"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                xml_text = f.read()
+        except OSError:
+            return 1, "The system cannot find the file specified.\n"
+        try:
+            name, key = validate_profile(xml_text)
+        except ProfileError as e:
+            return 1, f"The profile format is invalid: {e}\n"
+        self.profiles[name] = (xml_text, key)
+        return 0, f"Profile {name} is added on interface Wi-Fi.\n"
+
+    def _connect(self, rest):
+        name = self._arg(rest, "name")
+        if name not in self.profiles:
+            return 1, f'There is no profile "{name}" assigned to the specified interface.\n'
+        self._attempt = (name, self.profiles[name][1], self.clock())
+        return 0, "Connection request was completed successfully.\n"
+
+    def _show(self, rest):
+        if rest[:1] == ["interfaces"]:
+            return 0, self._render_interface()
+        if rest[:1] == ["networks"]:
+            return 0, self._render_networks()
+        return 1, f"The following command was not found: show {' '.join(rest)}.\n"
+
+    # -----------------------------------------------------------------------
+    # Interface model / output
+    # -----------------------------------------------------------------------
+
+    def interface_state(self):
+        """``(state, ssid, bssid)`` of the simulated interface right now."""
+        if self._attempt is None:
+            return "disconnected", "", ""
+        ssid, key, t0 = self._attempt
+        elapsed = self.clock() - t0
+        if elapsed < self.auth_seconds:
+            return "associating", ssid, ""
+        expected = self.password_for(ssid) if self.password_for else None
+        if expected is not None and key != expected:
+            return ("authenticating", ssid, "") if elapsed < 2 * self.auth_seconds \
+                else ("disconnected", "", "")
+        if elapsed < self.connect_seconds:
+            return "authenticating", ssid, ""
+        return "connected", ssid, self.networks[0]["bssid"] if self.networks else ""
+
+    def _render_interface(self):
+        state, ssid, bssid = self.interface_state()
+        lines = ["", "There is 1 interface on the system:", "",
+                 "    Name                   : Wi-Fi",
+                 "    Description            : Simulated Wireless Adapter",
+                 f"    State                  : {state}"]
+        if ssid:
+            lines.append(f"    SSID                   : {ssid}")
+        if bssid:
+            lines.append(f"    BSSID                  : {bssid}")
+        return "\n".join(lines) + "\n"
+
+    def _render_networks(self):
+        lines = ["", "Interface name : Wi-Fi",
+                 f"There are {len({n['ssid'] for n in self.networks})} networks currently visible.", ""]
+        by_ssid = {}
+        for n in self.networks:
+            by_ssid.setdefault(n["ssid"], []).append(n)
+        for i, (ssid, aps) in enumerate(by_ssid.items(), 1):
+            lines += [f"SSID {i} : {ssid}", "    Network type            : Infrastructure",
+                      "    Authentication          : WPA2-Personal",
+                      "    Encryption              : CCMP"]
+            for j, ap in enumerate(aps, 1):
+                lines += [f"    BSSID {j}                 : {ap['bssid']}",
+                          f"         Signal             : {ap['signal']}%"]
+            lines.append("")
+        return "\n".join(lines)
+
+    # -----------------------------------------------------------------------
+    # Inspection
+    # -----------------------------------------------------------------------
+
+    def calls(self, command=None):
+        return [i for i in self.invocations if command is None or i.args[2] == command]
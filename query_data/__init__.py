@@ -0,0 +1 @@
+"""Catalog format shared by the scraper (``scrape_all.py``) and the apps."""
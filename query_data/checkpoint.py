@@ -0,0 +1,70 @@
+"""Per-county checkpoints, so an interrupted scrape can be resumed.
+
+While ``scrape_all.py`` runs, every county's parsed rows are written to the
+run directory as soon as they arrive::
+
+    run.json          format and the county list of the run
+    county_NN.json    {"county": ..., "rows": [...]}, NN = index in COUNTIES
+
+``scrape_all.py --resume`` loads the finished counties from there, fetches
+only the rest and finalizes ``data.csv`` from both.  A run that completes
+removes the directory; a fresh run without ``--resume`` clears it first.
+"""
+import json
+import os
+import shutil
+
+RUN_NAME = "run.json"
+RUN_FORMAT = 1
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class RunCheckpoint:
+    def __init__(self, run_dir, counties):
+        self.run_dir = run_dir
+        self.counties = list(counties)
+
+    def _path(self, county):
+        return os.path.join(self.run_dir, f"county_{self.counties.index(county):02d}.json")
+
+    def start(self, resume=False):
+        """Begin a run; returns ``{county: rows}`` already finished (``resume`` only)."""
+        done = self._load() if resume else {}
+        if not done:
+            self.clear()
+            os.makedirs(self.run_dir, exist_ok=True)
+            _write_json(os.path.join(self.run_dir, RUN_NAME),
+                        {"format": RUN_FORMAT, "counties": self.counties})
+        return done
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.run_dir, RUN_NAME), "r", encoding="utf-8") as f:
+                run = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if run.get("format") != RUN_FORMAT or run.get("counties") != self.counties:
+            print(f"Ignoring checkpoints in {self.run_dir}: they are from a different county list")
+            return {}
+        done = {}
+        for county in self.counties:
+            try:
+                with open(self._path(county), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("county") == county:
+                done[county] = data["rows"]
+        return done
+
+    def save(self, county, rows):
+        _write_json(self._path(county), {"county": county, "rows": rows})
+
+    def clear(self):
+        shutil.rmtree(self.run_dir, ignore_errors=True)
@@ -0,0 +1,197 @@
+"""Versioned catalog deltas.
+
+Every published catalog carries a ``version`` and an order-independent
+``checksum`` in its manifest.  When a new scrape differs from the previous
+one, ``publish`` also writes ``deltas/delta_<from>_<to>.json`` holding only
+the added, removed and changed stores.  Each delta names the store identity
+it is keyed on (``"key"``, one of ``KEY_FUNCTIONS``; deltas without it are
+keyed by ``store_key``), and ``apply_delta`` matches rows the same way.
+``publish`` keys on the stable 門市編號 (``"id"``) whenever both catalogs
+carry it, so a renamed or re-addressed store is one changed row; catalogs
+from before store IDs fall back to ``"name_address"``.  Each delta also
+records the columns (``"fields"``) its checksums were taken over, so a chain
+that spans a schema change applies step by step.  A client at
+version N applies the chain N → N+1 → … → latest and compares checksums;
+any mismatch means it has drifted and must fetch the full snapshot instead.
+"""
+import hashlib
+import json
+import os
+
+from . import shards
+
+DELTA_DIR = "deltas"
+MAX_DELTAS = 20
+
+
+class DeltaError(Exception):
+    pass
+
+
+def store_key(row: dict) -> str:
+    """Stable identity of a store: the same (name, address) pair the scraper dedups on."""
+    raw = f"{row['門市名稱']}\x1f{row['地址']}".encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+def id_key(row: dict) -> str:
+    # str(): 門市編號 is an int in scraped rows and a string in rows read back.
+    return str(row[shards.STORE_ID])
+
+
+# How a delta identifies a store.  ``name_address`` can't follow a rename or
+# an address edit (it shows up as remove + add).
+KEY_FUNCTIONS = {
+    "id": id_key,
+    "name_address": store_key,
+}
+DEFAULT_KEY = "name_address"
+
+
+def delta_key(old_rows, new_rows) -> str:
+    """``"id"`` when every store on both sides has a 門市編號, else ``DEFAULT_KEY``."""
+    if all(r.get(shards.STORE_ID) for rows in (old_rows, new_rows) for r in rows):
+        return "id"
+    return DEFAULT_KEY
+
+
+def delta_fields(delta: dict, default=shards.FIELDNAMES) -> list[str]:
+    """Columns ``delta``'s checksums cover.
+
+    Deltas written before ``"fields"`` was recorded hold whole rows of the
+    catalog they lead to, so their columns are read off those rows.
+    """
+    if "fields" in delta:
+        return delta["fields"]
+    for row in delta["changed"] or delta["added"]:
+        return list(row)
+    return list(default)
+
+
+def _key_function(key):
+    try:
+        return KEY_FUNCTIONS[key]
+    except KeyError:
+        raise DeltaError(f"unknown delta key {key!r}") from None
+
+
+def _record(row: dict, fieldnames: list[str]) -> str:
+    # str(): 門市編號 is an int in scraped rows and a string in rows read back.
+    return "\x1f".join(str(row.get(f, "") or "") for f in fieldnames)
+
+
+def catalog_checksum(rows: list[dict], fieldnames: list[str] = shards.FIELDNAMES) -> str:
+    lines = sorted(f"{store_key(r)}\t{_record(r, fieldnames)}" for r in rows)
+    return hashlib.sha256("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def compute_delta(old_rows, new_rows, from_version, to_version,
+                  fieldnames=shards.FIELDNAMES, key=DEFAULT_KEY) -> dict:
+    row_key = _key_function(key)
+    old = {row_key(r): r for r in old_rows}
+    new = {row_key(r): r for r in new_rows}
+    keep = lambda r: {f: r.get(f, "") for f in fieldnames}  # noqa: E731
+    return {
+        "format": shards.FORMAT_VERSION,
+        "key": key,
+        "fields": list(fieldnames),
+        "from": from_version,
+        "to": to_version,
+        "base_checksum": catalog_checksum(old_rows, fieldnames),
+        "checksum": catalog_checksum(new_rows, fieldnames),
+        "added": [keep(r) for k, r in new.items() if k not in old],
+        "removed": [k for k in old if k not in new],
+        "changed": [
+            keep(r) for k, r in new.items()
+            if k in old and _record(r, fieldnames) != _record(old[k], fieldnames)
+        ],
+    }
+
+
+def is_empty(delta: dict) -> bool:
+    return not (delta["added"] or delta["removed"] or delta["changed"])
+
+
+def apply_delta(rows, delta, fieldnames=shards.FIELDNAMES):
+    """Return ``(new_rows, touched_counties)``; raise DeltaError on drift.
+
+    The checksums are taken over the delta's own ``delta_fields``;
+    ``fieldnames`` only stands in for a legacy delta that removes stores and
+    nothing else.
+    """
+    fieldnames = delta_fields(delta, fieldnames)
+    if catalog_checksum(rows, fieldnames) != delta["base_checksum"]:
+        raise DeltaError(f"base checksum mismatch applying {delta['from']} -> {delta['to']}")
+
+    row_key = _key_function(delta.get("key", DEFAULT_KEY))
+    by_key = {row_key(r): r for r in rows}
+    touched = set()
+    for key in delta["removed"]:
+        row = by_key.pop(key, None)
+        if row is None:
+            raise DeltaError(f"removed store {key} not in catalog")
+        touched.add(row["縣市"])
+    for row in delta["changed"]:
+        key = row_key(row)
+        old = by_key.get(key)
+        if old is None:
+            raise DeltaError(f"changed store {key} not in catalog")
+        touched.update((old["縣市"], row["縣市"]))
+        by_key[key] = row
+    for row in delta["added"]:
+        by_key[row_key(row)] = row
+        touched.add(row["縣市"])
+
+    new_rows = list(by_key.values())
+    if catalog_checksum(new_rows, fieldnames) != delta["checksum"]:
+        raise DeltaError(f"checksum mismatch after applying {delta['from']} -> {delta['to']}")
+    return new_rows, touched
+
+
+def delta_filename(from_version: int, to_version: int) -> str:
+    return f"{DELTA_DIR}/delta_{from_version:05d}_{to_version:05d}.json"
+
+
+def read_published(shard_dir):
+    """``(manifest, rows)`` of the catalog last published to ``shard_dir``."""
+    try:
+        manifest = shards.read_manifest(shard_dir)
+    except (OSError, ValueError):
+        return None, []
+    rows = [r for e in manifest["shards"] for r in shards.read_shard(shard_dir, e)]
+    return manifest, rows
+
+
+def publish(rows: list[dict], shard_dir: str, fieldnames: list[str] = shards.FIELDNAMES) -> dict:
+    """Write ``rows`` as the next catalog version, with a delta from the previous one."""
+    previous, old_rows = read_published(shard_dir)
+    checksum = catalog_checksum(rows, fieldnames)
+    if previous and previous.get("checksum") == checksum:
+        return previous
+
+    version = (previous or {}).get("version", 0) + 1
+    deltas = list((previous or {}).get("deltas", []))
+    if previous and "version" in previous:
+        delta = compute_delta(old_rows, rows, previous["version"], version, fieldnames,
+                              key=delta_key(old_rows, rows))
+        data = json.dumps(delta, ensure_ascii=False).encode("utf-8")
+        name = delta_filename(previous["version"], version)
+        os.makedirs(os.path.join(shard_dir, DELTA_DIR), exist_ok=True)
+        shards._write_atomic(os.path.join(shard_dir, name), data)
+        deltas.append({
+            "from": previous["version"], "to": version, "file": name,
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+
+    for stale in deltas[:-MAX_DELTAS]:
+        try:
+            os.unlink(os.path.join(shard_dir, stale["file"]))
+        except OSError:
+            pass
+    deltas = deltas[-MAX_DELTAS:]
+
+    return shards.write_shards(rows, shard_dir, fieldnames, extra={
+        "version": version,
+        "checksum": checksum,
+        "deltas": deltas,
+    })
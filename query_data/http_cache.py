@@ -0,0 +1,141 @@
+"""Response cache and record/replay for the county endpoint.
+
+* ``ResponseCache`` wraps ``fetch_county`` and keeps each county's HTML on
+  disk for ``ttl`` seconds, so repeated runs while tweaking ``parse_html``
+  don't hit the site again.
+* ``FixtureRecorder`` saves every fetched response as a fixture
+  (``index.json`` + one ``county_NN.html`` per county).
+* ``ReplayAdapter`` is a requests transport adapter that answers the
+  endpoint's POSTs from those fixtures, so the whole pipeline, including
+  ``fetch_county`` itself, runs offline.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from urllib.parse import parse_qs
+
+import requests
+from requests.adapters import BaseAdapter
+
+INDEX_NAME = "index.json"
+
+
+def _write_text(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ResponseCache:
+    def __init__(self, cache_dir, ttl):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()       # counters are bumped from fetch threads
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, county):
+        key = hashlib.sha1(county.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}.html")
+
+    def get(self, county):
+        path = self._path(county)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, county, html):
+        _write_text(self._path(county), html)
+
+    def wrap(self, fetch):
+        def cached_fetch(session, county):
+            html = self.get(county)
+            if html is not None:
+                with self._lock:
+                    self.hits += 1
+                return html
+            with self._lock:
+                self.misses += 1
+            html = fetch(session, county)
+            self.put(county, html)
+            return html
+        return cached_fetch
+
+
+class FixtureRecorder:
+    def __init__(self, fixture_dir):
+        self.fixture_dir = fixture_dir
+        os.makedirs(fixture_dir, exist_ok=True)
+        self.index = load_index(fixture_dir)
+        self._lock = threading.Lock()
+
+    def save(self, county, html):
+        with self._lock:
+            self._save(county, html)
+
+    def _save(self, county, html):
+        filename = self.index.get(county) or f"county_{len(self.index):02d}.html"
+        _write_text(os.path.join(self.fixture_dir, filename), html)
+        self.index[county] = filename
+        _write_text(os.path.join(self.fixture_dir, INDEX_NAME),
+                    json.dumps(self.index, ensure_ascii=False, indent=2))
+
+    def wrap(self, fetch):
+        def recording_fetch(session, county):
+            html = fetch(session, county)
+            self.save(county, html)
+            return html
+        return recording_fetch
+
+
+def load_index(fixture_dir):
+    try:
+        with open(os.path.join(fixture_dir, INDEX_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class ReplayAdapter(BaseAdapter):
+    """Serve recorded fixtures for ``session.mount(ENDPOINT, ReplayAdapter(dir))``."""
+
+    def __init__(self, fixture_dir):
+        super().__init__()
+        self.fixture_dir = fixture_dir
+        self.index = load_index(fixture_dir)
+        if not self.index:
+            raise FileNotFoundError(f"no fixtures recorded in {fixture_dir}")
+
+    def send(self, request, **kwargs):
+        body = request.body or ""
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        county = parse_qs(body).get("data[county]", [""])[0]
+
+        resp = requests.Response()
+        resp.request = request
+        resp.url = request.url
+        resp.encoding = "utf-8"
+        resp.headers["Content-Type"] = "text/html; charset=utf-8"
+        filename = self.index.get(county)
+        if filename is None:
+            resp.status_code = 404
+            resp.reason = "Not Recorded"
+            resp._content = b""
+            return resp
+        with open(os.path.join(self.fixture_dir, filename), "rb") as f:
+            resp._content = f.read()
+        resp.status_code = 200
+        resp.reason = "OK"
+        return resp
+
+    def close(self):
+        pass
@@ -0,0 +1,312 @@
+"""Per-phase metrics for a scraper run.
+
+Each county gets a sample with its network timings (DNS, connect, time to
+first byte, body transfer), parse time, bytes and rows; run-wide phases
+(pipeline, publish) and the wall time are timed with ``phase()``.  Each
+pipeline stage (fetch, parse, dedup, output) gets a ``StageStats`` with its busy and
+blocked time, so the report shows which stage limited the run.
+``write_json`` produces the run report and ``write_prometheus`` a text-format
+file for node exporter's textfile collector.
+"""
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family, create_connection
+
+NETWORK_FIELDS = ("dns_seconds", "connect_seconds", "ttfb_seconds", "transfer_seconds")
+
+_local = threading.local()
+
+
+def current_sample():
+    """The county sample the calling thread is working on, if any."""
+    return getattr(_local, "sample", None)
+
+
+def _new_sample():
+    sample = dict.fromkeys(NETWORK_FIELDS, 0.0)
+    sample.update(fetch_seconds=0.0, parse_seconds=0.0, bytes=0, rows=0,
+                  requests=0, cache_hit=False, error="")
+    return sample
+
+
+class StageStats:
+    """Throughput of one pipeline stage.
+
+    ``busy_seconds`` is time spent working summed over the stage's workers,
+    ``blocked_seconds`` time spent waiting on a full downstream queue;
+    ``utilization`` is busy time over (active wall time × workers).
+    """
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.items = 0
+        self.rows = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self._first = None
+        self._last = None
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, items=0, rows=0, blocked=0.0):
+        now = time.perf_counter()
+        with self._lock:
+            if self._first is None:
+                self._first = now - busy
+            self._last = now
+            self.busy_seconds += busy
+            self.blocked_seconds += blocked
+            self.items += items
+            self.rows += rows
+
+    @contextmanager
+    def work(self, items=1):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(busy=time.perf_counter() - t0, items=items)
+
+    def to_dict(self):
+        wall = (self._last - self._first) if self._first is not None else 0.0
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "rows": self.rows,
+            "busy_seconds": self.busy_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "wall_seconds": wall,
+            "items_per_second": self.items / wall if wall else 0.0,
+            "utilization": self.busy_seconds / (wall * self.workers) if wall else 0.0,
+        }
+
+
+class RunMetrics:
+    def __init__(self):
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.wall_seconds = 0.0
+        self.counties = {}
+        self.phases = {}
+        self.counters = {}
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def county(self, county):
+        """Attribute network/parse timings on this thread to ``county``."""
+        with self._lock:
+            sample = self.counties.setdefault(county, _new_sample())
+        previous, _local.sample = current_sample(), sample
+        try:
+            yield sample
+        finally:
+            _local.sample = previous
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - t0
+
+    def stage(self, name, workers=1):
+        with self._lock:
+            return self.stages.setdefault(name, StageStats(workers))
+
+    def bottleneck(self):
+        """Name of the stage with the highest utilization, or None."""
+        stats = {name: s.to_dict()["utilization"] for name, s in self.stages.items()}
+        return max(stats, key=stats.get) if stats else None
+
+    def set_counter(self, name, value):
+        self.counters[name] = value
+
+    def finish(self):
+        self.wall_seconds = time.perf_counter() - self._t0
+
+    # -----------------------------------------------------------------------
+    # Output
+    # -----------------------------------------------------------------------
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            "wall_seconds": self.wall_seconds,
+            "phases": self.phases,
+            "counters": self.counters,
+            "stages": {name: s.to_dict() for name, s in self.stages.items()},
+            "bottleneck": self.bottleneck(),
+            "totals": {
+                "bytes": sum(s["bytes"] for s in self.counties.values()),
+                "rows": sum(s["rows"] for s in self.counties.values()),
+                **{f: sum(s[f] for s in self.counties.values())
+                   for f in NETWORK_FIELDS + ("parse_seconds",)},
+            },
+            "counties": self.counties,
+        }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path, prefix="louisa_scrape"):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_str}}} {value}" if label_str
+                             else f"{prefix}_{name} {value}")
+
+        metric("wall_seconds", "gauge", "Wall time of the last scrape run.",
+               [({}, self.wall_seconds)])
+        metric("last_run_timestamp_seconds", "gauge", "Start time of the last scrape run.",
+               [({}, self.started_at)])
+        metric("phase_seconds", "gauge", "Time spent per run phase.",
+               [({"phase": k}, v) for k, v in self.phases.items()])
+        metric("county_network_seconds", "gauge", "Network time per county and step.",
+               [({"county": c, "step": f.replace("_seconds", "")}, s[f])
+                for c, s in self.counties.items() for f in NETWORK_FIELDS])
+        metric("county_parse_seconds", "gauge", "HTML parse time per county.",
+               [({"county": c}, s["parse_seconds"]) for c, s in self.counties.items()])
+        metric("county_bytes", "gauge", "Response bytes per county.",
+               [({"county": c}, s["bytes"]) for c, s in self.counties.items()])
+        metric("county_rows", "gauge", "Parsed store rows per county.",
+               [({"county": c}, s["rows"]) for c, s in self.counties.items()])
+        metric("county_failed", "gauge", "1 if the county could not be scraped.",
+               [({"county": c}, int(bool(s["error"]))) for c, s in self.counties.items()])
+        stages = {name: s.to_dict() for name, s in self.stages.items()}
+        for field, help_text in (("busy_seconds", "Work time per pipeline stage (all workers)."),
+                                 ("blocked_seconds", "Time a stage waited on a full queue."),
+                                 ("items_per_second", "Counties per second through a stage."),
+                                 ("utilization", "Busy share of a stage's workers.")):
+            metric(f"stage_{field}", "gauge", help_text,
+                   [({"stage": name}, st[field]) for name, st in stages.items()])
+        for name, value in self.counters.items():
+            metric(name, "gauge", f"Run counter {name}.", [({}, value)])
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, text):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# ---------------------------------------------------------------------------
+# requests / urllib3 instrumentation
+# ---------------------------------------------------------------------------
+
+class _TimedConnection:
+    """Splits a new connection's setup into DNS and connect (TCP + TLS) time.
+
+    ``_new_conn`` resolves the host once and connects straight to the
+    resolved addresses, so the lookup is neither repeated nor counted twice.
+    """
+
+    def connect(self):
+        sample = current_sample()
+        if sample is None:
+            return super().connect()
+        self._dns_seconds = 0.0
+        t0 = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            sample["dns_seconds"] += self._dns_seconds
+            sample["connect_seconds"] += time.perf_counter() - t0 - self._dns_seconds
+
+    def _new_conn(self):
+        if current_sample() is None:
+            return super()._new_conn()
+        t0 = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port,
+                                           allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        finally:
+            self._dns_seconds = time.perf_counter() - t0
+        error = None
+        for *_, sockaddr in addresses:
+            try:
+                # A numeric address: create_connection doesn't hit DNS again.
+                sock = create_connection(sockaddr[:2], self.timeout,
+                                         source_address=self.source_address,
+                                         socket_options=self.socket_options)
+            except socket.timeout as e:
+                error = ConnectTimeoutError(
+                    self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})")
+                error.__cause__ = e
+            except OSError as e:
+                error = NewConnectionError(self, f"Failed to establish a new connection: {e}")
+                error.__cause__ = e
+            else:
+                return sock
+        raise error or NewConnectionError(self, f"No addresses found for {self.host}")
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report DNS and connect time."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def response_hook(resp, *args, **kwargs):
+    """Session response hook: time to first byte, body transfer and size."""
+    sample = current_sample()
+    if sample is None:
+        return resp
+    t0 = time.perf_counter()
+    body = resp.content          # reads the body now instead of in Session.send
+    sample["transfer_seconds"] += time.perf_counter() - t0
+    sample["ttfb_seconds"] += resp.elapsed.total_seconds()
+    sample["bytes"] += len(body)
+    sample["requests"] += 1
+    return resp
+
+
+def instrument_session(session):
+    session.mount("http://", TimedAdapter())
+    session.mount("https://", TimedAdapter())
+    session.hooks["response"].append(response_hook)
+    return session
@@ -0,0 +1,122 @@
+"""Canonical search keys for store names and addresses.
+
+The scraper stores ``normalize_key(name)`` / ``normalize_key(address)`` as
+``名稱鍵`` / ``地址鍵`` next to the display fields, and the app runs every query
+through the same function, so matching is a plain substring test on
+precomputed keys.  The key is:
+
+* NFKC-folded (full-width digits, letters and punctuation → half-width),
+* case-folded,
+* variant-folded (臺 → 台 and a few common look-alikes, see ``VARIANTS``),
+* stripped of all whitespace, so "中正區  信一路" and "中正區信一路" match.
+
+``split_address`` breaks an address into its 行政區 (district) and 路名
+(road, including its 段) for the ``address_index.AddressIndex`` drill-down;
+both are stored as columns too.  ``parse_coordinates`` is the one parser for
+``經緯度座標`` values and "lat,lng" queries.
+
+Phone / WiFi-key search works on the digits of ``電話`` only: ``digit_query``
+recognizes a query like "02-2511 2613", and ``digit_suffixes`` lists what the
+digit indexes store.  The derived password is always a suffix of the phone
+digits, so indexing the phone covers it.
+"""
+import re
+import unicodedata
+
+NAME_KEY = "名稱鍵"
+ADDRESS_KEY = "地址鍵"
+DISTRICT = "行政區"
+ROAD = "路名"
+MIN_DIGITS = 3
+
+VARIANTS = str.maketrans({
+    "臺": "台",
+    "巿": "市",     # U+5DFF, a frequent typo for 市
+    "峯": "峰",
+    "邨": "村",
+    "衞": "衛",
+    "—": "-",
+    "–": "-",
+})
+
+_COUNTY_PATTERN = re.compile(r"^..[縣市]")
+# A district is short and never directly followed by a road suffix
+# ("中山區中山北路" → 中山區, "前鎮區" → 前鎮區, but not "東區路").
+_DISTRICT_PATTERN = re.compile(r"^(.{1,3}?[區鄉鎮市]區?)(?![路街道])")
+_VILLAGE_PATTERN = re.compile(r"^\D{1,3}?[里村](?:\d+鄰)?")
+_ROAD_PATTERN = re.compile(r"^(\D+?(?:大道|路|街))([一二三四五六七八九十\d]+段)?")
+_SECTION_NUMERALS = str.maketrans("123456789", "一二三四五六七八九")
+
+_DIGIT_QUERY_PATTERN = re.compile(r"[0-9]+")
+_PHONE_PUNCTUATION = re.compile(r"[\s\-()#]")
+
+_COORD_PATTERN = re.compile(r"^\s*(-?\d{1,3}(?:\.\d+)?)\s*[,，\s]\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+
+def parse_coordinates(text):
+    """``"lat,lng"`` → ``(lat, lng)``, or None if ``text`` isn't a coordinate pair."""
+    m = _COORD_PATTERN.match(text or "")
+    if not m:
+        return None
+    lat, lng = float(m.group(1)), float(m.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (lat == 0 and lng == 0):
+        return None
+    return lat, lng
+
+
+def normalize_key(text: str) -> str:
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKC", text).casefold().translate(VARIANTS)
+    return "".join(text.split())
+
+
+def phone_digits(phone: str) -> str:
+    return re.sub(r"\D", "", phone or "")
+
+
+def digit_query(text: str):
+    """The digits of a phone / WiFi-key query ("02-2511 2613" → "0225112613"), else None."""
+    text = _PHONE_PUNCTUATION.sub("", unicodedata.normalize("NFKC", text or ""))
+    if len(text) >= MIN_DIGITS and _DIGIT_QUERY_PATTERN.fullmatch(text):
+        return text
+    return None
+
+
+def digit_suffixes(phone: str) -> list[str]:
+    """Every suffix of the phone digits at least ``MIN_DIGITS`` long."""
+    digits = phone_digits(phone)
+    return [digits[i:] for i in range(len(digits) - MIN_DIGITS + 1)]
+
+
+def split_address(address: str, county: str = "") -> tuple[str, str]:
+    """``"基隆市 中正區  信一路168號1樓"`` → ``("中正區", "信一路")``; "" for a missing part."""
+    text = "".join(unicodedata.normalize("NFKC", address or "").translate(VARIANTS).split())
+    county = (county or "").translate(VARIANTS)
+    district = ""
+    # Some addresses repeat the county and district ("新北市 汐止區 新北市汐止區…").
+    while text:
+        if county and text.startswith(county):
+            text = text[len(county):]
+        elif not county and _COUNTY_PATTERN.match(text):
+            text = text[3:]
+        m = _DISTRICT_PATTERN.match(text)
+        if not m or (district and m.group(1) != district):
+            break
+        district = m.group(1)
+        text = text[m.end():]
+    # Skip a leading 里/村 (and 鄰) when a road follows it: "南柳里福新路" → 福新路.
+    village = _VILLAGE_PATTERN.match(text)
+    m = village and _ROAD_PATTERN.match(text[village.end():]) or _ROAD_PATTERN.match(text)
+    if not m:
+        return district, ""
+    road = m.group(1) + (m.group(2) or "").translate(_SECTION_NUMERALS)
+    return district, road
+
+
+def add_search_keys(row: dict) -> dict:
+    """Fill in the key and address-part columns of ``row`` (in place) and return it."""
+    row[NAME_KEY] = normalize_key(row.get("門市名稱", ""))
+    row[ADDRESS_KEY] = normalize_key(row.get("地址", ""))
+    row[DISTRICT], row[ROAD] = split_address(row.get("地址", ""), row.get("縣市", ""))
+    return row
@@ -0,0 +1,181 @@
+"""Adaptive request control for the county fetches.
+
+``RequestController`` combines three mechanisms around a fetch function:
+
+* retries with exponential backoff and full jitter on retryable errors
+  (connection errors, timeouts, 429 and 5xx; ``Retry-After`` is honoured),
+* an AIMD concurrency limit that grows by one per window of healthy
+  (fast, successful) responses and halves on errors or 429s,
+* a per-host circuit breaker that stops hammering a host after repeated
+  failures and lets a single probe through once the cooldown expires.
+
+``scrape_all.main`` adds the fourth part: a run with missing counties fails.
+"""
+import random
+import threading
+import time
+
+import requests
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+def backoff_delay(attempt, base, cap, rng=random):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def classify(exc):
+    """Return ``(retryable, throttled, retry_after)`` for an exception."""
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True, False, None
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        retry_after = None
+        try:
+            retry_after = float(exc.response.headers.get("Retry-After", ""))
+        except ValueError:
+            pass
+        return status in RETRYABLE_STATUS, status == 429, retry_after
+    return False, False, None
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, cooldown=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if self.clock() - self.opened_at < self.cooldown:
+                    raise CircuitOpenError("circuit open")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._probing:
+                    raise CircuitOpenError("circuit half-open, probe in flight")
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = self.clock()
+            self._probing = False
+
+
+class AIMDLimiter:
+    def __init__(self, initial=1, minimum=1, maximum=8, decrease=0.5, latency_target=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.peak = initial
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency):
+        with self._cond:
+            if latency <= self.latency_target:
+                # +1 per full window of healthy responses.
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+                self.peak = max(self.peak, int(self.limit))
+                self._cond.notify_all()
+
+    def on_congestion(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class RequestController:
+    def __init__(self, limiter=None, max_attempts=5, base_delay=0.5, max_delay=20.0,
+                 breaker_factory=CircuitBreaker, sleep=time.sleep):
+        self.limiter = limiter or AIMDLimiter()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker_factory = breaker_factory
+        self.sleep = sleep
+        self.breakers = {}
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def breaker(self, host):
+        with self._lock:
+            if host not in self.breakers:
+                self.breakers[host] = self.breaker_factory()
+            return self.breakers[host]
+
+    def call(self, host, fn, *args, **kwargs):
+        breaker = self.breaker(host)
+        for attempt in range(self.max_attempts):
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                if attempt == self.max_attempts - 1:
+                    raise
+                self.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+                continue
+            self.limiter.acquire()
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                retryable, throttled, retry_after = classify(e)
+                if retryable:
+                    breaker.record_failure()
+                    self.limiter.on_congestion()
+                else:
+                    # Not the host's fault (e.g. a 404); don't trip the breaker.
+                    breaker.record_success()
+                if not retryable or attempt == self.max_attempts - 1:
+                    raise
+            else:
+                breaker.record_success()
+                self.limiter.on_success(time.perf_counter() - started)
+                return result
+            finally:
+                self.limiter.release()
+
+            with self._lock:
+                self.retries += 1
+                self.throttled += int(throttled)
+            delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self.sleep(delay)
+
+    def wrap(self, fetch, host):
+        def controlled_fetch(session, county):
+            return self.call(host, fetch, session, county)
+        return controlled_fetch
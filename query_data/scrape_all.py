@@ -1,8 +1,27 @@
+import argparse
+import csv
 import requests
 from bs4 import BeautifulSoup
-import pandas as pd
+import os
+import queue
 import re
+import sys
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+# Allow ``python query_data/scrape_all.py`` as well as ``python -m query_data.scrape_all``.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from query_data.checkpoint import RunCheckpoint  # noqa: E402
+from query_data.delta import publish, read_published  # noqa: E402
+from query_data.http_cache import FixtureRecorder, ReplayAdapter, ResponseCache  # noqa: E402
+from query_data.metrics import RunMetrics, instrument_session  # noqa: E402
+from query_data.normalize import add_search_keys  # noqa: E402
+from query_data.rate_control import AIMDLimiter, RequestController  # noqa: E402
+from query_data.shards import FIELDNAMES  # noqa: E402
+from query_data.sqlite_store import DB_NAME, write_database  # noqa: E402
+from query_data.store_ids import StoreIdAssigner  # noqa: E402
 
 COUNTIES = [
     "基隆市", "台北市", "新北市", "宜蘭縣",
@@ -21,6 +40,8 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/145.0.0.0 Safari/537.36",
 }
 
+OUT_DIR = os.path.dirname(os.path.abspath(__file__))
+
 TIME_PATTERN = re.compile(r"(\d{1,2}:\d{2})\s*[-~～]\s*(\d{1,2}:\d{2})")
 
 
@@ -73,7 +94,7 @@ def parse_html(html: str, county: str) -> list[dict]:
 
         start_time, end_time = parse_time(hours_raw)
 
-        stores.append({
+        stores.append(add_search_keys({
             "縣市": county,
             "門市名稱": name,
             "電話": phone,
@@ -82,33 +103,298 @@ def parse_html(html: str, county: str) -> list[dict]:
             "營業時間": hours_raw,
             "開始時間": start_time,
             "結束時間": end_time,
-        })
+        }))
 
     return stores
 
 
-def main():
-    all_stores = []
-    session = requests.Session()
+def parse_timed(html: str, county: str):
+    """Process-pool entry point: ``(rows, parse seconds)``."""
+    t0 = time.perf_counter()
+    stores = parse_html(html, county)
+    return stores, time.perf_counter() - t0
+
+
+class CatalogWriter:
+    """Streams deduplicated rows to a temporary ``data.csv``.
+
+    ``dedup`` keeps the first occurrence of each store, identified by
+    (門市名稱, 地址) as with the old ``drop_duplicates``, and gives it its
+    ``門市編號`` from ``ids``; ``write`` appends those rows to the file.
+    ``commit`` moves the file into place, ``discard`` removes it, so a failed
+    run never leaves a partial output.
+    """
+
+    def __init__(self, tmp_path, ids=None):
+        self.tmp_path = tmp_path
+        self.ids = ids or StoreIdAssigner()
+        self.rows = []
+        self.parsed = 0
+        self._seen = set()
+        self._file = open(tmp_path, "w", encoding="utf-8-sig", newline="")
+        self._csv = csv.DictWriter(self._file, fieldnames=FIELDNAMES, lineterminator="\n",
+                                   extrasaction="ignore")
+        self._csv.writeheader()
+
+    def dedup(self, stores):
+        unique = []
+        for row in stores:
+            self.parsed += 1
+            key = (row["門市名稱"], row["地址"])
+            if not row["門市名稱"] or key in self._seen:
+                continue
+            self._seen.add(key)
+            self.ids.assign(row)
+            unique.append(row)
+        return unique
+
+    def write(self, rows):
+        self._csv.writerows(rows)
+        self._file.flush()
+        self.rows.extend(rows)
+        return len(rows)
+
+    def commit(self, path):
+        self._file.close()
+        os.replace(self.tmp_path, path)
+
+    def discard(self):
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.unlink(self.tmp_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape every Louisa store into data.csv and shards/.")
+    parser.add_argument("--out-dir", default=OUT_DIR,
+                        help="where data.csv and shards/ are written (default: next to this script)")
+    parser.add_argument("--cache-ttl", type=int, default=0, metavar="SECONDS",
+                        help="reuse cached county responses younger than this (0 = off)")
+    parser.add_argument("--cache-dir", default=os.path.join(OUT_DIR, ".http_cache"))
+    parser.add_argument("--record", metavar="DIR", help="save raw county responses as fixtures")
+    parser.add_argument("--replay", metavar="DIR", help="serve county responses from fixtures (offline)")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="upper bound for the adaptive (AIMD) request concurrency")
+    parser.add_argument("--parse-workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="parser processes (BeautifulSoup runs off the fetch threads)")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="pages / parsed counties buffered between stages (backpressure)")
+    parser.add_argument("--allow-partial", action="store_true",
+                        help="write the output even if some counties could not be fetched")
+    parser.add_argument("--run-dir", default=None,
+                        help="per-county checkpoints of the current run (default: <out-dir>/.scrape_run)")
+    parser.add_argument("--resume", action="store_true",
+                        help="reuse the counties checkpointed by an interrupted run and fetch only the rest")
+    parser.add_argument("--report-dir", default=os.path.join(OUT_DIR, "reports"),
+                        help="where scrape_report.json and louisa_scrape.prom are written")
+    parser.add_argument("--sqlite", action="store_true",
+                        help="also write catalog.sqlite (FTS5 + R*Tree) for the SQLite backend")
+    parser.add_argument("--prom-file", metavar="PATH",
+                        help="write the Prometheus metrics here instead (e.g. node exporter's textfile dir)")
+    return parser.parse_args(argv)
+
 
-    for county in COUNTIES:
-        print(f"Fetching {county}...", end=" ", flush=True)
+def main(argv=None):
+    args = parse_args(argv)
+    metrics = RunMetrics()
+    try:
+        run(args, metrics)
+    finally:
+        metrics.finish()
+        report_path = os.path.join(args.report_dir, "scrape_report.json")
+        metrics.write_json(report_path)
+        metrics.write_prometheus(args.prom_file or os.path.join(args.report_dir, "louisa_scrape.prom"))
+        print(f"Finished in {metrics.wall_seconds:.2f}s (report: {report_path})")
+
+
+def run(args, metrics):
+    # requests.Session isn't guaranteed thread-safe: one per worker thread.
+    local = threading.local()
+    replay = ReplayAdapter(args.replay) if args.replay else None
+
+    def get_session():
+        if not hasattr(local, "session"):
+            local.session = instrument_session(requests.Session())
+            if replay:
+                local.session.mount(ENDPOINT, replay)
+        return local.session
+
+    limiter = AIMDLimiter(maximum=max(1, args.max_concurrency))
+    controller = RequestController(limiter)
+    fetch = controller.wrap(fetch_county, urlparse(ENDPOINT).hostname)
+    cache = None
+    if args.cache_ttl > 0 and not args.replay:
+        cache = ResponseCache(args.cache_dir, args.cache_ttl)
+        fetch = cache.wrap(fetch)
+    if args.record:
+        fetch = FixtureRecorder(args.record).wrap(fetch)
+
+    fetch_stage = metrics.stage("fetch", limiter.maximum)
+    parse_stage = metrics.stage("parse", args.parse_workers)
+    dedup_stage = metrics.stage("dedup")
+    output_stage = metrics.stage("output")
+    # Bounded queues between the stages: fetchers block once ``queue_size``
+    # pages are waiting for a parser, so memory stays flat however fast the
+    # network is.  Every county ends up in ``parsed`` exactly once, as rows or
+    # as an error.
+    pages = queue.Queue(maxsize=args.queue_size)
+    parsed = queue.Queue(maxsize=args.queue_size)
+
+    def fetch_stage_worker(county):
+        # Exactly one result per county reaches ``parsed``: an error from here
+        # until the page is in ``pages``, the parsers' result after that.
+        handed_off = False
+        t0 = time.perf_counter()
         try:
-            html = fetch_county(session, county)
-            stores = parse_html(html, county)
-            print(f"{len(stores)} stores")
-            all_stores.extend(stores)
+            with metrics.county(county) as sample:
+                html = fetch(get_session(), county)
+                sample["fetch_seconds"] = time.perf_counter() - t0
+                fetch_stage.add(busy=sample["fetch_seconds"], items=1)
+                if not sample["requests"]:
+                    sample["cache_hit"] = True
+                    sample["bytes"] = len(html.encode("utf-8"))
+            t0 = time.perf_counter()
+            pages.put((county, html))
+            handed_off = True
+            fetch_stage.add(blocked=time.perf_counter() - t0)
         except Exception as e:
-            print(f"ERROR: {e}")
-        time.sleep(0.5)  # be polite
+            if handed_off:
+                print(f"{county}: fetch bookkeeping failed: {e}")
+                return
+            fetch_stage.add(busy=time.perf_counter() - t0)
+            parsed.put((county, None, e))
+
+    def parse_stage_worker(pool):
+        # One feeder thread per parser process keeps at most ``parse_workers``
+        # pages in flight.
+        while True:
+            item = pages.get()
+            if item is None:
+                return
+            county, html = item
+            try:
+                stores, seconds = pool.submit(parse_timed, html, county).result()
+                parse_stage.add(busy=seconds, items=1, rows=len(stores))
+                metrics.counties[county]["parse_seconds"] = seconds
+                metrics.counties[county]["rows"] = len(stores)
+            except Exception as e:
+                parsed.put((county, None, e))
+                continue
+            t0 = time.perf_counter()
+            parsed.put((county, stores, None))
+            parse_stage.add(blocked=time.perf_counter() - t0)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    checkpoint = RunCheckpoint(args.run_dir or os.path.join(args.out_dir, ".scrape_run"), COUNTIES)
+    done = checkpoint.start(resume=args.resume)
+    todo = [c for c in COUNTIES if c not in done]
+    if done:
+        print(f"Resuming: {len(done)} counties from checkpoints, {len(todo)} to fetch")
+    metrics.set_counter("resumed_counties", len(done))
+    out_path = os.path.join(args.out_dir, "data.csv")
+    # Store IDs carry over from the last published catalog.
+    _, previous = read_published(os.path.join(args.out_dir, "shards"))
+    writer = CatalogWriter(out_path + ".tmp", StoreIdAssigner(previous))
+    failures = {}
+    try:
+        with metrics.phase("pipeline"), \
+                ProcessPoolExecutor(max_workers=args.parse_workers) as parse_pool, \
+                ThreadPoolExecutor(max_workers=limiter.maximum) as fetch_pool:
+            feeders = [threading.Thread(target=parse_stage_worker, args=(parse_pool,), daemon=True)
+                       for _ in range(args.parse_workers)]
+            for t in feeders:
+                t.start()
+            fetches = [fetch_pool.submit(fetch_stage_worker, county) for county in todo]
+
+            def close_pages():
+                wait(fetches)
+                for _ in feeders:
+                    pages.put(None)
+            threading.Thread(target=close_pages, daemon=True).start()
+
+            # Single writer: rows are written in COUNTIES order (counties that
+            # finish early wait in ``ready``), so the output is deterministic.
+            # Each county is checkpointed as soon as it is parsed.
+            ready = dict(done)
+            next_county = 0
+
+            def write_ready():
+                nonlocal next_county
+                while next_county < len(COUNTIES) and COUNTIES[next_county] in ready:
+                    rows = ready.pop(COUNTIES[next_county]) or []
+                    with dedup_stage.work():
+                        unique = writer.dedup(rows)
+                    dedup_stage.add(rows=len(unique))
+                    with output_stage.work():
+                        writer.write(unique)
+                    output_stage.add(rows=len(unique))
+                    next_county += 1
+
+            write_ready()
+            for _ in todo:
+                county, stores, error = parsed.get()
+                if error is not None:
+                    failures[county] = error
+                    metrics.counties[county]["error"] = str(error)
+                    print(f"{county}: ERROR: {error}")
+                else:
+                    checkpoint.save(county, stores)
+                    print(f"{county}: {len(stores)} stores")
+                ready[county] = stores
+                write_ready()
+            for t in feeders:
+                t.join()
+    except BaseException:
+        writer.discard()
+        print(f"Interrupted; finished counties are kept in {checkpoint.run_dir}, "
+              f"run again with --resume to continue.")
+        raise
+
+    print(f"Requests: {controller.retries} retries, {controller.throttled} throttled, "
+          f"peak concurrency {limiter.peak}")
+    metrics.set_counter("retries", controller.retries)
+    metrics.set_counter("throttled", controller.throttled)
+    metrics.set_counter("peak_concurrency", limiter.peak)
+    metrics.set_counter("failed_counties", len(failures))
+    if cache:
+        metrics.set_counter("cache_hits", cache.hits)
+        metrics.set_counter("cache_misses", cache.misses)
+    if failures:
+        missing = ", ".join(c for c in COUNTIES if c in failures)
+        if not args.allow_partial:
+            writer.discard()
+            raise SystemExit(f"Incomplete coverage, nothing written. Missing counties: {missing}\n"
+                             f"Run again with --resume to fetch only those.")
+        print(f"WARNING: writing partial data, missing counties: {missing}")
 
-    df = pd.DataFrame(all_stores)
-    df = df[df["門市名稱"].str.len() > 0]
-    df = df.drop_duplicates(subset=["門市名稱", "地址"])
+    writer.commit(out_path)
+    metrics.set_counter("stores_parsed", writer.parsed)
+    metrics.set_counter("stores_written", len(writer.rows))
+    metrics.set_counter("renamed_stores", len(writer.ids.renames))
+    for store_id, old, new in writer.ids.renames:
+        print(f"Renamed #{store_id}: {old} -> {new}")
+    print(f"\nDone! {len(writer.rows)} stores saved to {out_path}")
 
-    out_path = "data.csv"
-    df.to_csv(out_path, index=False, encoding="utf-8-sig")
-    print(f"\nDone! {len(df)} stores saved to {out_path}")
+    with metrics.phase("publish"), output_stage.work(items=0):
+        manifest = publish(writer.rows, os.path.join(args.out_dir, "shards"))
+    print(f"Catalog v{manifest['version']}: {len(manifest['shards'])} county shards, "
+          f"{len(manifest['deltas'])} deltas")
+    for name, stats in metrics.stages.items():
+        st = stats.to_dict()
+        print(f"  {name:<6} {st['items']:>3} counties  {st['items_per_second']:6.2f}/s  "
+              f"busy {st['busy_seconds']:6.2f}s  blocked {st['blocked_seconds']:6.2f}s  "
+              f"utilization {st['utilization']:5.0%}")
+    print(f"Bottleneck: {metrics.bottleneck()}")
+    if args.sqlite:
+        with metrics.phase("write_sqlite"):
+            db_path = os.path.join(args.out_dir, DB_NAME)
+            write_database(writer.rows, db_path, manifest["version"])
+        print(f"SQLite catalog written to {db_path}")
+    if cache:
+        print(f"HTTP cache: {cache.hits} hits, {cache.misses} misses")
+    if not failures:
+        checkpoint.clear()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+"""Per-county catalog shards.
+
+The scraper writes one CSV per 縣市 under ``shards/`` plus a small
+``manifest.json`` that lists every shard with its row count and checksum.
+The app reads only the manifest at startup and pages shards in on demand.
+
+Publish the shards (as the next catalog version, see ``delta.py``) from an
+existing ``data.csv`` with::
+
+    python -m query_data.shards query_data/data.csv
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+
+MANIFEST_NAME = "manifest.json"
+FORMAT_VERSION = 1
+STORE_ID = "門市編號"
+
+FIELDNAMES = [
+    "縣市", "門市名稱", "電話", "經緯度座標", "地址", "營業時間", "開始時間", "結束時間",
+    "名稱鍵", "地址鍵", "行政區", "路名", STORE_ID,
+]
+
+
+def shard_filename(index: int) -> str:
+    # ASCII names keep the files safe for zip/PyInstaller bundles and URLs.
+    return f"shard_{index:02d}.csv"
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def encode_rows(rows: list[dict], fieldnames: list[str]) -> bytes:
+    """Serialise rows exactly the way ``data.csv`` is written (utf-8-sig, LF)."""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames, lineterminator="\n",
+                            extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().encode("utf-8-sig")
+
+
+def write_shards(rows: list[dict], out_dir: str, fieldnames: list[str] = FIELDNAMES,
+                 extra: dict = None) -> dict:
+    """Group ``rows`` by 縣市 and write one shard per county plus the manifest."""
+    os.makedirs(out_dir, exist_ok=True)
+
+    by_county: dict[str, list[dict]] = {}
+    for row in rows:
+        by_county.setdefault(row["縣市"], []).append(row)
+
+    entries = []
+    for index, (county, county_rows) in enumerate(by_county.items()):
+        data = encode_rows(county_rows, fieldnames)
+        filename = shard_filename(index)
+        _write_atomic(os.path.join(out_dir, filename), data)
+        entries.append({
+            "county": county,
+            "file": filename,
+            "count": len(county_rows),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        })
+
+    # Drop shards left over from a previous run with more counties.
+    keep = {e["file"] for e in entries}
+    for name in os.listdir(out_dir):
+        if name.startswith("shard_") and name.endswith(".csv") and name not in keep:
+            os.unlink(os.path.join(out_dir, name))
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "fields": list(fieldnames),
+        "total": sum(e["count"] for e in entries),
+        "shards": entries,
+    }
+    manifest.update(extra or {})
+    data = json.dumps(manifest, ensure_ascii=False, indent=2).encode("utf-8")
+    _write_atomic(os.path.join(out_dir, MANIFEST_NAME), data)
+    return manifest
+
+
+def read_manifest(shard_dir: str) -> dict:
+    with open(os.path.join(shard_dir, MANIFEST_NAME), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_shard(shard_dir: str, entry: dict) -> list[dict]:
+    with open(os.path.join(shard_dir, entry["file"]), mode="r", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def read_csv(path: str) -> list[dict]:
+    with open(path, mode="r", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+if __name__ == "__main__":
+    from query_data.delta import publish
+
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "data.csv")
+    out = os.path.join(os.path.dirname(os.path.abspath(src)), "shards")
+    manifest = publish(read_csv(src), out)
+    print(f"v{manifest['version']}: {manifest['total']} stores in "
+          f"{len(manifest['shards'])} shards -> {out}")
@@ -0,0 +1,129 @@
+"""SQLite catalog: one read-only database instead of per-county CSV shards.
+
+For catalogs too large to page into memory, the scraper can also write
+``catalog.sqlite`` (``scrape_all.py --sqlite``)::
+
+    stores     id (catalog order), plain columns for every field,
+               indexed by county, by (county, district, road) and by 門市編號
+    store_fts  FTS5 trigram index over 名稱鍵 / 地址鍵 (external content)
+    store_geo  R*Tree over each store's lat/lng
+    store_digits  every suffix of each store's phone digits, for phone /
+               WiFi-key search (a suffix array, see ``digit_index.py``)
+    meta       format, version, total, checksum
+
+Store ids follow the shard order (county by county), so ``ORDER BY id``
+returns rows in the same order as the in-memory catalog.  The app opens the
+file read-only (see ``catalog_sqlite.py``).
+
+Build it from an existing ``data.csv`` with::
+
+    python -m query_data.sqlite_store query_data/data.csv
+"""
+import os
+import sqlite3
+import sys
+
+from . import shards
+from .delta import catalog_checksum
+from .normalize import digit_suffixes, parse_coordinates
+
+DB_NAME = "catalog.sqlite"
+FORMAT_VERSION = 4
+
+# Row field -> column.  The order is the column order of ``stores``.
+COLUMNS = {
+    "縣市": "county",
+    "門市名稱": "name",
+    "電話": "phone",
+    "經緯度座標": "coords",
+    "地址": "address",
+    "營業時間": "hours",
+    "開始時間": "opens",
+    "結束時間": "closes",
+    "名稱鍵": "name_key",
+    "地址鍵": "address_key",
+    "行政區": "district",
+    "路名": "road",
+    "門市編號": "store_id",
+}
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE stores (
+    id INTEGER PRIMARY KEY,
+    county TEXT NOT NULL, name TEXT NOT NULL, phone TEXT, coords TEXT,
+    address TEXT, hours TEXT, opens TEXT, closes TEXT,
+    name_key TEXT NOT NULL, address_key TEXT NOT NULL,
+    district TEXT NOT NULL, road TEXT NOT NULL, store_id INTEGER NOT NULL UNIQUE
+);
+CREATE INDEX stores_county ON stores (county, id);
+CREATE INDEX stores_address ON stores (county, district, road, id);
+CREATE INDEX stores_name ON stores (name);
+CREATE VIRTUAL TABLE store_fts USING fts5(
+    name_key, address_key, content='stores', content_rowid='id', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE store_geo USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TABLE store_digits (
+    suffix TEXT NOT NULL, id INTEGER NOT NULL, PRIMARY KEY (suffix, id)
+) WITHOUT ROWID;
+"""
+
+
+def _text(value):
+    return "" if value is None else str(value)
+
+
+def write_database(rows, path, version=None):
+    """Write ``rows`` (shard order) to ``path`` atomically and return the row count."""
+    # Same grouping as ``shards.write_shards`` so ids match the shard order.
+    by_county = {}
+    for row in rows:
+        by_county.setdefault(row["縣市"], []).append(row)
+    ordered = [row for county_rows in by_county.values() for row in county_rows]
+
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        columns = ", ".join(COLUMNS.values())
+        placeholders = ", ".join("?" * len(COLUMNS))
+        geo = []
+        digits = []
+        for store_id, row in enumerate(ordered, 1):
+            conn.execute(f"INSERT INTO stores (id, {columns}) VALUES (?, {placeholders})",
+                         [store_id] + [_text(row.get(field)) for field in COLUMNS])
+            point = parse_coordinates(_text(row.get("經緯度座標")))
+            if point:
+                geo.append((store_id, point[0], point[0], point[1], point[1]))
+            digits += [(suffix, store_id) for suffix in digit_suffixes(_text(row.get("電話")))]
+        conn.executemany("INSERT INTO store_geo VALUES (?, ?, ?, ?, ?)", geo)
+        conn.executemany("INSERT OR IGNORE INTO store_digits VALUES (?, ?)", digits)
+        conn.execute("INSERT INTO store_fts (store_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO store_fts (store_fts) VALUES ('optimize')")
+        meta = {
+            "format": FORMAT_VERSION,
+            "version": version,
+            "total": len(ordered),
+            "checksum": catalog_checksum(ordered, shards.FIELDNAMES),
+        }
+        conn.executemany("INSERT INTO meta VALUES (?, ?)",
+                         [(k, None if v is None else str(v)) for k, v in meta.items()])
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+    os.replace(tmp_path, path)
+    return len(ordered)
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "data.csv")
+    base = os.path.dirname(os.path.abspath(src))
+    try:
+        version = shards.read_manifest(os.path.join(base, "shards")).get("version")
+    except OSError:
+        version = None
+    n = write_database(shards.read_csv(src), os.path.join(base, DB_NAME), version)
+    print(f"Wrote {n} stores to {os.path.join(base, DB_NAME)} (catalog v{version})")
@@ -0,0 +1,77 @@
+"""Stable integer store IDs (``門市編號``).
+
+A store's name and even its address text change over time; its phone
+number and location rarely do.  A new store's ID is derived from those
+durable attributes (phone digits plus coordinates rounded to ~10 m; name and
+address for stores without coordinates), hashed to a 28-bit integer.  On every
+scrape ``StoreIdAssigner`` carries the IDs of the previous catalog forward:
+
+1. same (門市名稱, 地址) as before → same ID,
+2. else same phone + location → same ID, recorded in ``renames``,
+3. else same name (the address was edited) → same ID,
+4. else a freshly derived ID, never one the previous catalog used.
+
+Favorites, the BSSID index and the dropdown all key on this ID.
+"""
+import hashlib
+import re
+
+from .delta import store_key
+from .normalize import parse_coordinates
+from .shards import STORE_ID  # noqa: F401  (re-exported)
+ID_BITS = 28
+COORD_DIGITS = 4
+
+
+def durable_key(row: dict) -> str:
+    point = parse_coordinates(row.get("經緯度座標", ""))
+    if not point:
+        # Unmapped stores (often listed with the head-office phone) only
+        # have their name and address to go by.
+        return f"{row.get('門市名稱', '')}\x1f{row.get('地址', '')}"
+    phone = re.sub(r"\D", "", row.get("電話", "") or "")
+    return f"{phone}\x1f{point[0]:.{COORD_DIGITS}f},{point[1]:.{COORD_DIGITS}f}"
+
+
+def derive_id(row: dict) -> int:
+    digest = hashlib.sha1(durable_key(row).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") >> (32 - ID_BITS) or 1
+
+
+class StoreIdAssigner:
+    def __init__(self, previous_rows=()):
+        self._by_key = {}
+        self._by_durable = {}
+        self._by_name = {}
+        self._names = {}
+        for row in previous_rows:
+            if not row.get(STORE_ID):
+                continue
+            store_id = int(row[STORE_ID])
+            self._by_key[store_key(row)] = store_id
+            durable = durable_key(row)
+            # Stores sharing a phone and location can't be told apart by them.
+            self._by_durable[durable] = None if durable in self._by_durable else store_id
+            name = row["門市名稱"]
+            self._by_name[name] = None if name in self._by_name else store_id
+            self._names[store_id] = name
+        self.used = set()
+        self.renames = []               # [(id, old name, new name), ...]
+
+    def assign(self, row: dict) -> int:
+        """Set ``row[STORE_ID]`` (in place) and return it."""
+        store_id = self._by_key.get(store_key(row))
+        if store_id is None or store_id in self.used:
+            store_id = self._by_durable.get(durable_key(row))
+            if store_id is not None and store_id not in self.used \
+                    and self._names[store_id] != row["門市名稱"]:
+                self.renames.append((store_id, self._names[store_id], row["門市名稱"]))
+        if store_id is None or store_id in self.used:
+            store_id = self._by_name.get(row["門市名稱"])
+        if store_id is None or store_id in self.used:
+            store_id = derive_id(row)
+            while store_id in self.used or store_id in self._names:
+                store_id = store_id % ((1 << ID_BITS) - 1) + 1
+        self.used.add(store_id)
+        row[STORE_ID] = store_id
+        return store_id
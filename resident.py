@@ -0,0 +1,327 @@
+"""Resident mode: keep the catalog warm and take commands over a local channel.
+
+``get_louisa_v2.py --resident`` (tray icon) or ``python resident.py serve``
+(headless) owns a ``CommandHandler`` and listens on a per-user Unix socket, or
+a named pipe on Windows.  The thin client sends one request per connection::
+
+    python resident.py connect 信一        # apply + verify the matching store
+    python resident.py nearest [lat,lng]   # nearest stores (visible APs if no point)
+    python resident.py list-favorites
+
+Requests and replies are dicts sent with ``multiprocessing.connection``; the
+channel is authenticated with a random key the server writes next to the
+socket (readable by the owner only).  Both live in ``$XDG_RUNTIME_DIR``, or
+else in a ``louisa-<uid>`` directory under the temp dir that only the owner
+can enter.
+"""
+import json
+import os
+import secrets
+import stat
+import sys
+import tempfile
+import threading
+from multiprocessing.connection import AuthenticationError, Client, Listener
+
+from geo import parse_coordinates
+from query_data.store_ids import STORE_ID
+from wifi_apply import derive_password
+from wlan import SSID
+
+VERIFY_TIMEOUT = 8.0
+NEAREST_RESULTS = 5
+
+
+def _user():
+    return os.environ.get("USERNAME", "user") if sys.platform == "win32" else str(os.getuid())
+
+
+def runtime_dir():
+    """Directory for this user's socket and key: ``$XDG_RUNTIME_DIR`` or a private 0700 one."""
+    base = os.environ.get("XDG_RUNTIME_DIR")
+    if base and os.path.isdir(base):
+        return base
+    path = os.path.join(tempfile.gettempdir(), f"louisa-{_user()}")
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or (sys.platform != "win32" and (
+            st.st_uid != os.getuid() or st.st_mode & 0o077)):
+        # Someone else created (or links) it: never put the key there.
+        raise ResidentError(f"{path} is not a private directory owned by this user")
+    return path
+
+
+def default_address():
+    """``(address, family)`` of this user's channel; ``LOUISA_SOCKET`` overrides it."""
+    if "LOUISA_SOCKET" in os.environ:
+        address = os.environ["LOUISA_SOCKET"]
+        return address, "AF_PIPE" if address.startswith("\\\\.\\pipe\\") else "AF_UNIX"
+    if sys.platform == "win32":
+        return rf"\\.\pipe\louisa-autoconnect-{_user()}", "AF_PIPE"
+    return os.path.join(runtime_dir(), "louisa.sock"), "AF_UNIX"
+
+
+def key_path(address):
+    if address.startswith("\\\\.\\pipe\\"):
+        return os.path.join(runtime_dir(), address.rsplit("\\", 1)[1] + ".key")
+    return address + ".key"
+
+
+class ResidentError(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+class CommandHandler:
+    """Runs client commands against the warm catalog.
+
+    The owner swaps ``catalog`` with ``set_catalog`` (e.g. after a catalog
+    refresh); commands and swaps are serialized, so each command sees one
+    catalog throughout.
+    """
+
+    def __init__(self, catalog, settings_path, wlan, verifier,
+                 bssid_index=None, connect_stats=None):
+        self.catalog = catalog
+        self.settings_path = settings_path
+        self.wlan = wlan
+        self.verifier = verifier
+        self.bssid_index = bssid_index
+        self.connect_stats = connect_stats
+        self._lock = threading.Lock()
+
+    def set_catalog(self, catalog):
+        """Swap in ``catalog`` once the running command, if any, has finished."""
+        with self._lock:
+            self.catalog = catalog
+
+    def handle(self, request):
+        cmd = request.get("cmd", "")
+        method = getattr(self, "cmd_" + cmd.replace("-", "_"), None)
+        if method is None:
+            return {"ok": False, "error": f"unknown command: {cmd}"}
+        try:
+            with self._lock:
+                return {"ok": True, "result": method(*request.get("args", []))}
+        except ResidentError as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    def cmd_ping(self):
+        return "pong"
+
+    def _favorites(self):
+        try:
+            with open(self.settings_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("preference", [])
+        except (OSError, ValueError):
+            return []
+
+    def cmd_list_favorites(self):
+        favorites = []
+        for pref in self._favorites():
+            store = (self.catalog.get(pref["id"], pref.get("county")) if "id" in pref
+                     else self.catalog.find(pref["name"], pref.get("county")))
+            favorites.append({
+                "id": store[STORE_ID] if store else pref.get("id"),
+                "name": store["門市名稱"] if store else pref["name"],
+                "county": store["縣市"] if store else pref.get("county"),
+                "address": store["地址"] if store else None,
+            })
+        return favorites
+
+    def cmd_nearest(self, point=None):
+        if point:
+            coords = parse_coordinates(point)
+            if coords is None:
+                raise ResidentError(f"not a lat,lng pair: {point}")
+            return [_summary(store, km=round(km, 2))
+                    for store, km in self.catalog.nearest(*coords, k=NEAREST_RESULTS)]
+        if self.bssid_index is None:
+            raise ResidentError("no access point index; pass lat,lng")
+        match = self.bssid_index.match(self.wlan.scan())
+        if match is None:
+            return []
+        info, score = match
+        store = (self.catalog.get(info["id"], info.get("county")) if "id" in info
+                 else self.catalog.find(info["name"], info.get("county")))
+        return [_summary(store, score=round(score, 2))] if store else []
+
+    def resolve(self, query):
+        store = self.catalog.find(query)
+        if store:
+            return store
+        matches = self.catalog.search(query)
+        if not matches:
+            raise ResidentError(f"no store matches {query!r}")
+        if len(matches) > 1:
+            names = "、".join(s["門市名稱"] for s in matches[:5])
+            raise ResidentError(f"{len(matches)} stores match {query!r}: {names}")
+        return matches[0]
+
+    def cmd_connect(self, *words):
+        query = " ".join(words).strip()
+        if not query:
+            raise ResidentError("usage: connect <store name or keyword>")
+        store = self.resolve(query)
+        password = derive_password(store["電話"])
+        if not password:
+            raise ResidentError(f"cannot derive a password from {store['電話']}")
+        self.wlan.apply_profile(SSID, password)
+        self.wlan.connect(SSID)
+        result = self.verifier.verify(SSID, VERIFY_TIMEOUT)
+        if self.connect_stats is not None:
+            self.connect_stats.record(store, result.status, result.seconds)
+        if result.status == "connected" and self.bssid_index is not None:
+            self.bssid_index.learn(store, self.wlan.scan())
+        return dict(_summary(store), password=password,
+                    status=result.status, seconds=round(result.seconds, 2))
+
+
+def _summary(store, **extra):
+    return dict({"id": store[STORE_ID], "name": store["門市名稱"], "county": store["縣市"],
+                 "address": store["地址"]}, **extra)
+
+
+# ---------------------------------------------------------------------------
+# Server / client
+# ---------------------------------------------------------------------------
+
+class ResidentServer:
+    def __init__(self, handler, address=None, family=None):
+        if address is None:
+            address, family = default_address()
+        self.handler = handler
+        self.address = address
+        self.family = family
+        self._listener = None
+
+    def start(self):
+        """Bind the channel and serve it on a daemon thread."""
+        if ping(self.address, self.family):
+            raise ResidentError(f"already running on {self.address}")
+        if self.family == "AF_UNIX" and os.path.exists(self.address):
+            os.unlink(self.address)           # left behind by a crashed server
+        authkey = secrets.token_bytes(32)
+        path = key_path(self.address)
+        try:
+            os.unlink(path)                   # stale key; never write through it
+        except FileNotFoundError:
+            pass
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(authkey)
+        self._listener = Listener(self.address, self.family, authkey=authkey)
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        listener = self._listener
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                if self._listener is None:
+                    return            # closed
+                continue              # failed handshake
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                conn.send(self.handler.handle(conn.recv()))
+            except (OSError, EOFError) as e:
+                print(f"Resident client dropped: {e}")
+
+    def close(self):
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
+        try:
+            os.unlink(key_path(self.address))
+        except OSError:
+            pass
+
+
+def request(cmd, args=(), address=None, family=None):
+    """Send one command to the resident process and return its reply dict."""
+    if address is None:
+        address, family = default_address()
+    try:
+        with open(key_path(address), "rb") as f:
+            authkey = f.read()
+        with Client(address, family, authkey=authkey) as conn:
+            conn.send({"cmd": cmd, "args": list(args)})
+            return conn.recv()
+    except (OSError, EOFError) as e:
+        raise ResidentError(f"resident process not reachable at {address}: {e}") from e
+
+
+def ping(address=None, family=None):
+    try:
+        return request("ping", address=address, family=family).get("ok", False)
+    except ResidentError:
+        return False
+
+
+def serve_headless(base_dir="."):
+    """``python resident.py serve``: resident mode without the tray icon."""
+    from bssid_cache import BssidIndex
+    from catalog import ShardedCatalog, open_catalog
+    from catalog_refresh import current_catalog_dir
+    from connect_stats import ConnectStats
+    from wlan import ConnectionVerifier, NetshBackend
+
+    cached_dir = current_catalog_dir(os.path.join(base_dir, "catalog_cache"))
+    catalog = (ShardedCatalog(cached_dir) if cached_dir
+               else open_catalog(os.path.join(base_dir, "query_data")))
+    wlan = NetshBackend()
+    bssid_index = BssidIndex(os.path.join(base_dir, "bssid_index.json"))
+    bssid_index.migrate(catalog)
+    connect_stats = ConnectStats(os.path.join(base_dir, "connect_stats.json"))
+    connect_stats.migrate(catalog)
+    handler = CommandHandler(
+        catalog, os.path.join(base_dir, "settings.json"), wlan, ConnectionVerifier(wlan),
+        bssid_index, connect_stats,
+    )
+    server = ResidentServer(handler)
+    server.start()
+    print(f"Serving on {server.address}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def main(argv):
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__)
+        return 0
+    if argv[0] == "serve":
+        serve_headless()
+        return 0
+    try:
+        reply = request(argv[0], argv[1:])
+    except ResidentError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not reply["ok"]:
+        print(reply["error"], file=sys.stderr)
+        return 1
+    result = reply["result"]
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if isinstance(result, dict) and result.get("status", "connected") != "connected":
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,66 @@
+"""Warm-start snapshot of the UI and search state.
+
+On exit the app writes ``session.json`` next to ``settings.json``::
+
+    {"format": 2, "catalog_version": 4, "query": "...", "county": "...",
+     "setting_index": 0, "store": <門市編號>,
+     "favorite": {<row>}, "results": [{<row>}, ...]}
+
+``results`` are the first ``MAX_RESULTS`` dropdown rows (plus the selected
+store if it is further down) and ``favorite`` is the row shown in the
+favorites carousel, so on the next launch both can be put back on screen
+without paging in a single shard.  A snapshot taken against a
+different catalog version is ignored.
+"""
+import json
+import os
+
+from query_data.store_ids import STORE_ID
+
+SESSION_FORMAT = 2
+MAX_RESULTS = 50
+
+
+def take_snapshot(catalog_version, query, county, setting_index, store, favorite, results):
+    results = list(results[:MAX_RESULTS])
+    if store and store not in results:
+        results.append(store)
+    return {
+        "format": SESSION_FORMAT,
+        "catalog_version": catalog_version,
+        "query": query,
+        "county": county,
+        "setting_index": setting_index,
+        "store": store[STORE_ID] if store else None,
+        "favorite": favorite,
+        "results": results,
+    }
+
+
+def load_session(path, catalog_version):
+    """The saved snapshot, or None if missing, unreadable or for another catalog."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if snapshot.get("format") != SESSION_FORMAT:
+        return None
+    if snapshot.get("catalog_version") != catalog_version:
+        return None
+    return snapshot
+
+
+def save_session(path, snapshot):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def selected_index(snapshot):
+    """Position of the snapshot's selected store within its ``results``, or -1."""
+    store_id = snapshot.get("store")
+    if store_id is None:
+        return -1
+    return next((i for i, row in enumerate(snapshot["results"]) if row.get(STORE_ID) == store_id), -1)
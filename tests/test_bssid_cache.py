@@ -0,0 +1,63 @@
+"""``BssidIndex.match`` against access points parsed from recorded netsh output."""
+import pytest
+
+from bssid_cache import BssidIndex
+from conftest import read_fixture
+from query_data.store_ids import STORE_ID
+from wlan import parse_networks
+
+XINYI = {STORE_ID: 101, "門市名稱": "信義門市", "縣市": "臺北市"}
+DAAN = {STORE_ID: 102, "門市名稱": "大安門市", "縣市": "臺北市"}
+MINSHENG = {STORE_ID: 103, "門市名稱": "民生門市", "縣市": "臺北市"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BssidIndex(str(tmp_path / "bssid_index.json"))
+
+
+def louisa(name):
+    return [n for n in parse_networks(read_fixture("netsh", name)) if n["ssid"] == "LouisaCoffee"]
+
+
+def test_match_learned_store_across_locales(index):
+    index.learn(XINYI, louisa("networks_zh.txt"))
+    info, score = index.match(louisa("networks_en.txt"))
+    assert info == {"id": 101, "name": "信義門市", "county": "臺北市", "key": "101"}
+    assert score == pytest.approx(1.0)
+
+
+def test_match_survives_reload(index):
+    index.learn(XINYI, louisa("networks_en.txt"))
+    reloaded = BssidIndex(index.path)
+    assert reloaded.match(louisa("networks_zh.txt"))[0]["id"] == 101
+
+
+def test_match_unknown_access_points(index):
+    assert index.match(louisa("networks_en.txt")) is None
+    index.learn(XINYI, louisa("networks_en.txt"))
+    others = [n for n in parse_networks(read_fixture("netsh", "networks_en.txt"))
+              if n["ssid"] != "LouisaCoffee"]
+    assert index.match(others) is None
+    assert index.match([]) is None
+
+
+def test_match_stronger_signal_wins(index):
+    strong, weak = louisa("networks_en.txt")          # 88% and 52%
+    index.learn(XINYI, [strong])
+    index.learn(DAAN, [weak])
+    info, score = index.match([strong, weak])
+    assert info["id"] == 101
+    assert score == pytest.approx(88 / (88 + 52))
+
+
+def test_match_ambiguous_below_min_score(index):
+    ap = louisa("networks_en.txt")[:1]
+    index.learn(XINYI, ap)
+    index.learn(DAAN, ap)
+    index.learn(DAAN, ap)
+    info, score = index.match(ap)
+    assert info["id"] == 102 and score == pytest.approx(2 / 3)
+    index.learn(XINYI, ap)                              # now seen twice at each
+    index.learn(MINSHENG, ap)
+    assert index.match(ap) is None                      # 2/5 < MIN_SCORE
@@ -0,0 +1,85 @@
+"""``catalog_diff`` against the bundled catalog and edited copies of it."""
+import csv
+import json
+import os
+
+import pytest
+
+import catalog_diff
+from conftest import ROOT
+from query_data.store_ids import STORE_ID
+
+DATA_CSV = os.path.join(ROOT, "query_data", "data.csv")
+SHARD_DIR = os.path.join(ROOT, "query_data", "shards")
+
+
+def read_rows():
+    with open(DATA_CSV, encoding="utf-8-sig", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def write_rows(path, rows, fieldnames=None):
+    fieldnames = fieldnames or list(rows[0])
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def edited(rows):
+    """Reordered, 臺/台 and spacing noise, plus one store in each category."""
+    rows = [dict(r) for r in reversed(rows)]
+    for row in rows:
+        row["縣市"] = row["縣市"].replace("台", "臺")
+        row["地址"] = "  " + row["地址"].replace("台", "臺") + " "
+    rows[0]["門市名稱"] += "（新址）"
+    rows[1]["電話"] = "02-2720-0000"
+    rows[2]["營業時間"] = "週一至週日 08:00-22:00"
+    removed = rows.pop(3)
+    return rows, removed
+
+
+def test_identical_catalogs():
+    report = catalog_diff.diff_catalogs(catalog_diff.iter_rows(DATA_CSV),
+                                        catalog_diff.iter_rows(SHARD_DIR))
+    assert report["old_stores"] == report["new_stores"] == report["unchanged"] == 550
+    assert not any(report["counts"].values())
+    assert catalog_diff.main([DATA_CSV, SHARD_DIR]) == 0
+
+
+def test_changes_are_categorized():
+    rows, removed = edited(read_rows())
+    report = catalog_diff.diff_catalogs(read_rows(), rows)
+    assert report["counts"] == {"added": 0, "removed": 1, "renamed": 1, "moved": 0,
+                                "phone": 1, "hours": 1}
+    assert report["unchanged"] == 546
+    assert [r["store_id"] for r in report["removed"]] == [removed[STORE_ID]]
+    phone = next(c["changes"]["phone"] for c in report["changed"] if "phone" in c["changes"])
+    assert (phone["to"], phone["password_to"]) == ("02-2720-0000", "27200000")
+
+
+def test_without_ids_matches_by_name_and_address():
+    rows, _ = edited(read_rows())
+    old = [{k: v for k, v in r.items() if k != STORE_ID} for r in read_rows()]
+    new = [{k: v for k, v in r.items() if k != STORE_ID} for r in rows]
+    report = catalog_diff.diff_catalogs(old, new)
+    # Matched by phone + location or a unique name instead, the rename stays one store.
+    assert report["counts"]["renamed"] == 1 and report["counts"]["added"] == 0
+    assert report["counts"]["removed"] == 1
+
+
+def test_exit_status_and_json(tmp_path, capsys):
+    rows, _ = edited(read_rows())
+    new = write_rows(tmp_path / "data.csv", rows)
+    out = tmp_path / "diff.json"
+    assert catalog_diff.main([DATA_CSV, new, "--json", str(out)]) == 1
+    assert json.loads(out.read_text(encoding="utf-8"))["counts"]["phone"] == 1
+    assert catalog_diff.main([DATA_CSV, new, "--fail-on", "added,moved"]) == 0
+    assert catalog_diff.main([DATA_CSV, str(tmp_path / "missing.csv")]) == 2
+    assert "cannot read catalog" in capsys.readouterr().err
+
+
+def test_unknown_fail_on_category():
+    with pytest.raises(SystemExit):
+        catalog_diff.main([DATA_CSV, DATA_CSV, "--fail-on", "colour"])
@@ -0,0 +1,54 @@
+"""``ConnectStats.migrate`` of files keyed on name + address."""
+import json
+
+import pytest
+
+from catalog import ShardedCatalog
+from connect_stats import ConnectStats
+from query_data.store_ids import STORE_ID
+
+
+class CountingCatalog:
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.finds = 0
+
+    def find(self, name, county=None):
+        self.finds += 1
+        return self.catalog.find(name, county)
+
+
+@pytest.fixture
+def catalog():
+    return CountingCatalog(ShardedCatalog.from_rows([
+        {"縣市": "臺北市", "門市名稱": "信義門市", "電話": "02-2720-1234", "經緯度座標": "25.04,121.56",
+         "地址": "臺北市信義區松仁路1號", "營業時間": "", "開始時間": "", "結束時間": ""},
+    ]))
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    path = tmp_path / "connect_stats.json"
+    path.write_text(json.dumps({
+        "a1b2c3d4e5f6": {"name": "信義門市", "county": "臺北市", "connected": 3, "seconds": [1.0, 2.0, 3.0]},
+        "0f9e8d7c6b5a": {"name": "已歇業門市", "county": "臺北市", "timeout": 2},
+    }, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_migrate_rekeys_known_stores(legacy, catalog):
+    stats = ConnectStats(legacy)
+    stats.migrate(catalog)
+    store_id = catalog.catalog.find("信義門市")[STORE_ID]
+    entry = ConnectStats(legacy).stores[str(store_id)]
+    assert (entry["id"], entry["connected"], entry["seconds"]) == (store_id, 3, [1.0, 2.0, 3.0])
+
+
+def test_migrate_tombstones_unknown_stores_once(legacy, catalog):
+    ConnectStats(legacy).migrate(catalog)
+    assert catalog.finds == 2
+    stats = ConnectStats(legacy)
+    assert stats.stores["0f9e8d7c6b5a"] == {"name": "已歇業門市", "county": "臺北市", "timeout": 2, "id": None}
+    stats.migrate(catalog)                       # next launch: nothing left to look up
+    assert catalog.finds == 2
+    assert [row[0] for row in stats.summary()] == ["信義門市", "已歇業門市"]
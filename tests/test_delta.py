@@ -0,0 +1,117 @@
+"""Catalog deltas: publishing a version chain and walking it on refresh."""
+import json
+import os
+import shutil
+
+import pytest
+
+import catalog_refresh
+from query_data import shards
+from query_data.delta import DeltaError, apply_delta, compute_delta, publish, read_published
+
+# The columns of each published version, as the schema grew.
+V1 = shards.FIELDNAMES[:8]
+V2 = V1 + ["名稱鍵", "地址鍵"]
+V3 = V2 + ["行政區", "路名"]
+V4 = shards.FIELDNAMES
+
+
+def store(store_id, county, name, phone, district="信義區", road="松仁路"):
+    return {"縣市": county, "門市名稱": name, "電話": phone, "經緯度座標": "25.04,121.56",
+            "地址": f"{county}{district}{road}{store_id}號", "營業時間": "07:00-20:00",
+            "開始時間": "07:00", "結束時間": "20:00", "名稱鍵": name, "地址鍵": f"{county}{road}",
+            "行政區": district, "路名": road, shards.STORE_ID: store_id}
+
+
+def catalog(*changes):
+    rows = {1: store(1, "臺北市", "信義門市", "02-2720-1234"),
+            2: store(2, "臺北市", "松仁門市", "02-2720-5678"),
+            3: store(3, "新北市", "板橋門市", "02-2950-1111", "板橋區", "文化路"),
+            4: store(4, "臺中市", "公益門市", "04-2320-2222", "南屯區", "公益路")}
+    for change in changes:
+        change(rows)
+    return list(rows.values())
+
+
+def rename(rows):
+    rows[2] = dict(rows[2], 門市名稱="松仁二門市", 名稱鍵="松仁二門市")
+
+
+def close_banqiao(rows):
+    del rows[3]
+
+
+def open_taoyuan(rows):
+    rows[5] = store(5, "桃園市", "中正門市", "03-3350-3333", "桃園區", "中正路")
+
+
+@pytest.fixture
+def published(tmp_path):
+    """``(shard_dir, {version: copy of that version's shard dir})`` for v1 → v4."""
+    shard_dir = str(tmp_path / "shards")
+    versions = {}
+    for version, (fields, rows) in enumerate([
+            (V1, catalog()),
+            (V2, catalog(rename)),
+            (V3, catalog(rename, close_banqiao)),
+            (V4, catalog(rename, close_banqiao, open_taoyuan))], start=1):
+        assert publish(rows, shard_dir, fields)["version"] == version
+        versions[version] = str(tmp_path / f"v{version}")
+        shutil.copytree(shard_dir, versions[version])
+    return shard_dir, versions
+
+
+def url_of(shard_dir):
+    return "file://" + os.path.abspath(os.path.join(shard_dir, shards.MANIFEST_NAME))
+
+
+@pytest.mark.parametrize("start", [1, 2, 3])
+def test_chain_walks_across_schema_changes(published, start):
+    shard_dir, versions = published
+    manifest = shards.read_manifest(shard_dir)
+    rows, touched = catalog_refresh._apply_delta_chain(url_of(shard_dir), versions[start], manifest)
+    _, expected = read_published(shard_dir)
+    key = lambda r: r["門市名稱"]  # noqa: E731
+    assert ([{f: str(r.get(f, "")) for f in V4} for r in sorted(rows, key=key)]
+            == sorted(expected, key=key))
+    assert "桃園市" in touched
+
+
+def test_each_delta_records_its_fields(published):
+    shard_dir, _ = published
+    for entry, fields in zip(shards.read_manifest(shard_dir)["deltas"], (V2, V3, V4)):
+        with open(os.path.join(shard_dir, entry["file"]), encoding="utf-8") as f:
+            assert json.load(f)["fields"] == fields
+
+
+def test_download_applies_chain_without_fetching_shards(published, tmp_path, monkeypatch, capsys):
+    shard_dir, versions = published
+    fetched = []
+    get = catalog_refresh._get
+
+    def recording_get(url, headers=None):
+        fetched.append(url)
+        return get(url, headers)
+    monkeypatch.setattr(catalog_refresh, "_get", recording_get)
+    new_dir, touched = catalog_refresh.download_catalog(
+        url_of(shard_dir), str(tmp_path / "cache"), bundled_dir=versions[1])
+    assert "Catalog delta failed" not in capsys.readouterr().out
+    assert not [u for u in fetched if u.endswith(".csv")]
+    assert shards.read_manifest(new_dir)["version"] == 4
+    # The schema changes rewrite every row, so every county is touched.
+    assert touched == {"臺北市", "新北市", "臺中市", "桃園市"}
+
+
+def test_apply_delta_by_id_follows_rename():
+    old, new = catalog(), catalog(rename)
+    delta = compute_delta(old, new, 1, 2, V4, key="id")
+    assert (len(delta["added"]), len(delta["removed"]), len(delta["changed"])) == (0, 0, 1)
+    rows, touched = apply_delta(old, delta)
+    assert sorted(r["門市名稱"] for r in rows) == sorted(r["門市名稱"] for r in new)
+    assert touched == {"臺北市"}
+
+
+def test_apply_delta_detects_drift():
+    delta = compute_delta(catalog(), catalog(rename), 1, 2, V4, key="id")
+    with pytest.raises(DeltaError, match="base checksum mismatch"):
+        apply_delta(catalog(close_banqiao), delta)
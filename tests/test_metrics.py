@@ -0,0 +1,57 @@
+"""Connection timing of the instrumented scraper session."""
+import http.server
+import socket
+import threading
+
+import pytest
+import requests
+
+from query_data.metrics import RunMetrics, instrument_session
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class QuietHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"<html>ok</html>"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_host_is_resolved_once(server, monkeypatch):
+    lookups = []
+    getaddrinfo = socket.getaddrinfo
+
+    def counting_getaddrinfo(host, *args, **kwargs):
+        lookups.append(host)
+        return getaddrinfo(host, *args, **kwargs)
+    monkeypatch.setattr(socket, "getaddrinfo", counting_getaddrinfo)
+
+    metrics = RunMetrics()
+    session = instrument_session(requests.Session())
+    with metrics.county("臺北市") as sample:
+        assert session.get(f"http://localhost:{server.server_port}/").text == "<html>ok</html>"
+    assert lookups.count("localhost") == 1
+    assert sample["dns_seconds"] > 0 and sample["connect_seconds"] > 0
+    assert sample["requests"] == 1 and sample["bytes"] == len("<html>ok</html>")
+
+
+def test_connect_errors_still_raise(server):
+    session = instrument_session(requests.Session())
+    port = server.server_port
+    server.shutdown()
+    server.server_close()
+    with RunMetrics().county("臺北市"), pytest.raises(requests.ConnectionError):
+        session.get(f"http://127.0.0.1:{port}/", timeout=2)
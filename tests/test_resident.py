@@ -0,0 +1,97 @@
+"""Round trips through ``ResidentServer`` over a Unix socket."""
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+from catalog import ShardedCatalog
+from resident import CommandHandler, ResidentError, ResidentServer, ping, request, runtime_dir
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Unix socket")
+
+
+def store(name, lat, lng):
+    return {"縣市": "臺北市", "門市名稱": name, "電話": "02-2720-1234", "經緯度座標": f"{lat},{lng}",
+            "地址": f"臺北市信義區{name}", "營業時間": "", "開始時間": "", "結束時間": ""}
+
+
+@pytest.fixture
+def server(tmp_path):
+    catalog = ShardedCatalog.from_rows([store("信義門市", 25.0400, 121.5650),
+                                        store("松仁門市", 25.0500, 121.5750)])
+    handler = CommandHandler(catalog, str(tmp_path / "settings.json"), wlan=None, verifier=None)
+    server = ResidentServer(handler, str(tmp_path / "louisa.sock"), "AF_UNIX")
+    server.start()
+    yield server
+    server.close()
+
+
+def test_ping(server):
+    assert request("ping", address=server.address, family="AF_UNIX") == {"ok": True, "result": "pong"}
+    assert ping(server.address, "AF_UNIX")
+
+
+def test_nearest(server):
+    reply = request("nearest", ["25.0401,121.5651"], address=server.address, family="AF_UNIX")
+    assert reply["ok"]
+    assert [s["name"] for s in reply["result"]] == ["信義門市", "松仁門市"]
+    assert reply["result"][0]["km"] < reply["result"][1]["km"]
+
+
+def test_bad_requests(server):
+    assert request("reboot", address=server.address, family="AF_UNIX") == {
+        "ok": False, "error": "unknown command: reboot"}
+    reply = request("nearest", ["north"], address=server.address, family="AF_UNIX")
+    assert reply == {"ok": False, "error": "not a lat,lng pair: north"}
+
+
+def test_key_is_private(server):
+    mode = os.stat(server.address + ".key").st_mode
+    assert stat.S_IMODE(mode) == 0o600
+
+
+def test_second_server_refused(server):
+    with pytest.raises(ResidentError):
+        ResidentServer(server.handler, server.address, "AF_UNIX").start()
+
+
+def test_close_removes_key(server):
+    server.close()
+    assert not os.path.exists(server.address + ".key")
+    assert not ping(server.address, "AF_UNIX")
+
+
+def test_runtime_dir_is_private(tmp_path, monkeypatch):
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    path = runtime_dir()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o700
+    os.chmod(path, 0o755)
+    with pytest.raises(ResidentError):
+        runtime_dir()
+
+
+def test_set_catalog_waits_for_running_command(server):
+    handler = server.handler
+    old, new = handler.catalog, ShardedCatalog.from_rows([store("松壽門市", 25.0400, 121.5650)])
+    started, release, seen = threading.Event(), threading.Event(), []
+
+    def cmd_slow():
+        seen.append(handler.catalog)
+        started.set()
+        release.wait(5)
+        seen.append(handler.catalog)
+    handler.cmd_slow = cmd_slow
+    command = threading.Thread(target=handler.handle, args=({"cmd": "slow"},))
+    command.start()
+    started.wait(5)
+    swap = threading.Thread(target=handler.set_catalog, args=(new,))
+    swap.start()
+    swap.join(0.2)
+    assert swap.is_alive()                      # blocked behind the command
+    release.set()
+    command.join(5)
+    swap.join(5)
+    assert seen == [old, old] and handler.catalog is new
@@ -0,0 +1,48 @@
+"""The scraper pipeline reports every county exactly once, however it fails."""
+import threading
+
+import pytest
+
+from query_data import scrape_all
+from query_data.metrics import RunMetrics
+
+PAGE = """<div class="row"><div class="store_info"><h4>{county}門市</h4><p>電話/02-2720-1234</p></div>
+<input class="coordinate" rel-store-lat="25.04" rel-store-lng="121.56"
+ rel-store-address="{county}中正路1號" rel-store-date="07:00-20:00"></div>"""
+
+
+def run_scraper(tmp_path, monkeypatch, fetch, *extra):
+    args = scrape_all.parse_args(["--out-dir", str(tmp_path / "out"), "--report-dir", str(tmp_path),
+                                  "--parse-workers", "1", "--queue-size", "1", *extra])
+    outcome = {}
+
+    def target():
+        try:
+            scrape_all.run(args, RunMetrics())
+            outcome["result"] = "ok"
+        except BaseException as e:
+            outcome["result"] = e
+    monkeypatch.setattr(scrape_all, "fetch_county", fetch)
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(60)
+    assert not thread.is_alive(), "pipeline hung"
+    return outcome["result"]
+
+
+def test_all_counties_written(tmp_path, monkeypatch):
+    assert run_scraper(tmp_path, monkeypatch, lambda session, county: PAGE.format(county=county)) == "ok"
+    with open(tmp_path / "out" / "data.csv", encoding="utf-8-sig") as f:
+        assert len(f.read().splitlines()) == len(scrape_all.COUNTIES) + 1
+
+
+@pytest.mark.parametrize("failure", ["fetch", "bookkeeping"])
+def test_failed_county_does_not_hang(tmp_path, monkeypatch, failure):
+    def fetch(session, county):
+        if county == "新竹市":
+            if failure == "fetch":
+                raise OSError("connection reset")
+            return None                      # fails after fetch(), in the page bookkeeping
+        return PAGE.format(county=county)
+    result = run_scraper(tmp_path, monkeypatch, fetch)
+    assert isinstance(result, SystemExit) and "新竹市" in str(result)
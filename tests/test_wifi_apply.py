@@ -0,0 +1,121 @@
+"""The candidate chain: ``rank_candidates`` and ``apply_with_fallback``."""
+import pytest
+
+from catalog import ShardedCatalog
+from wifi_apply import apply_with_fallback, rank_candidates
+from wlan import SSID, VerifyResult
+
+
+def store(name, phone, lat, lng):
+    return {"縣市": "臺北市", "門市名稱": name, "電話": phone, "經緯度座標": f"{lat},{lng}",
+            "地址": f"臺北市信義區松仁路{len(name)}號", "營業時間": "", "開始時間": "", "結束時間": ""}
+
+
+class FakeBackend:
+    def __init__(self, fail_apply=()):
+        self.fail_apply = set(fail_apply)
+        self.password = None
+        self.calls = []
+
+    def apply_profile(self, network_name, password):
+        self.calls.append(("apply", network_name, password))
+        if password in self.fail_apply:
+            raise OSError("netsh add profile failed")
+        self.password = password
+
+    def connect(self, network_name):
+        self.calls.append(("connect", network_name))
+
+
+class FakeVerifier:
+    """Reports a canned status for whichever password the backend holds."""
+
+    def __init__(self, backend, statuses):
+        self.backend = backend
+        self.statuses = statuses
+
+    def verify(self, ssid, timeout):
+        status, seconds = self.statuses[self.backend.password]
+        return VerifyResult(status, seconds, "6c:3b:6b:a1:12:40" if status == "connected" else "")
+
+
+def ticking(step=1.0):
+    now = [0.0]
+
+    def clock():
+        now[0] += step
+        return now[0]
+    return clock
+
+
+CANDIDATES = [({"門市名稱": "信義門市"}, "27201234"),
+              ({"門市名稱": "松仁門市"}, "27205678"),
+              ({"門市名稱": "市府門市"}, "27209012")]
+
+
+def test_first_candidate_connects():
+    backend = FakeBackend()
+    verifier = FakeVerifier(backend, {"27201234": ("connected", 1.5)})
+    tried = []
+    result = apply_with_fallback(backend, verifier, CANDIDATES, clock=ticking(),
+                                 on_attempt=lambda i, s: tried.append(i))
+    assert (result.store["門市名稱"], result.password, result.status) == ("信義門市", "27201234", "connected")
+    assert [a.status for a in result.attempts] == ["connected"]
+    assert result.attempts[0].seconds == 1.5
+    assert tried == [0]
+    assert backend.calls == [("apply", SSID, "27201234"), ("connect", SSID)]
+
+
+def test_falls_back_past_auth_failure_and_timeout():
+    backend = FakeBackend()
+    verifier = FakeVerifier(backend, {"27201234": ("auth_failed", 2.0),
+                                      "27205678": ("timeout", 6.0),
+                                      "27209012": ("connected", 0.8)})
+    result = apply_with_fallback(backend, verifier, CANDIDATES, clock=ticking())
+    assert result.store["門市名稱"] == "市府門市" and result.status == "connected"
+    assert [(a.password, a.status, a.seconds) for a in result.attempts] == [
+        ("27201234", "auth_failed", 2.0), ("27205678", "timeout", 6.0), ("27209012", "connected", 0.8)]
+
+
+def test_every_candidate_fails():
+    backend = FakeBackend(fail_apply={"27209012"})
+    verifier = FakeVerifier(backend, {"27201234": ("timeout", 6.0), "27205678": ("auth_failed", 1.0)})
+    result = apply_with_fallback(backend, verifier, CANDIDATES, clock=ticking())
+    assert (result.store, result.password) == (None, None)
+    assert [a.status for a in result.attempts] == ["timeout", "auth_failed", "error"]
+    assert result.status == "error"
+
+
+def test_no_candidates():
+    result = apply_with_fallback(FakeBackend(), None, [], clock=ticking())
+    assert (result.status, result.attempts) == ("no_candidates", [])
+
+
+@pytest.fixture
+def catalog():
+    return ShardedCatalog.from_rows([
+        store("無電話門市", "", 25.0400, 121.5650),
+        store("松仁門市", "02-2720-5678", 25.0405, 121.5655),
+        store("同號門市", "02-2720-5678", 25.0407, 121.5657),
+        store("市府門市", "02-2720-9012", 25.0410, 121.5660),
+        store("松壽門市", "02-2722-3456", 25.0415, 121.5665),
+        store("象山門市", "02-2723-7890", 25.0420, 121.5670),
+        store("遠方門市", "02-2345-0000", 25.1500, 121.7000),
+    ])
+
+
+def test_rank_candidates_selected_store_first(catalog):
+    selected = catalog.find("松仁門市")
+    ranked = [(s["門市名稱"], p) for s, p in rank_candidates(catalog, selected, max_neighbors=2)]
+    assert ranked == [("松仁門市", "27205678"), ("市府門市", "27209012"), ("松壽門市", "27223456")]
+
+
+def test_rank_candidates_without_password_keeps_max_neighbors(catalog):
+    selected = catalog.find("無電話門市")
+    ranked = [s["門市名稱"] for s, _ in rank_candidates(catalog, selected, max_neighbors=2)]
+    assert ranked == ["松仁門市", "市府門市"]
+
+
+def test_rank_candidates_radius(catalog):
+    selected = catalog.find("遠方門市")
+    assert [s["門市名稱"] for s, _ in rank_candidates(catalog, selected)] == ["遠方門市"]
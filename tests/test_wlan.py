@@ -0,0 +1,46 @@
+"""Parsers of ``netsh wlan`` output, against recorded English and zh-TW output."""
+from conftest import read_fixture
+from wlan import parse_interfaces, parse_networks
+
+
+def test_parse_networks_en():
+    networks = parse_networks(read_fixture("netsh", "networks_en.txt"))
+    assert networks == [
+        {"ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:40", "signal": 88},
+        {"ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:41", "signal": 52},
+        {"ssid": "CHT Wi-Fi(HiNet)", "bssid": "00:1d:aa:5c:90:0e", "signal": 30},
+        # Hidden network; a 0% signal must not pick up "Channel Utilization: 12 (4 %)".
+        {"ssid": "", "bssid": "7a:45:58:0c:11:9f", "signal": 0},
+    ]
+
+
+def test_parse_networks_zh():
+    networks = parse_networks(read_fixture("netsh", "networks_zh.txt"))
+    assert networks == [
+        {"ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:40", "signal": 91},
+        {"ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:41", "signal": 47},
+        {"ssid": "iTaiwan", "bssid": "00:1d:aa:5c:90:0e", "signal": 35},
+    ]
+
+
+def test_parse_networks_empty():
+    assert parse_networks("") == []
+    assert parse_networks("There are 0 networks currently visible.\n") == []
+
+
+def test_parse_interfaces_en():
+    assert parse_interfaces(read_fixture("netsh", "interfaces_en.txt")) == {
+        "state": "connected", "ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:40",
+    }
+
+
+def test_parse_interfaces_zh_reads_first_interface_only():
+    assert parse_interfaces(read_fixture("netsh", "interfaces_zh.txt")) == {
+        "state": "authenticating", "ssid": "LouisaCoffee", "bssid": "6c:3b:6b:a1:12:41",
+    }
+
+
+def test_parse_interfaces_without_wifi():
+    assert parse_interfaces("There is 0 interface on the system:\n") == {
+        "state": "disconnected", "ssid": "", "bssid": "",
+    }
@@ -0,0 +1,138 @@
+"""Opt-in tracing of the app's hot paths.
+
+Set ``LOUISA_TRACE=1`` (or ``LOUISA_TRACE=path/to/trace.json``) to record a
+span around every ``@traced`` method and Qt event dispatch.  On exit the spans
+are written as a Chrome trace-event file (open it in chrome://tracing or
+https://ui.perfetto.dev) and a p50/p99 summary per span name is printed.
+
+When the variable is unset ``traced`` returns the function unchanged, so the
+disabled path costs nothing.
+"""
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV = "LOUISA_TRACE"
+DEFAULT_TRACE_FILE = "louisa_trace.json"
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Tracer:
+    def __init__(self, path, min_event_us=50):
+        self.path = path
+        self.min_event_us = min_event_us
+        self.pid = os.getpid()
+        self.events = []
+        self.durations = {}
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, name, start, end, cat="app", keep_event=True):
+        dur_us = (end - start) * 1e6
+        with self._lock:
+            self.durations.setdefault(name, []).append(dur_us)
+            if keep_event or dur_us >= self.min_event_us:
+                self.events.append({
+                    "name": name, "cat": cat, "ph": "X",
+                    "ts": (start - self._t0) * 1e6, "dur": dur_us,
+                    "pid": self.pid, "tid": threading.get_ident(),
+                })
+
+    def span(self, name, cat="app"):
+        return _Span(self, name, cat)
+
+    def summary(self):
+        result = {}
+        for name, values in self.durations.items():
+            values = sorted(values)
+            result[name] = {
+                "count": len(values),
+                "p50_ms": percentile(values, 50) / 1000,
+                "p99_ms": percentile(values, 99) / 1000,
+                "max_ms": values[-1] / 1000,
+            }
+        return result
+
+    def write(self):
+        summary = self.summary()
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "traceEvents": self.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"summary": summary},
+            }, f)
+        lines = [f"{'span':<40}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for name, s in sorted(summary.items(), key=lambda kv: -kv[1]["p99_ms"]):
+            lines.append(f"{name:<40}{s['count']:>8}{s['p50_ms']:>10.3f}"
+                         f"{s['p99_ms']:>10.3f}{s['max_ms']:>10.3f}")
+        print(f"Trace written to {self.path}\n" + "\n".join(lines), file=sys.stderr)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "start")
+
+    def __init__(self, tracer, name, cat):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter(), self.cat)
+        return False
+
+
+def _tracer_from_env():
+    value = os.environ.get(TRACE_ENV, "").strip()
+    if not value or value == "0":
+        return None
+    path = DEFAULT_TRACE_FILE if value.lower() in ("1", "true", "yes") else value
+    tracer = Tracer(os.path.abspath(path))
+    atexit.register(tracer.write)
+    return tracer
+
+
+TRACER = _tracer_from_env()
+
+
+def enabled():
+    return TRACER is not None
+
+
+def traced(name=None):
+    """Decorator: record a span around each call when tracing is enabled."""
+    def decorator(func):
+        if TRACER is None:
+            return func
+        span_name = name or func.__qualname__
+        code = func.__code__
+        # PyQt passes a slot only as many signal arguments as it declares;
+        # the generic wrapper has to drop the extras the same way.
+        max_args = None if code.co_flags & inspect.CO_VARARGS else code.co_argcount
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if max_args is not None:
+                args = args[:max_args]
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                TRACER.record(span_name, start, time.perf_counter())
+        return wrapper
+    return decorator
@@ -0,0 +1,79 @@
+"""A small UI state store with batched, per-slice re-rendering.
+
+State is a handful of named slices (``query``, ``county``, ``selection``,
+``favorites``, ``status``, ``catalog``).  Each UI section subscribes to the
+slices it reads; ``set`` only marks the changed slices dirty and schedules one
+``flush`` for the end of the event-loop turn, which calls every subscriber
+whose slices changed — once, however many times they were set.
+
+Renderers may set further slices (a new dropdown list changes the selection);
+subscribers registered after that renderer see the change in the same pass,
+so sections are subscribed in dependency order.  Slices holding mutable
+values that are changed in place are marked with ``touch``.
+"""
+
+MAX_PASSES = 8
+
+
+class UiState:
+    def __init__(self, schedule, **initial):
+        """``schedule(fn)`` runs ``fn`` on a later event-loop turn (QTimer.singleShot(0, fn))."""
+        self._schedule = schedule
+        self._values = dict(initial)
+        self._dirty = set()
+        self._subscribers = []          # [(slices, render), ...]
+        self._scheduled = False
+        self._flushing = False
+        self.renders = {}               # render name -> count, for tracing / tests
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def get(self, name, default=None):
+        return self._values.get(name, default)
+
+    def subscribe(self, slices, render):
+        self._subscribers.append((frozenset(slices), render))
+
+    def set(self, **changes):
+        changed = [k for k, v in changes.items() if k not in self._values or self._values[k] != v]
+        for name in changed:
+            self._values[name] = changes[name]
+        self.touch(*changed)
+
+    def pending(self):
+        """Whether a flush is scheduled or slices are still dirty."""
+        return self._scheduled or bool(self._dirty)
+
+    def touch(self, *names):
+        if not names:
+            return
+        self._dirty.update(names)
+        if not self._scheduled and not self._flushing:
+            self._scheduled = True
+            self._schedule(self.flush)
+
+    def flush(self):
+        """Render every section whose slices changed since the last flush."""
+        self._scheduled = False
+        self._flushing = True
+        try:
+            for _ in range(MAX_PASSES):
+                if not self._dirty:
+                    break
+                pending, self._dirty = self._dirty, set()
+                for slices, render in self._subscribers:
+                    # Slices set by an earlier renderer reach the later ones
+                    # in this same pass.
+                    pending |= self._dirty
+                    self._dirty = set()
+                    if slices & pending:
+                        name = getattr(render, "__name__", repr(render))
+                        self.renders[name] = self.renders.get(name, 0) + 1
+                        render()
+        finally:
+            self._flushing = False
+        if self._dirty:
+            # Renderers kept invalidating each other; finish on the next turn.
+            self._scheduled = True
+            self._schedule(self.flush)
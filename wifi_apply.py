@@ -0,0 +1,80 @@
+"""Password derivation and the candidate fallback chain.
+
+With two stores a few hundred metres apart it's easy to pick the wrong one.
+``rank_candidates`` lists the selected store first, then its nearest
+neighbours (by ``經緯度座標``) that yield a different password;
+``apply_with_fallback`` applies each in turn, verifies the association and
+stops at the first one that connects.
+"""
+import time
+from collections import namedtuple
+
+from geo import parse_coordinates
+from wlan import SSID
+
+Attempt = namedtuple("Attempt", "store password status seconds")
+ChainResult = namedtuple("ChainResult", "store password status seconds attempts")
+
+
+def derive_password(phone):
+    """The WiFi key is the store's phone number without the area code."""
+    phone = phone.replace("-", "")
+    if len(phone) == 10:
+        return phone[-8:]
+    elif len(phone) == 9:
+        return phone[-9:]
+    return None
+
+
+def rank_candidates(catalog, store, max_neighbors=3, radius_km=2.0):
+    """``[(store, password), ...]``: ``store`` first, then distinct-password neighbours."""
+    candidates = []
+    seen = set()
+    password = derive_password(store["電話"])
+    if password:
+        candidates.append((store, password))
+        seen.add(password)
+
+    point = parse_coordinates(store.get("經緯度座標", ""))
+    if point is None:
+        return candidates
+    neighbors = 0
+    for neighbor, _km in catalog.nearest(*point, k=max_neighbors + 5, radius_km=radius_km):
+        if neighbors >= max_neighbors:
+            break
+        password = derive_password(neighbor["電話"])
+        if not password or password in seen:
+            continue
+        candidates.append((neighbor, password))
+        seen.add(password)
+        neighbors += 1
+    return candidates
+
+
+def apply_with_fallback(backend, verifier, candidates, ssid=SSID, timeout=6.0,
+                        on_attempt=None, clock=time.monotonic):
+    """Try ``candidates`` in order until one connects.
+
+    ``on_attempt(index, store)`` is called before each try.  Each
+    ``Attempt.seconds`` is that store's verify time (time-to-connected when
+    it connected); ``ChainResult.seconds`` spans the whole chain.
+    """
+    started = clock()
+    attempts = []
+    for i, (store, password) in enumerate(candidates):
+        if on_attempt:
+            on_attempt(i, store)
+        t0 = clock()
+        try:
+            backend.apply_profile(ssid, password)
+            backend.connect(ssid)
+            result = verifier.verify(ssid, timeout)
+            status, seconds = result.status, result.seconds
+        except Exception as e:
+            print(f"Applying {store['門市名稱']} failed: {e}")
+            status, seconds = "error", clock() - t0
+        attempts.append(Attempt(store, password, status, seconds))
+        if status == "connected":
+            return ChainResult(store, password, status, clock() - started, attempts)
+    last = attempts[-1].status if attempts else "no_candidates"
+    return ChainResult(None, None, last, clock() - started, attempts)
@@ -0,0 +1,200 @@
+"""Talking to the WLAN stack (``netsh wlan`` on Windows).
+
+The parsers are plain functions over the command's text output, so they can
+be exercised with recorded output on any platform.  ``NetshBackend`` is the
+only place that actually runs ``netsh``; ``ConnectionVerifier`` only needs an
+object with ``interface_state()``, so a fake backend can stand in for it.
+"""
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+SSID = "LouisaCoffee"
+
+PROFILE_TEMPLATE = """<?xml version="1.0"?>
+<WLANProfile xmlns="http://www.microsoft.com/networking/WLAN/profile/v1">
+    <name>{network_name}</name>
+    <SSIDConfig>
+        <SSID>
+            <name>{network_name}</name>
+        </SSID>
+    </SSIDConfig>
+    <connectionType>ESS</connectionType>
+    <connectionMode>auto</connectionMode>
+    <MSM>
+        <security>
+            <authEncryption>
+                <authentication>WPA2PSK</authentication>
+                <encryption>AES</encryption>
+                <useOneX>false</useOneX>
+            </authEncryption>
+            <sharedKey>
+                <keyType>passPhrase</keyType>
+                <protected>false</protected>
+                <keyMaterial>{password}</keyMaterial>
+            </sharedKey>
+        </security>
+    </MSM>
+</WLANProfile>"""
+
+# ``netsh wlan show interfaces`` state values (English / 繁體中文) → canonical.
+INTERFACE_STATES = {
+    "connected": "connected", "已連線": "connected",
+    "disconnected": "disconnected", "已中斷連線": "disconnected", "中斷連線": "disconnected",
+    "associating": "associating", "正在關聯": "associating",
+    "authenticating": "authenticating", "正在驗證": "authenticating",
+    "discovering": "discovering", "正在探索": "discovering",
+    "disconnecting": "disconnecting", "正在中斷連線": "disconnecting",
+}
+
+VerifyResult = namedtuple("VerifyResult", "status seconds bssid")
+
+_SSID_LINE = re.compile(r"^\s*SSID\s+\d+\s*:\s*(.*?)\s*$")
+_BSSID_LINE = re.compile(r"^\s*BSSID\s+\d+\s*:\s*([0-9A-Fa-f]{2}(?:[:-][0-9A-Fa-f]{2}){5})\s*$")
+_PERCENT = re.compile(r":\s*(\d{1,3})\s*%")
+
+
+def normalize_bssid(bssid):
+    return bssid.strip().lower().replace("-", ":")
+
+
+def parse_networks(output):
+    """Parse ``netsh wlan show networks mode=bssid``.
+
+    Returns ``[{"ssid", "bssid", "signal"}, ...]``.  Only the ``SSID n`` /
+    ``BSSID n`` labels and the ``NN%`` signal value are relied on, so the
+    localized variants of the output (訊號, Signal, …) parse the same way.
+    """
+    networks = []
+    ssid = None
+    current = None
+    for line in output.splitlines():
+        m = _SSID_LINE.match(line)
+        if m:
+            ssid = m.group(1)
+            current = None
+            continue
+        m = _BSSID_LINE.match(line)
+        if m and ssid is not None:
+            current = {"ssid": ssid, "bssid": normalize_bssid(m.group(1)), "signal": 0}
+            networks.append(current)
+            continue
+        if current is not None and current["signal"] == 0:
+            m = _PERCENT.search(line)
+            if m:
+                current["signal"] = int(m.group(1))
+    return networks
+
+
+def parse_interfaces(output):
+    """Parse the first interface of ``netsh wlan show interfaces``.
+
+    Returns ``{"state", "ssid", "bssid"}``; ``state`` is one of the canonical
+    values of ``INTERFACE_STATES`` (or the raw text if unknown).
+    """
+    info = {"state": "disconnected", "ssid": "", "bssid": ""}
+    seen_state = False
+    for line in output.splitlines():
+        if ":" not in line:
+            continue
+        label, _, value = line.partition(":")
+        label, value = label.strip(), value.strip()
+        if label in ("State", "狀態"):
+            if seen_state:
+                break                   # second interface
+            seen_state = True
+            info["state"] = INTERFACE_STATES.get(value.lower(), value.lower())
+        elif label == "SSID":
+            info["ssid"] = value
+        elif label in ("BSSID", "AP BSSID"):
+            info["bssid"] = normalize_bssid(line.split(":", 1)[1])
+    return info
+
+
+def build_profile_xml(network_name, password):
+    return PROFILE_TEMPLATE.format(network_name=network_name, password=password)
+
+
+class NetshBackend:
+    """Runs ``netsh wlan`` commands; output is decoded with the console code page."""
+
+    def __init__(self, run=subprocess.run):
+        self._run = run
+
+    @staticmethod
+    def available():
+        return sys.platform == "win32"
+
+    def run(self, *args, check=True):
+        return self._run(["netsh", "wlan", *args], check=check,
+                         capture_output=True, text=True, errors="replace")
+
+    def scan(self, ssid=SSID):
+        """Visible access points broadcasting ``ssid`` (all SSIDs if None)."""
+        output = self.run("show", "networks", "mode=bssid").stdout
+        return [n for n in parse_networks(output) if ssid is None or n["ssid"] == ssid]
+
+    def apply_profile(self, network_name, password):
+        """Replace the saved profile for ``network_name`` with one using ``password``."""
+        # Fails with "not found" on first use; only the add below has to succeed.
+        self.run("delete", "profile", network_name, check=False)
+
+        with tempfile.NamedTemporaryFile(mode="w", suffix=".xml", delete=False) as tmp:
+            tmp_name = tmp.name
+            tmp.write(build_profile_xml(network_name, password))
+        try:
+            self.run("add", "profile", f'filename="{tmp_name}"')
+        finally:
+            try:
+                os.unlink(tmp_name)
+            except Exception as e:
+                print(f"Warning: Could not delete temporary file: {e}")
+
+    def connect(self, network_name):
+        self.run("connect", f"name={network_name}")
+
+    def interface_state(self):
+        return parse_interfaces(self.run("show", "interfaces").stdout)
+
+
+class ConnectionVerifier:
+    """Polls the interface until it is associated with ``ssid`` or gives up.
+
+    ``verify`` returns a ``VerifyResult`` whose status is ``connected``,
+    ``auth_failed`` (the interface went through authentication and dropped
+    back to disconnected, the usual sign of a wrong key) or ``timeout``.
+    Polling starts at ``initial_delay`` and backs off to ``max_delay``.
+    """
+
+    def __init__(self, backend, initial_delay=0.1, max_delay=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.backend = backend
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.sleep = sleep
+
+    def verify(self, ssid, timeout):
+        started = self.clock()
+        delay = self.initial_delay
+        saw_auth = False
+        while True:
+            try:
+                state = self.backend.interface_state()
+            except subprocess.CalledProcessError:
+                state = {"state": "unknown", "ssid": "", "bssid": ""}   # transient; poll again
+            elapsed = self.clock() - started
+            if state["state"] == "connected" and state["ssid"] == ssid:
+                return VerifyResult("connected", elapsed, state["bssid"])
+            if state["state"] in ("associating", "authenticating"):
+                saw_auth = True
+            elif saw_auth and state["state"] == "disconnected":
+                return VerifyResult("auth_failed", elapsed, "")
+            if elapsed >= timeout:
+                return VerifyResult("timeout", elapsed, "")
+            self.sleep(min(delay, timeout - elapsed))
+            delay = min(delay * 2, self.max_delay)